@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append('.')
+
+from benchmarks import synthetic_video
+from core import youtube2frames, frames2matrix, matrix2csv, matrix2midi, telemetry
+
+
+def measure(stage, num_frames, function, *args, **kwargs):
+    """
+    runs one stage of the conversion. Memory is measured from the resident set size rather than by tracing allocations,
+    which would slow down the stages that run a lot of Python and misses the memory OpenCV allocates
+    :param stage: the name of the stage
+    :param num_frames: the number of frames the stage goes through
+    :param function: the function that runs the stage
+    :return: what the function returns, and a dictionary of how long the stage took and how much memory it used. The
+             peak memory is that of the whole process, including what it used before the stage, and on platforms other
+             than Linux it is the peak since the process started, or None where it is not available. The peak memory of
+             the children is that of the largest worker process that finished during the stage, or None if none was
+             larger than the ones before it
+    """
+    children_peak_memory = telemetry.get_peak_rss_bytes(children=True)
+    telemetry.reset_rss_high_water_mark()
+    start_time = time.perf_counter()
+
+    result = function(*args, **kwargs)
+
+    seconds = time.perf_counter() - start_time
+    peak_memory = telemetry.get_rss_high_water_mark() or telemetry.get_peak_rss_bytes()
+    end_children_peak_memory = telemetry.get_peak_rss_bytes(children=True)
+
+    return result, {
+        'stage': stage,
+        'seconds': seconds,
+        'frames_per_second': num_frames / seconds if seconds > 0 else None,
+        'peak_memory_bytes': peak_memory,
+        'peak_children_memory_bytes': (
+            end_children_peak_memory
+            if end_children_peak_memory is not None and end_children_peak_memory > children_peak_memory else None
+        ),
+    }
+
+
+def get_notes_from_hands(left_hand, right_hand):
+    """
+    :param left_hand: the left hand matrix
+    :param right_hand: the right hand matrix
+    :return: a list of the notes in the matrices as (note number, first frame, frame after the last frame, hand) with the
+             hand being 0 for the left hand and 1 for the right hand
+    """
+    notes = []
+
+    for hand, matrix in enumerate([left_hand, right_hand]):
+        padded = np.pad(np.asarray(matrix, dtype=bool), ((1, 1), (0, 0)))
+        changes = padded[1:] != padded[:-1]
+
+        for note in range(matrix.shape[1]):
+            edges = np.flatnonzero(changes[:, note])
+            notes.extend((note, int(start), int(end), hand) for start, end in zip(edges[::2], edges[1::2]))
+
+    return notes
+
+
+def score_notes(expected_notes, detected_notes, tolerance=1):
+    """
+    matches every detected note to an expected note of the same key and hand that starts at most tolerance frames away
+    :param expected_notes: a list of the notes in the video as (note number, first frame, frame after the last frame,
+                           hand)
+    :param detected_notes: a list of the notes that were found, in the same form
+    :param tolerance: the number of frames a detected note may start before or after the expected note
+    :return: a dictionary of the precision and recall of the detected notes
+    """
+    unmatched = {}
+    for note, start, end, hand in sorted(expected_notes, key=lambda expected_note: expected_note[1]):
+        unmatched.setdefault((note, hand), []).append((start, end))
+
+    matches = 0
+    end_errors = []
+
+    for note, start, end, hand in sorted(detected_notes, key=lambda detected_note: detected_note[1]):
+        candidates = unmatched.get((note, hand), [])
+
+        for i, (expected_start, expected_end) in enumerate(candidates):
+            if abs(expected_start - start) <= tolerance:
+                matches += 1
+                end_errors.append(abs(expected_end - end))
+                del candidates[i]
+                break
+
+    return {
+        'expected_notes': len(expected_notes),
+        'detected_notes': len(detected_notes),
+        'matched_notes': matches,
+        'precision': matches / len(detected_notes) if detected_notes else 1.0,
+        'recall': matches / len(expected_notes) if expected_notes else 1.0,
+        'mean_end_error_frames': float(np.mean(end_errors)) if end_errors else None,
+    }
+
+
+def run_benchmark(
+        output_dir,
+        num_frames=900,
+        width=1280,
+        height=720,
+        fps=30,
+        num_keys=88,
+        first_note='A',
+        density=0.05,
+        left_hand_color=(85, 123, 222),
+        right_hand_color=(255, 218, 225),
+        background_color=(0, 0, 0),
+        frame_mode='strip',
+        workers=1,
+        color_table_bits=None,
+        tolerance=1,
+        seed=0
+):
+    """
+    renders a synthetic video, converts it one stage at a time and compares the notes found to the notes rendered
+    :param output_dir: the directory to save the video and everything made from it in
+    :param num_frames: the number of frames in the video
+    :param width: the width of the frames
+    :param height: the height of the frames
+    :param fps: frames per second of the video
+    :param num_keys: the number of keys on the keyboard
+    :param first_note: the letter value of the first note (must be capital)
+    :param density: the chance of a key that is not being played starting a note in any frame
+    :param left_hand_color: the RGB values of the left hand notes
+    :param right_hand_color: the RGB values of the right hand notes
+    :param background_color: the RGB values of the background
+    :param frame_mode: 'images', 'stream' or 'strip'. In the 'stream' frame mode, the video is decoded by the convert
+                       stage.
+    :param workers: the number of processes to find the notes with
+    :param color_table_bits: the number of bits per channel of the color lookup table, or None to not use one
+    :param tolerance: the number of frames a detected note may start before or after the rendered note
+    :param seed: the seed of the random notes
+    :return: a dictionary of the parameters, the measurements of each stage and the accuracy of the notes found
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    print(f'Created the following directory: {output_dir}')
+
+    video_path = f'{output_dir}/video.avi'
+    notes = synthetic_video.get_random_notes(num_keys, num_frames, density, seed)
+    synthetic_video.save_notes(f'{output_dir}/notes.json', notes)
+    converter_args = synthetic_video.render_video(
+        video_path, notes, num_frames, width, height, fps, num_keys, first_note,
+        left_hand_color=left_hand_color,
+        right_hand_color=right_hand_color,
+        background_color=background_color,
+        fourcc='MJPG'
+    )
+
+    stages = []
+    frame_dir = f'{output_dir}/frames'
+    strip_path = f'{output_dir}/strip.npy'
+    read_height = converter_args['read_height']
+
+    if frame_mode == 'images':
+        _, stage = measure('get_frames', num_frames, youtube2frames.save_frames, video_path, frame_dir)
+        stages.append(stage)
+    elif frame_mode == 'strip':
+        _, stage = measure(
+            'get_frames', num_frames, youtube2frames.save_strip, video_path, strip_path, read_height - 1,
+            read_height + 2
+        )
+        stages.append(stage)
+
+    converter = frames2matrix.Frames2MatrixConverter(
+        name='benchmark',
+        frame_dir=frame_dir if frame_mode == 'images' else None,
+        num_frames=num_frames,
+        strip_path=strip_path if frame_mode == 'strip' else None,
+        color_table_bits=color_table_bits,
+        color_table_dir=f'{output_dir}/color_tables',
+        **converter_args
+    )
+
+    if frame_mode == 'stream':
+        (right_hand, left_hand), stage = measure(
+            'convert', num_frames, converter.convert_stream, youtube2frames.stream_frames(video_path)
+        )
+    else:
+        (right_hand, left_hand), stage = measure('convert', num_frames, converter.convert, workers=workers)
+    stages.append(stage)
+
+    _, stage = measure('matrix_to_csv', num_frames, matrix2csv.matrix_to_csv, left_hand, right_hand, fps)
+    stages.append(stage)
+
+    _, stage = measure('matrix_to_midi', num_frames, matrix2midi.matrix_to_midi, left_hand, right_hand, fps)
+    stages.append(stage)
+
+    return {
+        'parameters': {
+            'num_frames': num_frames,
+            'width': width,
+            'height': height,
+            'fps': fps,
+            'num_keys': num_keys,
+            'first_note': first_note,
+            'density': density,
+            'frame_mode': frame_mode,
+            'workers': workers,
+            'color_table_bits': color_table_bits,
+        },
+        'stages': stages,
+        'total_seconds': sum(stage['seconds'] for stage in stages),
+        'max_resident_memory_bytes': max(
+            (stage['peak_memory_bytes'] for stage in stages if stage['peak_memory_bytes'] is not None), default=None
+        ),
+        'accuracy': score_notes(notes, get_notes_from_hands(left_hand, right_hand), tolerance),
+    }
+
+
+def print_report(report):
+    print('*' * 60)
+    for stage in report['stages']:
+        memory = (f"{stage['peak_memory_bytes'] / 2 ** 20:>10.1f} MiB"
+                  if stage['peak_memory_bytes'] is not None else '')
+        children = (f"{stage['peak_children_memory_bytes'] / 2 ** 20:>10.1f} MiB in a worker"
+                    if stage['peak_children_memory_bytes'] is not None else '')
+        print(f"{stage['stage']:<16}{stage['seconds']:>10.3f} s{stage['frames_per_second']:>12.1f} frames/s"
+              f"{memory}{children}")
+    print(f"{'total':<16}{report['total_seconds']:>10.3f} s")
+
+    accuracy = report['accuracy']
+    print(f"precision: {accuracy['precision']:.4f}, recall: {accuracy['recall']:.4f} "
+          f"({accuracy['matched_notes']}/{accuracy['expected_notes']} notes found)")
+    print('*' * 60)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the converter on a synthetic video.")
+    parser.add_argument('--output-dir', default='./benchmark', help="where to save the video and everything made from it")
+    parser.add_argument('--report', default=None, help="the path of a json file to save the report in")
+    parser.add_argument('--frames', dest='num_frames', type=int, default=900)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--keys', dest='num_keys', type=int, default=88)
+    parser.add_argument('--first-note', default='A')
+    parser.add_argument('--density', type=float, default=0.05)
+    parser.add_argument('--left-hand-color', type=int, nargs=3, default=[85, 123, 222])
+    parser.add_argument('--right-hand-color', type=int, nargs=3, default=[255, 218, 225])
+    parser.add_argument('--background-color', type=int, nargs=3, default=[0, 0, 0])
+    parser.add_argument('--frame-mode', choices=['images', 'stream', 'strip'], default='strip')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--color-table-bits', type=int, default=None)
+    parser.add_argument('--tolerance', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = vars(parser.parse_args())
+
+    report_path = args.pop('report')
+    benchmark_report = run_benchmark(**args)
+    print_report(benchmark_report)
+
+    if report_path is not None:
+        with open(report_path, 'w') as report_file:
+            json.dump(benchmark_report, report_file, indent=4)
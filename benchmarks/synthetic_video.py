@@ -0,0 +1,191 @@
+import json
+import sys
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+
+def get_key_layout(first_note, first_white_note_col, distance_between_white_notes, num_keys=88):
+    """
+    lays out the keys of a keyboard, with every black key halfway between its white keys
+    :param first_note: the letter value of the first note (must be capital)
+    :param first_white_note_col: the column of the middle of the first white note
+    :param distance_between_white_notes: the number of pixels between the middles of two white notes
+    :param num_keys: the number of keys on the keyboard, starting from the first white note
+    :return: a list with the column of the middle of every key and whether it is black, with the index being the note
+             number
+    """
+    keys = []
+    white_note = ord(first_note) - 65  # A->0, B->1, etc...
+    counter = 0
+
+    while len(keys) < num_keys:
+        white_note_col = first_white_note_col + distance_between_white_notes * counter
+        keys.append((white_note_col, False))
+
+        # there is no black note before C or F
+        if (white_note + 1) % 7 not in [2, 5]:
+            keys.append((white_note_col + distance_between_white_notes / 2, True))
+
+        white_note = (white_note + 1) % 7
+        counter += 1
+
+    return keys[:num_keys]
+
+
+def get_random_notes(num_keys, num_frames, density=0.05, seed=0):
+    """
+    :param num_keys: the number of keys on the keyboard
+    :param num_frames: the number of frames in the video
+    :param density: the chance of a key that is not being played starting a note in any frame
+    :param seed: the seed of the random number generator
+    :return: a list of notes as (note number, first frame, frame after the last frame, hand) with the hand being 0 for the
+             left hand and 1 for the right hand. Notes of the same key are always at least 2 frames apart.
+    """
+    rng = np.random.default_rng(seed)
+    notes = []
+
+    for note in range(num_keys):
+        frame_num = 0
+
+        while True:
+            start = frame_num + int(rng.exponential(1 / density))
+            end = start + int(rng.integers(3, 30))
+
+            if start >= num_frames:
+                break
+
+            notes.append((note, start, min(end, num_frames), int(rng.integers(0, 2))))
+            frame_num = end + 2
+
+    return notes
+
+
+def render_video(
+        video_path,
+        notes,
+        num_frames,
+        width=1280,
+        height=720,
+        fps=30,
+        num_keys=88,
+        first_note='A',
+        read_height=None,
+        left_hand_color=(85, 123, 222),
+        right_hand_color=(255, 218, 225),
+        background_color=(0, 0, 0),
+        scroll_speed=8,
+        fourcc='mp4v'
+):
+    """
+    renders a synthesia style video of notes falling onto a keyboard at the bottom of the frame. A note covers the read
+    height and the rows directly above and below it from its first frame up to (not including) the frame after its
+    last frame.
+    :param video_path: the path to save the video in
+    :param notes: a list of notes as (note number, first frame, frame after the last frame, hand) with the hand being 0
+                  for the left hand and 1 for the right hand
+    :param num_frames: the number of frames in the video
+    :param width: the width of the frames
+    :param height: the height of the frames
+    :param fps: frames per second of the video
+    :param num_keys: the number of keys on the keyboard
+    :param first_note: the letter value of the first note (must be capital)
+    :param read_height: the row the notes are read from. Defaults to just above the keyboard
+    :param left_hand_color: the RGB values of the left hand notes
+    :param right_hand_color: the RGB values of the right hand notes
+    :param background_color: the RGB values of the background
+    :param scroll_speed: the number of rows the notes fall every frame
+    :param fourcc: the codec to encode the video with
+    :return: a dictionary of the parameters the converter needs to read the video
+    """
+    keyboard_top = height - height // 6
+
+    # notes are played when they reach the keyboard
+    if read_height is None:
+        read_height = keyboard_top - 4
+
+    # the keyboard is kept off the edges of the frame, as notes touching the last column can not be read
+    margin = max(width // 100, 2)
+    num_white_keys = sum(not black for _, black in get_key_layout(first_note, 0, 1, num_keys))
+    distance_between_white_notes = (width - 2 * margin) / num_white_keys
+    first_white_note_col = margin + distance_between_white_notes / 2
+    keys = get_key_layout(first_note, first_white_note_col, distance_between_white_notes, num_keys)
+
+    hand_colors = [tuple(reversed(left_hand_color)), tuple(reversed(right_hand_color))]
+
+    background = np.zeros((height, width, 3), dtype=np.uint8)
+    background[:] = tuple(reversed(background_color))
+    background[keyboard_top:, margin:width - margin] = 255
+    for white_key in range(num_white_keys + 1):
+        background[keyboard_top:, int(margin + distance_between_white_notes * white_key)] = 60
+    for key_col, black in keys:
+        if black:
+            half_width = int(distance_between_white_notes * 0.3)
+            background[keyboard_top:keyboard_top + (height - keyboard_top) * 3 // 5,
+                       int(key_col) - half_width:int(key_col) + half_width] = 20
+
+    video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+
+    # black notes are drawn over white notes, with a gap on each side so that they never touch a white note
+    note_array = np.array(notes, dtype=np.int64).reshape((-1, 4))
+    note_array = note_array[np.argsort([keys[note][1] for note in note_array[:, 0]], kind='stable')]
+    background_bgr = tuple(reversed(background_color))
+
+    for frame_num in tqdm(range(num_frames), file=sys.stdout, desc="Frames rendered"):
+        image = background.copy()
+
+        # a note covers the rows directly above and below the read height from its first frame to its last frame
+        tops = np.maximum(read_height - (note_array[:, 2] - frame_num) * scroll_speed, 0)
+        bottoms = np.minimum(read_height + 1 - (note_array[:, 1] - frame_num) * scroll_speed, keyboard_top - 1)
+        visible = bottoms >= tops
+
+        for (note, _, _, hand), top, bottom in zip(note_array[visible], tops[visible], bottoms[visible]):
+            key_col, black = keys[note]
+            half_width = distance_between_white_notes * (0.3 if black else 0.42)
+            left, right = int(key_col - half_width), int(key_col + half_width)
+
+            if black:
+                cv2.rectangle(image, (left - 1, int(top)), (right + 1, int(bottom)), background_bgr, -1)
+            cv2.rectangle(image, (left, int(top)), (right, int(bottom)), hand_colors[hand], -1)
+
+        video_writer.write(image)
+
+    video_writer.release()
+
+    return {
+        'first_note': first_note,
+        'first_white_note_col': first_white_note_col,
+        'tenth_white_note_col': first_white_note_col + distance_between_white_notes * 9,
+        'read_height': read_height,
+        'left_hand_color': list(left_hand_color),
+        'right_hand_color': list(right_hand_color),
+        'background_color': list(background_color),
+        'minimum_note_width': max(int(distance_between_white_notes * 0.2), 1),
+        'num_keys': num_keys,
+    }
+
+
+def get_hand_matrices(notes, num_frames, num_keys=88):
+    """
+    :param notes: a list of notes as (note number, first frame, frame after the last frame, hand)
+    :param num_frames: the number of frames in the video
+    :param num_keys: the number of keys on the keyboard
+    :return: the left hand and right hand matrices the notes should be converted into
+    """
+    hands = np.zeros((2, num_frames, num_keys), dtype=bool)
+
+    for note, start, end, hand in notes:
+        hands[hand, start:end, note] = True
+
+    return hands[0], hands[1]
+
+
+def save_notes(notes_path, notes):
+    with open(notes_path, 'w') as file:
+        json.dump([list(note) for note in notes], file)
+
+
+def load_notes(notes_path):
+    with open(notes_path) as file:
+        return [tuple(note) for note in json.load(file)]
@@ -0,0 +1,159 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+
+sys.path.append('.')
+
+from converters import stages
+from converters.full_converter import full_convert
+from core import calibrate, stagecache, telemetry
+
+
+def parse_value(value):
+    """
+    :param value: a value from a csv manifest
+    :return: the value decoded as json (so that numbers and lists such as colors work), or the string itself
+    """
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+def read_manifest(manifest_path):
+    """
+    reads the parameters of every video to convert
+    :param manifest_path: a .json file with a list of objects, or a .csv file with a header row, whose keys are the
+                          parameters of full_convert. Empty csv cells are left as full_convert's defaults.
+    :return: a list of dictionaries of keyword arguments for full_convert
+    """
+    with open(manifest_path, newline='') as file:
+        if manifest_path.endswith('.csv'):
+            jobs = [
+                {key: parse_value(value) for key, value in row.items() if value is not None and value.strip() != ''}
+                for row in csv.DictReader(file)
+            ]
+        else:
+            jobs = json.load(file)
+
+    for job in jobs:
+        if not os.path.isfile(job['video_url']) and job.get('tag') is None:
+            raise ValueError(f"{job['video_name']} needs a tag, or 'auto', as there is no one to prompt for it in a "
+                             f"batch")
+
+    return jobs
+
+
+def download(job):
+    """
+    downloads the video of a job, through the job's cache if it uses one
+    :param job: keyword arguments for full_convert
+    :return: the path of the video
+    """
+    video_name = job['video_name']
+    video_dir_path = job.get('video_dir_path') or f'./{video_name}'
+    cache = None
+
+    if job.get('use_cache', False):
+        cache = stagecache.StageCache(job.get('cache_dir_path') or f'./{video_name}/cache')
+
+    os.makedirs(video_dir_path, exist_ok=True)
+    return stages.get_video(job['video_url'], video_dir_path, video_name, job.get('tag'), cache=cache,
+                            stream_constraints=job.get('stream_constraints'))
+
+
+def convert(job, video_path):
+    """
+    runs the rest of full_convert on an already downloaded video, in a worker process. The worker process is one of
+    many converting different videos, so it does not start any processes of its own. The tag is not needed anymore.
+    Any of the parameters found by calibrate that are missing from the job are calibrated from the video.
+    :param job: keyword arguments for full_convert
+    :param video_path: the path of the video
+    :return: the metrics of every stage of the conversion
+    """
+    with telemetry.TelemetryReport() as report:
+        if any(job.get(parameter) is None for parameter in calibrate.CALIBRATED_PARAMETERS):
+            calibrated = calibrate.calibrate(video_path)
+            job = {**job, **{key: value for key, value in calibrated.items() if job.get(key) is None}}
+
+        full_convert(**{'tag': None, **job, 'video_url': video_path, 'workers': 1, 'decode_workers': 1})
+
+    return report.stages
+
+
+def batch_convert(manifest_path, summary_path=None, workers=None, max_downloads=2):
+    """
+    converts every video in a manifest. Videos are downloaded a few at a time while the videos that have already been
+    downloaded are converted by one pool of worker processes.
+    :param manifest_path: the path of the manifest, see read_manifest
+    :param summary_path: the path of a json file to write the result and timings of each video to
+    :param workers: the number of videos to convert at once. Defaults to one for each CPU
+    :param max_downloads: the number of videos to download at once
+    :return: a list with a dictionary of the result and timings of each video, in the order of the manifest. The
+             metrics of every stage of a successful conversion are under 'stages'.
+    """
+    jobs = read_manifest(manifest_path)
+    summary = [{'video_name': job['video_name'], 'success': None} for job in jobs]
+    start_time = time.time()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_downloads) as download_executor, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as convert_executor:
+        # maps each pending future to the job it is for and the stage it is running
+        pending = {}
+        stage_start_times = {}
+
+        for job_num, job in enumerate(jobs):
+            pending[download_executor.submit(download, job)] = (job_num, 'download')
+            stage_start_times[job_num] = time.time()
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                job_num, stage = pending.pop(future)
+                result = summary[job_num]
+                result[f'{stage}_seconds'] = time.time() - stage_start_times[job_num]
+
+                if future.exception() is not None:
+                    result['success'] = False
+                    result['failed_stage'] = stage
+                    result['error'] = ''.join(traceback.format_exception(
+                        type(future.exception()), future.exception(), future.exception().__traceback__
+                    ))
+                    print(f"Failed to {stage} {result['video_name']}: {future.exception()!r}")
+                elif stage == 'download':
+                    pending[convert_executor.submit(convert, jobs[job_num], future.result())] = (job_num, 'convert')
+                    stage_start_times[job_num] = time.time()
+                else:
+                    result['success'] = True
+                    result['stages'] = future.result()
+                    print(f"Converted {result['video_name']}")
+
+    for result in summary:
+        result['total_seconds'] = result.get('download_seconds', 0) + result.get('convert_seconds', 0)
+
+    print(f"Converted {sum(result['success'] for result in summary)}/{len(summary)} videos in "
+          f"{time.time() - start_time:.1f} seconds")
+
+    if summary_path is not None:
+        with open(summary_path, 'w') as file:
+            json.dump(summary, file, indent=4)
+
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts every video in a manifest of full_convert parameters.")
+    parser.add_argument('manifest_path', help="a .json list or a .csv table of full_convert parameters")
+    parser.add_argument('--summary', dest='summary_path', default='summary.json',
+                        help="where to write the result and timings of each video")
+    parser.add_argument('--workers', type=int, default=None, help="the number of videos to convert at once")
+    parser.add_argument('--max-downloads', type=int, default=2, help="the number of videos to download at once")
+    args = parser.parse_args()
+
+    batch_convert(args.manifest_path, args.summary_path, args.workers, args.max_downloads)
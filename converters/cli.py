@@ -0,0 +1,333 @@
+import argparse
+import os
+import sys
+
+sys.path.append('.')
+
+# the modules of each stage are imported inside the command that runs it, so that a command only loads the libraries it
+# needs. OpenCV, pytube and matplotlib take most of a second to import between them, while exporting midi files from
+# saved arrays only needs numpy.
+
+
+def get_cache(args):
+    """
+    :param args: the parsed arguments of a command
+    :return: the StageCache of the command, or None if caching is turned off
+    """
+    if args.no_cache:
+        return None
+
+    from core import stagecache
+
+    return stagecache.StageCache(args.cache_dir or f'./{args.name}/cache')
+
+
+def get_detection_parameters(args, video_path):
+    """
+    :param args: the parsed arguments of a command that finds notes
+    :param video_path: the path of the video
+    :return: a dictionary of the parameters of calibrate.CALIBRATED_PARAMETERS, where the ones that were not given are
+             calibrated from a few frames of the video
+    """
+    from core import calibrate
+
+    parameters = {name: getattr(args, name) for name in calibrate.CALIBRATED_PARAMETERS}
+    missing = [name for name, value in parameters.items() if value is None]
+
+    if missing:
+        print(f"Calibrating {', '.join(missing)} from the video")
+        calibrated = calibrate.calibrate(video_path)
+        parameters.update({name: calibrated[name] for name in missing})
+
+    return parameters
+
+
+def get_tag(value):
+    """
+    :param value: the tag given on the command line
+    :return: 'auto', or the itag as an int
+    """
+    return value if value == 'auto' else int(value)
+
+
+def get_stream_constraints(args):
+    """
+    :param args: the parsed arguments of a command that downloads a video
+    :return: the keyword arguments of youtube2frames.get_auto_tag that were given
+    """
+    constraints = {
+        'key_spacing_fraction': args.key_spacing_fraction,
+        'min_pixels_per_key': args.min_pixels_per_key,
+        'min_fps': args.min_fps,
+    }
+
+    return {name: value for name, value in constraints.items() if value is not None}
+
+
+def get_hand_paths(array_dir_path):
+    """
+    :param array_dir_path: the directory the arrays of the hands are saved in
+    :return: the paths of the left hand and right hand arrays, preferring compact .npz files to dense .npy files
+    """
+    paths = []
+
+    for hand in ['left_hand', 'right_hand']:
+        path = f'{array_dir_path}/{hand}.npz'
+        paths.append(path if os.path.exists(path) else f'{array_dir_path}/{hand}.npy')
+
+    return paths
+
+
+def download(args):
+    from converters import stages
+
+    video_dir_path = args.video_dir or f'./{args.name}'
+    os.makedirs(video_dir_path, exist_ok=True)
+
+    print(stages.get_video(args.url, video_dir_path, args.name, args.tag, cache=get_cache(args),
+                           stream_constraints=get_stream_constraints(args)))
+
+
+def extract(args):
+    from core import youtube2frames
+
+    if args.frame_mode == 'images':
+        frame_dir_path = args.frame_dir or f'./{args.name}/frames'
+        os.makedirs(frame_dir_path, exist_ok=True)
+        youtube2frames.save_frames(args.video, frame_dir_path)
+        print(frame_dir_path)
+        return
+
+    if args.strip_rows is None and args.read_height is None:
+        raise ValueError("either the read height or the strip rows are needed to extract a strip")
+
+    strip_rows = args.strip_rows or [args.read_height - 1, args.read_height + 2]
+    strip_path = args.strip_path or f'./{args.name}/strip.npy'
+
+    print(youtube2frames.get_strip(args.video, strip_path, strip_rows, args.decode_workers, cache=get_cache(args)))
+
+
+def detect(args):
+    import numpy as np
+
+    from converters import stages
+    from core import youtube2frames
+
+    cache = get_cache(args)
+    parameters = get_detection_parameters(args, args.video)
+
+    frame_dir_path = args.frame_dir or f'./{args.name}/frames'
+    strip_path = args.strip_path or f'./{args.name}/strip.npy'
+
+    if args.frame_mode == 'images':
+        os.makedirs(frame_dir_path, exist_ok=True)
+    elif args.frame_mode == 'strip':
+        read_height = parameters['read_height']
+        strip_path = youtube2frames.get_strip(
+            args.video, strip_path, [read_height - 1, read_height + 2], args.decode_workers, cache=cache
+        )
+
+    left_hand, right_hand = stages.get_hands(
+        converter_args=dict(
+            name=args.name,
+            color_table_bits=args.color_table_bits,
+            color_table_dir=args.color_table_dir,
+            **parameters
+        ),
+        frame_mode=args.frame_mode,
+        video_path=args.video,
+        frame_dir_path=frame_dir_path,
+        strip_path=strip_path,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        cache=cache
+    )
+
+    array_dir_path = args.array_dir or f'./{args.name}/arrays'
+    os.makedirs(array_dir_path, exist_ok=True)
+
+    if args.compact_arrays:
+        left_hand.save(f'{array_dir_path}/left_hand.npz')
+        right_hand.save(f'{array_dir_path}/right_hand.npz')
+    else:
+        np.save(f'{array_dir_path}/left_hand.npy', left_hand)
+        np.save(f'{array_dir_path}/right_hand.npy', right_hand)
+
+    print(array_dir_path)
+
+
+def export(args):
+    from core import handmatrix, matrix2csv, matrix2midi
+
+    left_hand_path, right_hand_path = get_hand_paths(args.array_dir or f'./{args.name}/arrays')
+    left_hand = handmatrix.HandMatrix.load(left_hand_path)
+    right_hand = handmatrix.HandMatrix.load(right_hand_path)
+
+    midi_dir_path = args.midi_dir or f'./{args.name}'
+    os.makedirs(midi_dir_path, exist_ok=True)
+
+    full_midi, right_midi, left_midi = matrix2midi.matrix_to_midi(left_hand, right_hand, args.fps)
+
+    for file_name, midi in [(f'{args.name}.mid', full_midi), (f'{args.name}_rh.mid', right_midi),
+                            (f'{args.name}_lh.mid', left_midi)]:
+        with open(f'{midi_dir_path}/{file_name}', 'wb') as output_file:
+            output_file.write(midi)
+
+    if args.save_csvs:
+        csv_dir_path = args.csv_dir or f'./{args.name}/csvs'
+        os.makedirs(csv_dir_path, exist_ok=True)
+
+        csv_lines = matrix2csv.matrix_to_csv(left_hand, right_hand, args.fps)
+
+        for file_name, lines in zip([f'{args.name}.csv', f'{args.name}_rh.csv', f'{args.name}_lh.csv'], csv_lines):
+            with open(f'{csv_dir_path}/{file_name}', 'w') as output_file:
+                output_file.writelines(lines)
+
+    print(midi_dir_path)
+
+
+def convert(args):
+    from converters import stages
+    from converters.full_converter import full_convert
+
+    video_dir_path = args.video_dir or f'./{args.name}'
+    os.makedirs(video_dir_path, exist_ok=True)
+
+    # downloaded first so that any parameters that were not given can be calibrated from the video
+    video_path = stages.get_video(args.url, video_dir_path, args.name, args.tag, cache=get_cache(args),
+                                  stream_constraints=get_stream_constraints(args))
+
+    full_convert(
+        video_name=args.name,
+        video_url=video_path,
+        tag=args.tag,
+        **get_detection_parameters(args, video_path),
+        video_dir_path=video_dir_path,
+        frame_dir_path=args.frame_dir,
+        array_dir_path=args.array_dir,
+        csv_dir_path=args.csv_dir,
+        midi_dir_path=args.midi_dir,
+        frame_mode=args.frame_mode,
+        strip_path=args.strip_path,
+        color_table_bits=args.color_table_bits,
+        color_table_dir=args.color_table_dir,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        decode_workers=args.decode_workers,
+        save_csvs=args.save_csvs,
+        use_cache=not args.no_cache,
+        cache_dir_path=args.cache_dir,
+        report_path=args.report,
+        profile_interval=args.profile_interval,
+        rows_per_frame=args.rows_per_frame,
+        scroll_speed=args.scroll_speed,
+        compact_arrays=args.compact_arrays,
+        stream_midi=args.stream_midi,
+    )
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-dir', default=None, help="where to cache the outputs of each stage")
+    parser.add_argument('--no-cache', action='store_true', help="run every stage even if its outputs are cached")
+
+
+def add_download_arguments(parser):
+    parser.add_argument('--tag', type=get_tag, default=None, help="the itag of the stream to download, or 'auto' for "
+                                                                   "the cheapest stream that meets the constraints")
+    parser.add_argument('--key-spacing-fraction', type=float, default=None, help="the distance between white keys "
+                                                                                 "divided by the frame height")
+    parser.add_argument('--min-pixels-per-key', type=float, default=None)
+    parser.add_argument('--min-fps', type=float, default=None)
+    parser.add_argument('--video-dir', default=None)
+
+
+def add_detection_arguments(parser):
+    parser.add_argument('--first-note', default=None, help="the letter name of the first white note (capital)")
+    parser.add_argument('--first-white-note-col', type=float, default=None)
+    parser.add_argument('--tenth-white-note-col', type=float, default=None)
+    parser.add_argument('--read-height', type=int, default=None)
+    parser.add_argument('--left-hand-color', type=int, nargs=3, default=None, help="in R G B")
+    parser.add_argument('--right-hand-color', type=int, nargs=3, default=None, help="in R G B")
+    parser.add_argument('--background-color', type=int, nargs=3, default=None, help="in R G B")
+    parser.add_argument('--minimum-note-width', type=int, default=None)
+    parser.add_argument('--color-table-bits', type=int, default=None)
+    parser.add_argument('--color-table-dir', default='./color_tables')
+    parser.add_argument('--frame-mode', choices=['images', 'stream', 'strip'], default='images')
+    parser.add_argument('--frame-dir', default=None)
+    parser.add_argument('--strip-path', default=None)
+    parser.add_argument('--array-dir', default=None)
+    parser.add_argument('--compact-arrays', action='store_true', help="save the arrays as .npz files of intervals")
+    parser.add_argument('--workers', type=int, default=None, help="the number of processes to find the notes with")
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--decode-workers', type=int, default=1)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Converts a synthesia video into midi files, all at once with convert or one stage at a time. "
+                    "Detection parameters that are not given are calibrated from the video."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    download_parser = subparsers.add_parser('download', help="download a youtube video")
+    download_parser.add_argument('url')
+    download_parser.add_argument('--name', required=True, help="the name of the song")
+    add_download_arguments(download_parser)
+    add_cache_arguments(download_parser)
+    download_parser.set_defaults(function=download)
+
+    extract_parser = subparsers.add_parser('extract', help="save the frames of a video, or a strip of rows of them")
+    extract_parser.add_argument('video', help="the path of the video")
+    extract_parser.add_argument('--name', required=True, help="the name of the song")
+    extract_parser.add_argument('--frame-mode', choices=['images', 'strip'], default='images')
+    extract_parser.add_argument('--frame-dir', default=None)
+    extract_parser.add_argument('--strip-path', default=None)
+    extract_parser.add_argument('--read-height', type=int, default=None, help="the strip is saved around this row")
+    extract_parser.add_argument('--strip-rows', type=int, nargs=2, default=None, help="the first row and the row "
+                                                                                      "after the last row to save")
+    extract_parser.add_argument('--decode-workers', type=int, default=1)
+    add_cache_arguments(extract_parser)
+    extract_parser.set_defaults(function=extract)
+
+    detect_parser = subparsers.add_parser('detect', help="find the notes of a video and save them as arrays")
+    detect_parser.add_argument('video', help="the path of the video")
+    detect_parser.add_argument('--name', required=True, help="the name of the song")
+    add_detection_arguments(detect_parser)
+    add_cache_arguments(detect_parser)
+    detect_parser.set_defaults(function=detect)
+
+    export_parser = subparsers.add_parser('export', help="write the midi files of saved arrays")
+    export_parser.add_argument('--name', required=True, help="the name of the song")
+    export_parser.add_argument('--fps', type=float, required=True, help="frames per second of the video")
+    export_parser.add_argument('--array-dir', default=None)
+    export_parser.add_argument('--midi-dir', default=None)
+    export_parser.add_argument('--save-csvs', action='store_true')
+    export_parser.add_argument('--csv-dir', default=None)
+    export_parser.set_defaults(function=export)
+
+    convert_parser = subparsers.add_parser('convert', help="download and convert a video in one go")
+    convert_parser.add_argument('url', help="the url of the youtube video, or the path of a video file")
+    convert_parser.add_argument('--name', required=True, help="the name of the song")
+    add_download_arguments(convert_parser)
+    add_detection_arguments(convert_parser)
+    convert_parser.add_argument('--midi-dir', default=None)
+    convert_parser.add_argument('--save-csvs', action='store_true')
+    convert_parser.add_argument('--csv-dir', default=None)
+    convert_parser.add_argument('--rows-per-frame', type=int, default=1)
+    convert_parser.add_argument('--scroll-speed', type=float, default=None)
+    convert_parser.add_argument('--stream-midi', action='store_true')
+    convert_parser.add_argument('--report', default=None, help="the path of a json file to save the telemetry in")
+    convert_parser.add_argument('--profile-interval', type=float, default=None)
+    add_cache_arguments(convert_parser)
+    convert_parser.set_defaults(function=convert)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,11 @@ import os
 import sys
 
 import numpy as np
-import py_midicsv as pm
 
 sys.path.append('.')
 
-from core import youtube2frames, frames2matrix, matrix2csv
+from converters import stages
+from core import calibrate, youtube2frames, matrix2csv, stagecache, telemetry
 
 
 def write_lines(file_name, lines):
@@ -34,6 +34,24 @@ def full_convert(
         array_dir_path=None,
         csv_dir_path=None,
         midi_dir_path=None,
+        frame_mode='images',
+        strip_path=None,
+        strip_rows=None,
+        color_table_bits=None,
+        color_table_dir='./color_tables',
+        workers=None,
+        chunk_size=256,
+        decode_workers=1,
+        save_csvs=False,
+        use_cache=False,
+        cache_dir_path=None,
+        report_path=None,
+        profile_interval=None,
+        rows_per_frame=1,
+        scroll_speed=None,
+        compact_arrays=False,
+        stream_midi=False,
+        stream_constraints=None,
 ):
     if video_dir_path is None:
         video_dir_path = f'./{video_name}'
@@ -45,58 +63,106 @@ def full_convert(
         csv_dir_path = f'./{video_name}/csvs'
     if midi_dir_path is None:
         midi_dir_path = f'./{video_name}'
-
-    for path in [video_dir_path, frame_dir_path, array_dir_path, csv_dir_path, midi_dir_path]:
-        os.makedirs(path, exist_ok=True)
-        print(f'Created the following directory: {path}')
-
-    num_frames, fps = youtube2frames.get_frames(
-        video_url=video_url,
-        video_name=video_name,
-        video_dir_path=video_dir_path,
-        frame_dir_path=frame_dir_path,
-        tag=tag
-    )
-
-    left_hand, right_hand = frames2matrix.Frames2MatrixConverter(
-        name=video_name,
-        frame_dir=frame_dir_path,
-        num_frames=num_frames,
-        read_height=read_height,
-        first_note=first_note,
-        first_white_note_col=first_white_note_col,
-        tenth_white_note_col=tenth_white_note_col,
-        left_hand_color=left_hand_color,
-        right_hand_color=right_hand_color,
-        background_color=background_color,
-        minimum_note_width=minimum_note_width
-    ).convert()
-
-    os.makedirs(array_dir_path, exist_ok=True)
-    print(f'Created the following directory: {array_dir_path}')
-    np.save(f'{array_dir_path}/left_hand.npy', left_hand)
-    np.save(f'{array_dir_path}/right_hand.npy', right_hand)
-
-    full_csv_lines, right_csv_lines, left_csv_lines = matrix2csv.matrix_to_csv(left_hand, right_hand, fps)
-
-    os.makedirs(csv_dir_path, exist_ok=True)
-    print(f'Created the following directory: {csv_dir_path}')
-    write_lines(f'{csv_dir_path}/{video_name}.csv', full_csv_lines)
-    write_lines(f'{csv_dir_path}/{video_name}_rh.csv', right_csv_lines)
-    write_lines(f'{csv_dir_path}/{video_name}_lh.csv', left_csv_lines)
-
-    os.makedirs(midi_dir_path, exist_ok=True)
-    print(f'Created the following directory: {midi_dir_path}')
-
-    # Parse the CSVs into a MIDI files, then save the parsed MIDI files
-    with open(f"{midi_dir_path}/{video_name}.mid", "wb") as output_file:
-        midi_object = pm.csv_to_midi(f'{csv_dir_path}/{video_name}.csv')
-        pm.FileWriter(output_file).write(midi_object)
-
-    with open(f"{midi_dir_path}/{video_name}_rh.mid", "wb") as output_file:
-        midi_object = pm.csv_to_midi(f'{csv_dir_path}/{video_name}_rh.csv')
-        pm.FileWriter(output_file).write(midi_object)
-
-    with open(f"{midi_dir_path}/{video_name}_lh.mid", "wb") as output_file:
-        midi_object = pm.csv_to_midi(f'{csv_dir_path}/{video_name}_lh.csv')
-        pm.FileWriter(output_file).write(midi_object)
+    if strip_path is None:
+        strip_path = f'./{video_name}/strip.npy'
+    if strip_rows is None:
+        strip_rows = [read_height - 1, read_height + 2]
+    if cache_dir_path is None:
+        cache_dir_path = f'./{video_name}/cache'
+
+    with telemetry.recording(report_path, profile_interval), telemetry.stage('full_convert', video_name=video_name):
+        if frame_mode not in ['images', 'stream', 'strip']:
+            raise ValueError(f"frame_mode must be 'images', 'stream' or 'strip', not {frame_mode!r}")
+
+        if stream_midi and frame_mode != 'stream':
+            raise ValueError("the midi files can only be written as the notes are found in the 'stream' frame mode")
+
+        paths = [video_dir_path, array_dir_path, midi_dir_path]
+        if frame_mode == 'images':
+            paths.append(frame_dir_path)
+        if save_csvs:
+            paths.append(csv_dir_path)
+
+        for path in paths:
+            os.makedirs(path, exist_ok=True)
+            print(f'Created the following directory: {path}')
+
+        cache = stagecache.StageCache(cache_dir_path) if use_cache else None
+
+        video_path = stages.get_video(video_url, video_dir_path, video_name, tag, cache=cache,
+                                      stream_constraints=stream_constraints)
+        _, fps = youtube2frames.get_video_info(video_path)
+
+        if frame_mode == 'strip':
+            strip_path = youtube2frames.get_strip(video_path, strip_path, strip_rows, decode_workers, cache=cache)
+
+        if rows_per_frame > 1:
+            if frame_mode != 'stream':
+                raise ValueError("more than one row per frame can only be read in the 'stream' frame mode")
+
+            if scroll_speed is None:
+                scroll_speed = calibrate.estimate_scroll_speed(video_path, read_height)
+                print(f'Estimated scroll speed: {scroll_speed:.3f} rows per frame')
+
+        converter_args = dict(
+            name=video_name,
+            read_height=read_height,
+            first_note=first_note,
+            first_white_note_col=first_white_note_col,
+            tenth_white_note_col=tenth_white_note_col,
+            left_hand_color=left_hand_color,
+            right_hand_color=right_hand_color,
+            background_color=background_color,
+            minimum_note_width=minimum_note_width,
+            color_table_bits=color_table_bits,
+            color_table_dir=color_table_dir,
+            rows_per_frame=rows_per_frame,
+            scroll_speed=scroll_speed
+        )
+
+        if stream_midi:
+            # the matrices of the whole video are never made, so no arrays or csvs are saved
+            midi_paths = [f'{midi_dir_path}/{video_name}.mid', f'{midi_dir_path}/{video_name}_rh.mid',
+                          f'{midi_dir_path}/{video_name}_lh.mid']
+            stages.stream_midi(converter_args, video_path, midi_paths, fps)
+            return
+
+        left_hand, right_hand = stages.get_hands(
+            converter_args=converter_args,
+            frame_mode=frame_mode,
+            video_path=video_path,
+            frame_dir_path=frame_dir_path,
+            strip_path=strip_path,
+            workers=workers,
+            chunk_size=chunk_size,
+            cache=cache
+        )
+
+        os.makedirs(array_dir_path, exist_ok=True)
+        print(f'Created the following directory: {array_dir_path}')
+        if compact_arrays:
+            left_hand.save(f'{array_dir_path}/left_hand.npz')
+            right_hand.save(f'{array_dir_path}/right_hand.npz')
+        else:
+            np.save(f'{array_dir_path}/left_hand.npy', left_hand)
+            np.save(f'{array_dir_path}/right_hand.npy', right_hand)
+
+        # the csvs are only needed for debugging, the midi files are written straight from the matrices
+        if save_csvs:
+            full_csv_lines, right_csv_lines, left_csv_lines = matrix2csv.matrix_to_csv(left_hand, right_hand, fps)
+
+            os.makedirs(csv_dir_path, exist_ok=True)
+            print(f'Created the following directory: {csv_dir_path}')
+            write_lines(f'{csv_dir_path}/{video_name}.csv', full_csv_lines)
+            write_lines(f'{csv_dir_path}/{video_name}_rh.csv', right_csv_lines)
+            write_lines(f'{csv_dir_path}/{video_name}_lh.csv', left_csv_lines)
+
+        os.makedirs(midi_dir_path, exist_ok=True)
+        print(f'Created the following directory: {midi_dir_path}')
+
+        full_midi, right_midi, left_midi = stages.get_midi(left_hand, right_hand, fps, cache=cache)
+
+        for file_name, midi in [(f'{video_name}.mid', full_midi), (f'{video_name}_rh.mid', right_midi),
+                                (f'{video_name}_lh.mid', left_midi)]:
+            with open(f"{midi_dir_path}/{file_name}", "wb") as output_file:
+                output_file.write(midi)
@@ -4,26 +4,36 @@ import sys
 from multiprocessing import Process
 
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
-import py_midicsv as pm
 
 sys.path.append('.')
 
-from core import youtube2frames, frames2matrix, matrix2csv
+from converters import stages
+from core import calibrate, youtube2frames, matrix2csv, stagecache, telemetry
 
 
-def show_image(path):
-    image = cv2.imread(path)
+def show_image(image):
+    # only imported when a frame is shown, as it takes most of a second to import
+    import matplotlib.pyplot as plt
+
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     plt.imshow(image)
     plt.show()
 
 
-def show_frames(frame_dir, n_f):
+def read_video_frame(video_path, frame_num):
+    vid_cap = youtube2frames.open_video(video_path)
+    vid_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+    image = vid_cap.read()[1]
+    vid_cap.release()
+
+    return image
+
+
+def show_frames(video_path, n_f):
     index = int(n_f / 128)
     while True:
-        p = Process(target=show_image, args=(f"{frame_dir}/frame_{index}.jpg",))
+        p = Process(target=show_image, args=(read_video_frame(video_path, index),))
         p.start()
         ans = str(input(f"Is this frame ({index}) containing enough info? (Y/N): "))
 
@@ -66,109 +76,197 @@ def partial_convert(
         array_dir_path=None,
         csv_dir_path=None,
         midi_dir_path=None,
+        frame_mode=None,
+        strip_path=None,
+        strip_rows=None,
+        color_table_bits=None,
+        color_table_dir='./color_tables',
+        workers=None,
+        chunk_size=256,
+        decode_workers=1,
+        save_csvs=False,
+        use_cache=False,
+        cache_dir_path=None,
+        report_path=None,
+        profile_interval=None,
+        rows_per_frame=1,
+        scroll_speed=None,
+        compact_arrays=False,
+        stream_midi=False,
+        stream_constraints=None,
+        auto_calibrate=False,
 ):
     if None in locals().values():
         print("Click enter to use default values.")
 
-    if video_name is None:
-        video_name = prompt('video_name', 'video name')
+    with telemetry.recording(report_path, profile_interval):
+        if video_name is None:
+            video_name = prompt('video_name', 'video name')
+
+        if video_url is None:
+            video_url = input("[No default] Enter the video url: ")
+
+        if video_dir_path is None:
+            video_dir_path = prompt('video_dir_path', f'./{video_name}')
+
+        if frame_mode is None:
+            frame_mode = prompt('frame_mode (images/stream/strip)', 'images')
+
+        if frame_mode not in ['images', 'stream', 'strip']:
+            raise ValueError(f"frame_mode must be 'images', 'stream' or 'strip', not {frame_mode!r}")
 
-    if video_url is None:
-        video_url = input("[No default] Enter the video url: ")
+        if stream_midi and frame_mode != 'stream':
+            raise ValueError("the midi files can only be written as the notes are found in the 'stream' frame mode")
 
-    if video_dir_path is None:
-        video_dir_path = prompt('video_dir_path', f'./{video_name}')
+        if frame_dir_path is None and frame_mode == 'images':
+            frame_dir_path = prompt('frame_dir_path', f'./{video_name}/frames')
 
-    if frame_dir_path is None:
-        frame_dir_path = prompt('frame_dir_path', f'./{video_name}/frames')
+        os.makedirs(video_dir_path, exist_ok=True)
+        print(f'Created the following directory: {video_dir_path}')
 
-    os.makedirs(video_dir_path, exist_ok=True)
-    print(f'Created the following directory: {video_dir_path}')
+        if cache_dir_path is None:
+            cache_dir_path = f'./{video_name}/cache'
 
-    num_frames, fps = youtube2frames.get_frames(
-        video_url=video_url,
-        video_name=video_name,
-        video_dir_path=video_dir_path,
-        frame_dir_path=frame_dir_path,
-        tag=tag
-    )
+        cache = stagecache.StageCache(cache_dir_path) if use_cache else None
 
-    if None in [first_note, first_white_note_col, tenth_white_note_col, read_height,
-                left_hand_color, right_hand_color, background_color, minimum_note_width]:
-        show_frames(frame_dir_path, num_frames)
+        video_path = stages.get_video(video_url, video_dir_path, video_name, tag, cache=cache,
+                                      stream_constraints=stream_constraints)
+        num_frames, fps = youtube2frames.get_video_info(video_path)
 
-    if first_note is None:
-        first_note = prompt('first_note (capital)', 'A')
+        if auto_calibrate and None in [first_note, first_white_note_col, tenth_white_note_col, read_height,
+                                       left_hand_color, right_hand_color, background_color, minimum_note_width]:
+            # only the parameters that were not given are replaced by the calibrated ones
+            calibrated = calibrate.calibrate(video_path)
+            first_note = calibrated['first_note'] if first_note is None else first_note
+            first_white_note_col = calibrated['first_white_note_col'] if first_white_note_col is None else first_white_note_col
+            tenth_white_note_col = calibrated['tenth_white_note_col'] if tenth_white_note_col is None else tenth_white_note_col
+            read_height = calibrated['read_height'] if read_height is None else read_height
+            left_hand_color = calibrated['left_hand_color'] if left_hand_color is None else left_hand_color
+            right_hand_color = calibrated['right_hand_color'] if right_hand_color is None else right_hand_color
+            background_color = calibrated['background_color'] if background_color is None else background_color
+            minimum_note_width = calibrated['minimum_note_width'] if minimum_note_width is None else minimum_note_width
 
-    if first_white_note_col is None:
-        first_white_note_col = float(input("[No default] Enter the first white note column: "))
+        if None in [first_note, first_white_note_col, tenth_white_note_col, read_height,
+                    left_hand_color, right_hand_color, background_color, minimum_note_width]:
+            # the frames are read straight from the video as they are only saved once all the parameters are known
+            show_frames(video_path, num_frames)
 
-    if tenth_white_note_col is None:
-        tenth_white_note_col = float(input("[No default] Enter the tenth white note column: "))
+        if first_note is None:
+            first_note = prompt('first_note (capital)', 'A')
 
-    if read_height is None:
-        read_height = int(prompt('read_height', 50))
+        if first_white_note_col is None:
+            first_white_note_col = float(input("[No default] Enter the first white note column: "))
 
-    if left_hand_color is None:
-        left_hand_color = json.loads(input("Enter the left hand note's color in [R, G, B]: "))
+        if tenth_white_note_col is None:
+            tenth_white_note_col = float(input("[No default] Enter the tenth white note column: "))
 
-    if right_hand_color is None:
-        right_hand_color = json.loads(input("Enter the right hand note's color in [R, G, B]: "))
+        if read_height is None:
+            read_height = int(prompt('read_height', 50))
 
-    if background_color is None:
-        background_color = json.loads(input("Enter the background color in [R, G, B]: "))
+        if left_hand_color is None:
+            left_hand_color = json.loads(input("Enter the left hand note's color in [R, G, B]: "))
 
-    if minimum_note_width is None:
-        minimum_note_width = int(input("Enter the minimum note width: "))
+        if right_hand_color is None:
+            right_hand_color = json.loads(input("Enter the right hand note's color in [R, G, B]: "))
 
-    left_hand, right_hand = frames2matrix.Frames2MatrixConverter(
-        name=video_name,
-        frame_dir=frame_dir_path,
-        num_frames=num_frames,
-        read_height=read_height,
-        first_note=first_note,
-        first_white_note_col=first_white_note_col,
-        tenth_white_note_col=tenth_white_note_col,
-        left_hand_color=left_hand_color,
-        right_hand_color=right_hand_color,
-        background_color=background_color,
-        minimum_note_width=minimum_note_width
-    ).convert()
+        if background_color is None:
+            background_color = json.loads(input("Enter the background color in [R, G, B]: "))
 
-    if array_dir_path is None:
-        array_dir_path = prompt('array_dir_path', f'./{video_name}/arrays')
+        if minimum_note_width is None:
+            minimum_note_width = int(input("Enter the minimum note width: "))
 
-    os.makedirs(array_dir_path, exist_ok=True)
-    print(f'Created the following directory: {array_dir_path}')
-    np.save(f'{array_dir_path}/left_hand.npy', left_hand)
-    np.save(f'{array_dir_path}/right_hand.npy', right_hand)
+        if frame_mode == 'strip':
+            # the strip can only be saved once the read height is known
+            if strip_path is None:
+                strip_path = prompt('strip_path', f'./{video_name}/strip.npy')
 
-    full_csv_lines, right_csv_lines, left_csv_lines = matrix2csv.matrix_to_csv(left_hand, right_hand, fps)
+            if strip_rows is None:
+                strip_rows = [read_height - 1, read_height + 2]
+
+            strip_path = youtube2frames.get_strip(video_path, strip_path, strip_rows, decode_workers, cache=cache)
+
+        if rows_per_frame > 1:
+            if frame_mode != 'stream':
+                raise ValueError("more than one row per frame can only be read in the 'stream' frame mode")
+
+            if scroll_speed is None:
+                scroll_speed = calibrate.estimate_scroll_speed(video_path, read_height)
+                print(f'Estimated scroll speed: {scroll_speed:.3f} rows per frame')
+
+        converter_args = dict(
+            name=video_name,
+            read_height=read_height,
+            first_note=first_note,
+            first_white_note_col=first_white_note_col,
+            tenth_white_note_col=tenth_white_note_col,
+            left_hand_color=left_hand_color,
+            right_hand_color=right_hand_color,
+            background_color=background_color,
+            minimum_note_width=minimum_note_width,
+            color_table_bits=color_table_bits,
+            color_table_dir=color_table_dir,
+            rows_per_frame=rows_per_frame,
+            scroll_speed=scroll_speed
+        )
+
+        if stream_midi:
+            # the matrices of the whole video are never made, so no arrays or csvs are saved
+            if midi_dir_path is None:
+                midi_dir_path = prompt('midi_dir_path', f'./{video_name}')
+
+            os.makedirs(midi_dir_path, exist_ok=True)
+            print(f'Created the following directory: {midi_dir_path}')
+
+            midi_paths = [f'{midi_dir_path}/{video_name}.mid', f'{midi_dir_path}/{video_name}_rh.mid',
+                          f'{midi_dir_path}/{video_name}_lh.mid']
+            stages.stream_midi(converter_args, video_path, midi_paths, fps)
+            return
+
+        left_hand, right_hand = stages.get_hands(
+            converter_args=converter_args,
+            frame_mode=frame_mode,
+            video_path=video_path,
+            frame_dir_path=frame_dir_path,
+            strip_path=strip_path,
+            workers=workers,
+            chunk_size=chunk_size,
+            cache=cache
+        )
+
+        if array_dir_path is None:
+            array_dir_path = prompt('array_dir_path', f'./{video_name}/arrays')
+
+        os.makedirs(array_dir_path, exist_ok=True)
+        print(f'Created the following directory: {array_dir_path}')
+        if compact_arrays:
+            left_hand.save(f'{array_dir_path}/left_hand.npz')
+            right_hand.save(f'{array_dir_path}/right_hand.npz')
+        else:
+            np.save(f'{array_dir_path}/left_hand.npy', left_hand)
+            np.save(f'{array_dir_path}/right_hand.npy', right_hand)
 
-    if csv_dir_path is None:
-        csv_dir_path = prompt('csv_dir_path', f'./{video_name}/csvs')
+        # the csvs are only needed for debugging, the midi files are written straight from the matrices
+        if save_csvs:
+            full_csv_lines, right_csv_lines, left_csv_lines = matrix2csv.matrix_to_csv(left_hand, right_hand, fps)
 
-    os.makedirs(csv_dir_path, exist_ok=True)
-    print(f'Created the following directory: {csv_dir_path}')
-    write_lines(f'{csv_dir_path}/{video_name}.csv', full_csv_lines)
-    write_lines(f'{csv_dir_path}/{video_name}_rh.csv', right_csv_lines)
-    write_lines(f'{csv_dir_path}/{video_name}_lh.csv', left_csv_lines)
+            if csv_dir_path is None:
+                csv_dir_path = prompt('csv_dir_path', f'./{video_name}/csvs')
 
-    if midi_dir_path is None:
-        midi_dir_path = prompt('midi_dir_path', f'./{video_name}')
+            os.makedirs(csv_dir_path, exist_ok=True)
+            print(f'Created the following directory: {csv_dir_path}')
+            write_lines(f'{csv_dir_path}/{video_name}.csv', full_csv_lines)
+            write_lines(f'{csv_dir_path}/{video_name}_rh.csv', right_csv_lines)
+            write_lines(f'{csv_dir_path}/{video_name}_lh.csv', left_csv_lines)
 
-    os.makedirs(midi_dir_path, exist_ok=True)
-    print(f'Created the following directory: {midi_dir_path}')
+        if midi_dir_path is None:
+            midi_dir_path = prompt('midi_dir_path', f'./{video_name}')
 
-    # Parse the CSVs into a MIDI files, then save the parsed MIDI files
-    with open(f"{midi_dir_path}/{video_name}.mid", "wb") as output_file:
-        midi_object = pm.csv_to_midi(f'{csv_dir_path}/{video_name}.csv')
-        pm.FileWriter(output_file).write(midi_object)
+        os.makedirs(midi_dir_path, exist_ok=True)
+        print(f'Created the following directory: {midi_dir_path}')
 
-    with open(f"{midi_dir_path}/{video_name}_rh.mid", "wb") as output_file:
-        midi_object = pm.csv_to_midi(f'{csv_dir_path}/{video_name}_rh.csv')
-        pm.FileWriter(output_file).write(midi_object)
+        full_midi, right_midi, left_midi = stages.get_midi(left_hand, right_hand, fps, cache=cache)
 
-    with open(f"{midi_dir_path}/{video_name}_lh.mid", "wb") as output_file:
-        midi_object = pm.csv_to_midi(f'{csv_dir_path}/{video_name}_lh.csv')
-        pm.FileWriter(output_file).write(midi_object)
+        for file_name, midi in [(f'{video_name}.mid', full_midi), (f'{video_name}_rh.mid', right_midi),
+                                (f'{video_name}_lh.mid', left_midi)]:
+            with open(f"{midi_dir_path}/{file_name}", "wb") as output_file:
+                output_file.write(midi)
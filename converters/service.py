@@ -0,0 +1,325 @@
+import argparse
+import concurrent.futures
+import importlib
+import json
+import os
+import sys
+import time
+import traceback
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.append('.')
+
+# the directories of the spool a job moves through, from being submitted to being finished
+JOB_STATES = ['queued', 'running', 'done', 'failed']
+
+# the file a client creates in the spool to ask the service to stop once its running jobs finish
+STOP_FILE_NAME = 'stop'
+
+STATUS_FILE_NAME = 'status.json'
+
+# the stages of a conversion whose frames are counted as converted, whatever the frame mode
+CONVERT_STAGES = ['convert', 'convert_stream', 'stream_midi']
+
+
+def write_json(path, data):
+    """
+    writes a json file under a temporary name first, so that anything polling the spool never reads half of it
+    :param path: the path of the json file
+    :param data: what to write into it
+    """
+    temp_path = f'{path}.{os.getpid()}.tmp'
+
+    with open(temp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+
+    os.replace(temp_path, path)
+
+
+def read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def get_job_path(spool_dir, state, job_id):
+    return f'{spool_dir}/{state}/{job_id}.json'
+
+
+def _warm_up():
+    """
+    imports everything a conversion needs in a worker process before the first job comes in
+    """
+    importlib.import_module('converters.batch_converter')
+
+
+def run_job(job):
+    """
+    downloads and converts the video of a job in a worker process. The worker's imports, and the color lookup tables of
+    the palettes it has already converted, are kept from one job to the next.
+    :param job: keyword arguments for full_convert
+    :return: the seconds the download and the conversion took, and the metrics of every stage of the conversion
+    """
+    from converters import batch_converter
+
+    start_time = time.time()
+    video_path = batch_converter.download(job)
+    download_seconds = time.time() - start_time
+
+    start_time = time.time()
+    stages = batch_converter.convert(job, video_path)
+
+    return {'download_seconds': download_seconds, 'convert_seconds': time.time() - start_time, 'stages': stages}
+
+
+class ConversionService:
+    def __init__(self, spool_dir, workers=None, poll_interval=0.5):
+        """
+        a long running service that converts the jobs submitted to a spool directory with a pool of worker processes
+        that stay warm between jobs. A job is a json file of full_convert parameters that submit_job puts in the queued
+        directory of the spool. The service moves it to the running directory when a worker takes it, then to the done
+        or failed directory with its result once it finishes. The status of the service and its throughput are kept up
+        to date in status.json in the spool.
+        :param spool_dir: the directory jobs are submitted to
+        :param workers: the number of jobs to convert at once. Defaults to one for each CPU
+        :param poll_interval: the seconds between looks at the spool for new jobs
+        """
+        self.spool_dir = spool_dir
+        self.workers = workers or os.cpu_count()
+        self.poll_interval = poll_interval
+        self.start_time = None
+
+        # maps the future of each running job to its id and the time it started
+        self.running = {}
+        self.num_done = 0
+        self.num_failed = 0
+        self.frames_converted = 0
+        self.busy_seconds = 0
+
+        for state in JOB_STATES:
+            os.makedirs(f'{spool_dir}/{state}', exist_ok=True)
+
+    def get_queued_job_ids(self):
+        """
+        :return: the ids of the jobs waiting in the spool, oldest first
+        """
+        file_names = [file_name for file_name in os.listdir(f'{self.spool_dir}/queued') if file_name.endswith('.json')]
+        return sorted(file_name[:-len('.json')] for file_name in file_names)
+
+    def start_job(self, executor, job_id):
+        """
+        takes a job from the queue and gives it to a worker
+        """
+        running_path = get_job_path(self.spool_dir, 'running', job_id)
+
+        try:
+            os.replace(get_job_path(self.spool_dir, 'queued', job_id), running_path)
+        except FileNotFoundError:
+            # moved since the queue was listed
+            return
+
+        job = read_json(running_path)
+        self.running[executor.submit(run_job, job)] = (job_id, time.time())
+        print(f"Started job {job_id} ({job.get('video_name')})")
+
+    def finish_job(self, future):
+        """
+        moves a job that finished to the done or failed directory, along with its result
+        """
+        job_id, start_time = self.running.pop(future)
+        running_path = get_job_path(self.spool_dir, 'running', job_id)
+        job = read_json(running_path)
+        seconds = time.time() - start_time
+        self.busy_seconds += seconds
+
+        result = {'job': job, 'job_id': job_id, 'seconds': seconds}
+
+        if future.exception() is not None:
+            state = 'failed'
+            self.num_failed += 1
+            error = future.exception()
+            result['error'] = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+            print(f"Failed job {job_id}: {error!r}")
+        else:
+            state = 'done'
+            self.num_done += 1
+            result.update(future.result())
+            self.frames_converted += sum(
+                stage.get('frames', 0) for stage in result['stages'] if stage['stage'] in CONVERT_STAGES
+            )
+            print(f"Finished job {job_id} in {seconds:.1f} seconds")
+
+        write_json(get_job_path(self.spool_dir, state, job_id), result)
+        os.remove(running_path)
+
+    def get_status(self):
+        """
+        :return: a dictionary of the jobs the service has run and how fast it has run them
+        """
+        uptime = time.time() - self.start_time
+        num_finished = self.num_done + self.num_failed
+
+        return {
+            'pid': os.getpid(),
+            'workers': self.workers,
+            'uptime_seconds': uptime,
+            'queued': len(self.get_queued_job_ids()),
+            'running': [job_id for job_id, _ in self.running.values()],
+            'done': self.num_done,
+            'failed': self.num_failed,
+            'jobs_per_hour': num_finished / uptime * 3600 if uptime > 0 else 0,
+            'mean_job_seconds': self.busy_seconds / num_finished if num_finished else None,
+            'frames_converted': self.frames_converted,
+            'frames_per_second': self.frames_converted / uptime if uptime > 0 else 0,
+            'updated': time.time(),
+        }
+
+    def create_executor(self):
+        """
+        :return: a new pool of worker processes, every one of which is started and has imported everything before the
+                 first job comes in
+        """
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        concurrent.futures.wait([executor.submit(_warm_up) for _ in range(self.workers)])
+
+        return executor
+
+    def run(self, max_jobs=None):
+        """
+        converts the jobs submitted to the spool until a client asks the service to stop, or until max_jobs jobs have
+        finished
+        :param max_jobs: the number of jobs to finish before stopping, or None to keep running
+        """
+        self.start_time = time.time()
+        stop_path = f'{self.spool_dir}/{STOP_FILE_NAME}'
+
+        # jobs that were running when a service was stopped before they finished are run again
+        for file_name in os.listdir(f'{self.spool_dir}/running'):
+            if file_name.endswith('.json'):
+                os.replace(f'{self.spool_dir}/running/{file_name}', f'{self.spool_dir}/queued/{file_name}')
+
+        print(f"Watching {self.spool_dir} for jobs with {self.workers} workers")
+
+        executor = self.create_executor()
+
+        try:
+            while True:
+                stopping = os.path.exists(stop_path) or (
+                    max_jobs is not None and self.num_done + self.num_failed + len(self.running) >= max_jobs
+                )
+
+                if not stopping:
+                    for job_id in self.get_queued_job_ids()[:self.workers - len(self.running)]:
+                        self.start_job(executor, job_id)
+
+                write_json(f'{self.spool_dir}/{STATUS_FILE_NAME}', {**self.get_status(), 'stopping': stopping})
+
+                if stopping and not self.running:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    self.running, timeout=self.poll_interval, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                if not self.running:
+                    time.sleep(self.poll_interval)
+
+                for future in done:
+                    self.finish_job(future)
+
+                # a worker that crashed breaks the whole pool, so every job still running in it fails too, and a new
+                # pool is needed for the jobs after them
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    for future in concurrent.futures.wait(self.running).done:
+                        self.finish_job(future)
+
+                    print("A worker process died, starting new workers")
+                    executor.shutdown()
+                    executor = self.create_executor()
+        finally:
+            executor.shutdown()
+
+        if os.path.exists(stop_path):
+            os.remove(stop_path)
+
+        write_json(f'{self.spool_dir}/{STATUS_FILE_NAME}', {**self.get_status(), 'stopping': True, 'stopped': True})
+        print(f"Stopped after {self.num_done} done and {self.num_failed} failed jobs")
+
+
+def submit_job(spool_dir, job):
+    """
+    :param spool_dir: the spool directory of a ConversionService
+    :param job: keyword arguments for full_convert. The video needs a tag, as there is no one to prompt for it
+    :return: the id of the job
+    """
+    job_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+
+    os.makedirs(f'{spool_dir}/queued', exist_ok=True)
+    write_json(get_job_path(spool_dir, 'queued', job_id), job)
+
+    return job_id
+
+
+def get_job_status(spool_dir, job_id):
+    """
+    :param spool_dir: the spool directory of a ConversionService
+    :param job_id: the id submit_job returned
+    :return: a dictionary with the state of the job, one of JOB_STATES, and its result once it is done or failed
+    """
+    # looked for in the order a job moves through them, so a job that moves during the search is still found
+    for state in JOB_STATES:
+        try:
+            data = read_json(get_job_path(spool_dir, state, job_id))
+        except FileNotFoundError:
+            continue
+
+        return {'state': state, 'result': data if state in ['done', 'failed'] else None}
+
+    raise KeyError(f"there is no job {job_id} in {spool_dir}")
+
+
+def wait_for_job(spool_dir, job_id, timeout=None, poll_interval=0.5):
+    """
+    :param spool_dir: the spool directory of a ConversionService
+    :param job_id: the id submit_job returned
+    :param timeout: the most seconds to wait for, or None to wait until the job finishes
+    :param poll_interval: the seconds between looks at the job
+    :return: the status of the job once it is done or failed, see get_job_status
+    """
+    start_time = time.time()
+
+    while True:
+        status = get_job_status(spool_dir, job_id)
+        if status['state'] in ['done', 'failed']:
+            return status
+
+        if timeout is not None and time.time() - start_time > timeout:
+            raise TimeoutError(f"job {job_id} did not finish within {timeout} seconds")
+
+        time.sleep(poll_interval)
+
+
+def get_service_status(spool_dir):
+    """
+    :param spool_dir: the spool directory of a ConversionService
+    :return: the status the service last wrote, see ConversionService.get_status
+    """
+    return read_json(f'{spool_dir}/{STATUS_FILE_NAME}')
+
+
+def stop_service(spool_dir):
+    """
+    asks the service to stop taking jobs, and to stop once its running jobs finish
+    :param spool_dir: the spool directory of a ConversionService
+    """
+    open(f'{spool_dir}/{STOP_FILE_NAME}', 'w').close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts the jobs submitted to a spool directory until stopped.")
+    parser.add_argument('spool_dir', help="the directory jobs are submitted to")
+    parser.add_argument('--workers', type=int, default=None, help="the number of jobs to convert at once")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="the seconds between looks for new jobs")
+    parser.add_argument('--max-jobs', type=int, default=None, help="the number of jobs to finish before stopping")
+    args = parser.parse_args()
+
+    ConversionService(args.spool_dir, args.workers, args.poll_interval).run(args.max_jobs)
@@ -0,0 +1,158 @@
+import os
+import sys
+
+sys.path.append('.')
+
+from core import youtube2frames, frames2matrix, handmatrix, matrix2midi, telemetry
+
+
+def get_video(video_url, video_dir_path, video_name, tag, cache=None, stream_constraints=None):
+    """
+    :param video_url: the url of the youtube video, or the path of a video file to use instead of downloading one
+    :param video_dir_path: the directory to download the video into when it is not cached
+    :param video_name: the name to save the video under
+    :param tag: the itag of the stream to download. If 'auto', the cheapest stream that meets the stream constraints is
+                picked. If None, the user is prompted for one and the download is not cached
+    :param cache: a StageCache, or None to always download the video
+    :param stream_constraints: the keyword arguments of youtube2frames.get_auto_tag other than video_url, used when the
+                               tag is 'auto'
+    :return: the path of the video
+    """
+    if os.path.isfile(video_url):
+        return video_url
+
+    # picked before looking in the cache, so the download is cached under the stream it really is
+    if tag == 'auto':
+        tag = youtube2frames.get_auto_tag(video_url, **(stream_constraints or {}))
+
+    if cache is None or tag is None:
+        return youtube2frames.download_video(video_url, video_dir_path, video_name, tag)
+
+    stage_dir = cache.run(
+        'download',
+        {'url': video_url, 'tag': tag},
+        lambda output_dir: youtube2frames.download_video(video_url, output_dir, 'video', tag)
+    )
+
+    return f'{stage_dir}/video.mp4'
+
+
+def get_hands(converter_args, frame_mode, video_path, frame_dir_path=None, strip_path=None, workers=None,
+              chunk_size=256, cache=None):
+    """
+    finds the notes played by each hand, extracting the frames first in the 'images' frame mode
+    :param converter_args: the keyword arguments of Frames2MatrixConverter other than frame_dir, num_frames and
+                           strip_path
+    :param frame_mode: 'images', 'stream' or 'strip'
+    :param video_path: the path of the video
+    :param frame_dir_path: the directory to save the frames in, in the 'images' frame mode
+    :param strip_path: the path of the strip, in the 'strip' frame mode
+    :param workers: the number of processes to find the notes with
+    :param chunk_size: the number of consecutive frames each process finds the notes of at a time
+    :param cache: a StageCache, or None to always find the notes
+    :return: the HandMatrix of the left hand and of the right hand
+    """
+
+    def detect():
+        if frame_mode == 'images':
+            num_frames, _ = youtube2frames.save_frames(video_path, frame_dir_path)
+        elif frame_mode == 'strip':
+            num_frames = youtube2frames.load_strip(strip_path)[1]['num_frames']
+        else:
+            num_frames, _ = youtube2frames.get_video_info(video_path)
+
+        converter = frames2matrix.Frames2MatrixConverter(
+            frame_dir=frame_dir_path if frame_mode == 'images' else None,
+            num_frames=num_frames,
+            strip_path=strip_path if frame_mode == 'strip' else None,
+            **converter_args
+        )
+
+        if frame_mode in ['images', 'strip']:
+            return converter.convert(workers=workers, chunk_size=chunk_size, compact=True)
+        else:
+            frames = youtube2frames.stream_frames(
+                video_path, step=converter.rows_per_frame, with_counts=converter.rows_per_frame > 1
+            )
+            return converter.convert_stream(frames, compact=True)
+
+    if cache is None:
+        return detect()
+
+    def build(output_dir):
+        left_hand, right_hand = detect()
+        left_hand.save(f'{output_dir}/left_hand.npz')
+        right_hand.save(f'{output_dir}/right_hand.npz')
+
+    # the strip is all detection reads in the 'strip' frame mode. Otherwise, the frames come straight from the video.
+    if frame_mode == 'strip':
+        source = {'strip': cache.hash_file(strip_path)}
+    else:
+        source = {'video': cache.hash_file(video_path), 'frame_mode': frame_mode}
+    source['storage'] = 'intervals'
+
+    parameters = {key: value for key, value in converter_args.items() if key not in ['name', 'color_table_dir']}
+
+    stage_dir = cache.run('detect', {**source, **parameters}, build)
+
+    return (handmatrix.HandMatrix.load(f'{stage_dir}/left_hand.npz'),
+            handmatrix.HandMatrix.load(f'{stage_dir}/right_hand.npz'))
+
+
+def stream_midi(converter_args, video_path, midi_paths, fps):
+    """
+    finds the notes of the video a batch of frames at a time, as in the 'stream' frame mode, and writes them into the
+    midi files as they are found, so the matrices of the whole video are never held in memory. Nothing is cached.
+    :param converter_args: the keyword arguments of Frames2MatrixConverter other than frame_dir, num_frames and
+                           strip_path
+    :param video_path: the path of the video
+    :param midi_paths: the paths of the midi files of the full song, the right hand only and the left hand only
+    :param fps: frames per second of the video
+    """
+    num_frames, _ = youtube2frames.get_video_info(video_path)
+    converter = frames2matrix.Frames2MatrixConverter(frame_dir=None, num_frames=num_frames, **converter_args)
+    frames = youtube2frames.stream_frames(
+        video_path, step=converter.rows_per_frame, with_counts=converter.rows_per_frame > 1
+    )
+
+    with telemetry.stage('stream_midi'), matrix2midi.MidiStreamWriter(*midi_paths, fps) as writer:
+        for left_hand_notes, right_hand_notes in converter.stream_notes(frames):
+            # swapped the same way the matrices returned by convert are, so the files match the ones get_midi writes
+            writer.append(right_hand_notes, left_hand_notes)
+
+
+def get_midi(left_hand, right_hand, fps, cache=None):
+    """
+    :param left_hand: the HandMatrix of the left hand
+    :param right_hand: the HandMatrix of the right hand
+    :param fps: frames per second of the video
+    :param cache: a StageCache, or None to always write the midi
+    :return: the bytes of 3 midi files: the full song, the right hand only and the left hand only
+    """
+    if cache is None:
+        return matrix2midi.matrix_to_midi(left_hand, right_hand, fps)
+
+    file_names = ['full.mid', 'rh.mid', 'lh.mid']
+
+    def build(output_dir):
+        for file_name, midi in zip(file_names, matrix2midi.matrix_to_midi(left_hand, right_hand, fps)):
+            with open(f'{output_dir}/{file_name}', 'wb') as output_file:
+                output_file.write(midi)
+
+    stage_dir = cache.run(
+        'midi',
+        {
+            'left_hand': cache.hash_array(left_hand.intervals),
+            'right_hand': cache.hash_array(right_hand.intervals),
+            'num_frames': len(right_hand),
+            'fps': fps
+        },
+        build
+    )
+
+    midis = []
+    for file_name in file_names:
+        with open(f'{stage_dir}/{file_name}', 'rb') as input_file:
+            midis.append(input_file.read())
+
+    return tuple(midis)
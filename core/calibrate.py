@@ -0,0 +1,318 @@
+import sys
+
+import cv2
+import numpy as np
+
+from core import telemetry, youtube2frames
+
+# the parameters of Frames2MatrixConverter that calibrate finds
+CALIBRATED_PARAMETERS = [
+    'first_note', 'first_white_note_col', 'tenth_white_note_col', 'read_height', 'left_hand_color', 'right_hand_color',
+    'background_color', 'minimum_note_width'
+]
+
+NOTE_LETTERS = 'ABCDEFG'
+
+
+def read_sample_frames(video_path, num_samples=12):
+    """
+    seeks straight to a few frames spread over the video instead of decoding all of them. The start and end of the
+    video are skipped, as they are often an intro or outro screen.
+    :param video_path: the path of the video
+    :param num_samples: the number of frames to read
+    :return: a list of the frames that could be read, in BGR
+    """
+    n_frames, _ = youtube2frames.get_video_info(video_path)
+    frame_nums = np.linspace(n_frames * 0.1, n_frames * 0.9, num_samples).astype(int)
+
+    vid_cap = youtube2frames.open_video(video_path)
+    frames = []
+
+    for frame_num in np.unique(frame_nums):
+        vid_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+        success, image = vid_cap.read()
+        if success:
+            frames.append(image)
+
+    vid_cap.release()
+
+    if not frames:
+        raise ValueError(f"could not read any frames of {video_path}")
+
+    return frames
+
+
+def get_runs(mask):
+    """
+    :param mask: a 1d boolean array
+    :return: an array of shape (runs, 2) with the start and the index after the end of every run of True values
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return edges.reshape((-1, 2))
+
+
+def find_keyboard(still_image):
+    """
+    finds the keyboard as the lowest band of rows that are mostly white
+    :param still_image: the median of the sampled frames in grayscale, so that pressed keys and falling notes are gone
+    :return: the first row of the keyboard and the row after its last row
+    """
+    white = still_image > 160
+    white_fraction = white.mean(axis=1)
+
+    # the rows with black keys are still more than half white
+    keyboard_rows = get_runs(white_fraction > 0.4)
+    keyboard_rows = [(top, bottom) for top, bottom in keyboard_rows if white_fraction[top:bottom].max() > 0.7]
+
+    if not keyboard_rows:
+        raise ValueError("could not find the keyboard")
+
+    return tuple(int(row) for row in keyboard_rows[-1])
+
+
+def find_white_keys(still_image, keyboard_top, keyboard_bottom):
+    """
+    finds the white keys from the dark lines between them, in a row below the black keys
+    :param still_image: the median of the sampled frames in grayscale
+    :param keyboard_top: the first row of the keyboard
+    :param keyboard_bottom: the row after the last row of the keyboard
+    :return: the column of the middle of every white key, in order
+    """
+    row = still_image[keyboard_top + int((keyboard_bottom - keyboard_top) * 0.85)].astype(np.float64)
+
+    # the lines are thin, so only a few columns are dark
+    threshold = (np.percentile(row, 1) + np.percentile(row, 90)) / 2
+
+    white = row > threshold
+    white_cols = np.flatnonzero(white)
+    left_edge, right_edge = white_cols[0], white_cols[-1]
+
+    gaps = get_runs(~white[left_edge:right_edge + 1]) + left_edge
+    gap_cols = gaps.mean(axis=1) - 0.5
+
+    if len(gap_cols) < 2:
+        raise ValueError("could not find the lines between the white keys")
+
+    # every gap is a whole number of white keys away from the first one, even if a line was missed
+    distance_between_white_notes = np.median(np.diff(gap_cols))
+    gap_nums = np.round((gap_cols - gap_cols[0]) / distance_between_white_notes)
+    distance_between_white_notes, first_gap_col = np.polyfit(gap_nums, gap_cols, 1)
+
+    first_key = np.ceil((left_edge - first_gap_col) / distance_between_white_notes - 0.5)
+    last_key = np.floor((right_edge - first_gap_col) / distance_between_white_notes - 0.5)
+
+    return first_gap_col + (np.arange(first_key, last_key + 1) + 0.5) * distance_between_white_notes
+
+
+def find_first_note(still_image, keyboard_top, keyboard_bottom, white_key_cols):
+    """
+    finds the letter of the first white key from where the black keys are. There is no black key between B and C or
+    between E and F.
+    :param still_image: the median of the sampled frames in grayscale
+    :param keyboard_top: the first row of the keyboard
+    :param keyboard_bottom: the row after the last row of the keyboard
+    :param white_key_cols: the column of the middle of every white key, in order
+    :return: the letter value of the first white key
+    """
+    row = still_image[keyboard_top + int((keyboard_bottom - keyboard_top) * 0.3)].astype(np.float64)
+    threshold = (np.percentile(row, 10) + np.percentile(row, 90)) / 2
+
+    # whether there is a black key between each white key and the next one. The line between the white keys is dark
+    # too, so most of the columns around it must be dark.
+    distance_between_white_notes = white_key_cols[1] - white_key_cols[0]
+    offsets = np.arange(-int(distance_between_white_notes * 0.2), int(distance_between_white_notes * 0.2) + 1)
+    between_cols = np.round((white_key_cols[:-1] + white_key_cols[1:]) / 2).astype(int)
+    around_cols = (between_cols[:, np.newaxis] + offsets).clip(0, len(row) - 1)
+    has_black_key = (row[around_cols] < threshold).mean(axis=1) > 0.5
+
+    white_key_nums = np.arange(len(between_cols))
+    agreements = [
+        np.count_nonzero(has_black_key == ~np.isin((first_note + white_key_nums) % 7, [1, 4]))
+        for first_note in range(7)
+    ]
+
+    return NOTE_LETTERS[int(np.argmax(agreements))]
+
+
+def find_colors(frames, keyboard_top, num_clusters=4, max_pixels=100000):
+    """
+    clusters the colors of the notes falling above the keyboard. The most common color is the background, and the two
+    most common colors of notes are the hands. The hand whose notes are further left is the left hand.
+    :param frames: the sampled frames, in BGR
+    :param keyboard_top: the first row of the keyboard
+    :param num_clusters: the number of colors to cluster the pixels into
+    :param max_pixels: the number of pixels to cluster at most, spread evenly over the rows that are sampled
+    :return: the RGB values of the left hand notes, the right hand notes and the background
+    """
+    rows = np.linspace(0, keyboard_top - 1, min(keyboard_top, 40)).astype(int)
+    pixels = np.concatenate([frame[rows].reshape((-1, 3)) for frame in frames])
+    cols = np.tile(np.arange(frames[0].shape[1]), len(rows) * len(frames))
+
+    step = -(-len(pixels) // max_pixels)
+    pixels, cols = pixels[::step], cols[::step]
+
+    cv2.setRNGSeed(0)
+    _, labels, _ = cv2.kmeans(
+        pixels.astype(np.float32), num_clusters, None,
+        (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.5), 3, cv2.KMEANS_PP_CENTERS
+    )
+    labels = labels.ravel()
+
+    clusters = np.argsort(np.bincount(labels, minlength=num_clusters))[::-1]
+    colors = [np.median(pixels[labels == cluster], axis=0).round().astype(np.uint8) for cluster in clusters]
+    labs = cv2.cvtColor(np.array([colors]), cv2.COLOR_BGR2LAB)[0].astype(np.int32)
+
+    background = 0
+    first_hand = 1
+
+    # black key notes are often a darker shade of the same hand, so the other hand must have a different hue
+    chroma_distances = [np.linalg.norm(labs[i, 1:] - labs[first_hand, 1:]) for i in range(2, num_clusters)]
+    second_hand = 2 + int(np.argmax(np.array(chroma_distances) > 20)) if max(chroma_distances) > 20 else 2
+
+    hands = sorted([first_hand, second_hand], key=lambda hand: cols[labels == clusters[hand]].mean())
+
+    return [[int(value) for value in colors[i][::-1]] for i in [*hands, background]]
+
+
+def find_read_height(frames, keyboard_top, background_color):
+    """
+    finds the lowest row above the keyboard that is only background when no note is falling through it, so that notes
+    are read as late as possible, right when they are played
+    :param frames: the sampled frames, in BGR
+    :param keyboard_top: the first row of the keyboard
+    :param background_color: the RGB values of the background
+    :return: the read height
+    """
+    # only the lowest quarter of the space above the keyboard is searched
+    search_top = keyboard_top - max(keyboard_top // 4, 3)
+    still_bgr_image = np.median(np.stack([frame[search_top:keyboard_top] for frame in frames]), axis=0)
+
+    background_lab = cv2.cvtColor(np.array([[background_color[::-1]]], dtype=np.uint8), cv2.COLOR_BGR2LAB)
+    still_lab = cv2.cvtColor(still_bgr_image.astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.int32)
+    row_distances = np.linalg.norm(still_lab - background_lab.astype(np.int32), axis=2).mean(axis=1)
+
+    # the read height and the rows directly above and below it must all be clear
+    clear_rows = row_distances < 10
+    clear_bands = clear_rows[:-2] & clear_rows[1:-1] & clear_rows[2:]
+    candidates = np.flatnonzero(clear_bands) + 1
+
+    if len(candidates) == 0:
+        return max(keyboard_top - 3, 1)
+
+    return search_top + int(candidates[-1])
+
+
+def get_row_profile(image, bottom_row, column_bins=64):
+    """
+    :param image: a frame in BGR
+    :param bottom_row: the row after the last row of the profile
+    :param column_bins: the number of groups of columns to average
+    :return: an array of shape (bottom_row, column_bins) with the average brightness of each group of columns in each
+             row, which is enough to see how far the notes fell
+    """
+    gray = cv2.cvtColor(image[:bottom_row], cv2.COLOR_BGR2GRAY).astype(np.float32)
+    width = gray.shape[1] // column_bins * column_bins
+    return gray[:, :width].reshape((bottom_row, column_bins, -1)).mean(axis=2)
+
+
+def estimate_scroll_speed(video_path, read_height, num_samples=8, frame_gap=4):
+    """
+    finds how many rows the notes fall every frame by finding how far down the area above the read height has to be
+    moved to match the same area frame_gap frames later, at a few places in the video
+    :param video_path: the path of the video
+    :param read_height: the read height. Only the rows above it are compared
+    :param num_samples: the number of pairs of frames to compare
+    :param frame_gap: the number of frames between the frames of each pair. Larger gaps give more precise speeds
+    :return: the number of rows the notes fall every frame
+    """
+    n_frames, _ = youtube2frames.get_video_info(video_path)
+    start_frames = np.linspace(n_frames * 0.1, n_frames * 0.9 - frame_gap, num_samples).astype(int)
+
+    vid_cap = youtube2frames.open_video(video_path)
+    speeds = []
+
+    for start_frame in np.unique(start_frames):
+        vid_cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        success, first_image = vid_cap.read()
+        for _ in range(frame_gap - 1):
+            vid_cap.grab()
+        success, last_image = vid_cap.read() if success else (False, None)
+
+        if not success:
+            continue
+
+        first_profile = get_row_profile(first_image, read_height + 1)
+        last_profile = get_row_profile(last_image, read_height + 1)
+
+        # the difference between the frames when the first one is moved down by each number of rows
+        shifts = np.arange(read_height // 2)
+        differences = np.array([
+            np.abs(first_profile[:read_height + 1 - shift] - last_profile[shift:]).mean() for shift in shifts
+        ])
+
+        shift = int(np.argmin(differences))
+
+        # nothing moved, or nothing matched
+        if shift == 0 or differences[shift] > differences[0] / 2:
+            continue
+
+        # fits a parabola through the best shift and its neighbors to find the shift between whole rows
+        if 0 < shift < len(shifts) - 1:
+            before, best, after = differences[shift - 1:shift + 2]
+            curvature = before - 2 * best + after
+            if curvature > 0:
+                shift += (before - after) / (2 * curvature)
+
+        speeds.append(shift / frame_gap)
+
+    vid_cap.release()
+
+    if not speeds:
+        raise ValueError(f"could not find how fast the notes fall in {video_path}")
+
+    return float(np.median(speeds))
+
+
+@telemetry.instrument('calibrate')
+def calibrate(video_path, num_samples=12):
+    """
+    finds the parameters of Frames2MatrixConverter from a few frames of the video, without any input from the user
+    :param video_path: the path of the video
+    :param num_samples: the number of frames to read
+    :return: a dictionary with first_note, first_white_note_col, tenth_white_note_col, read_height, left_hand_color,
+             right_hand_color, background_color and minimum_note_width
+    """
+    frames = read_sample_frames(video_path, num_samples)
+
+    # the middle of the sorted brightnesses of every pixel, which is the same as the median
+    gray_frames = np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames])
+    still_image = np.sort(gray_frames, axis=0)[len(frames) // 2]
+
+    keyboard_top, keyboard_bottom = find_keyboard(still_image)
+    white_key_cols = find_white_keys(still_image, keyboard_top, keyboard_bottom)
+
+    if len(white_key_cols) < 10:
+        raise ValueError(f"only found {len(white_key_cols)} white keys, at least 10 are needed")
+
+    first_note = find_first_note(still_image, keyboard_top, keyboard_bottom, white_key_cols)
+    left_hand_color, right_hand_color, background_color = find_colors(frames, keyboard_top)
+    distance_between_white_notes = (white_key_cols[-1] - white_key_cols[0]) / (len(white_key_cols) - 1)
+
+    parameters = {
+        'first_note': first_note,
+        'first_white_note_col': float(white_key_cols[0]),
+        'tenth_white_note_col': float(white_key_cols[9]),
+        'read_height': find_read_height(frames, keyboard_top, background_color),
+        'left_hand_color': left_hand_color,
+        'right_hand_color': right_hand_color,
+        'background_color': background_color,
+        'minimum_note_width': max(int(distance_between_white_notes / 4), 1),
+    }
+
+    print('*' * 60)
+    for name, value in parameters.items():
+        print(f"{name.replace('_', ' ')}: {value}")
+    print('*' * 60)
+    sys.stdout.flush()
+
+    return parameters
@@ -1,18 +1,51 @@
+import collections
 import concurrent.futures
+import os
 import sys
+import tempfile
 
 import cv2
 import numpy as np
 from tqdm import tqdm
 
+from core import handmatrix, pipeline, telemetry, youtube2frames
+
+# the lookup tables this process has built or loaded most recently, by color_table_bits and colors, so that a process that
+# converts many videos with the same colors (such as a worker of the conversion service) only sets each one up once.
+# An 8 bit table takes 16 MiB, so only the MAX_CACHED_COLOR_TABLES most recently used ones are kept.
+MAX_CACHED_COLOR_TABLES = 8
+_color_tables = collections.OrderedDict()
+
+# the converter and output matrix of a worker process, set up once by _init_worker
+_worker_converter = None
+_worker_hands = None
+
+
+def _init_worker(converter, output_path):
+    global _worker_converter, _worker_hands
+
+    _worker_converter = converter
+    _worker_hands = np.load(output_path, mmap_mode='r+')
+
+
+def _convert_chunk(start, end):
+    """
+    converts frames start up to (not including) end in a worker process, writing them into the output matrix
+    :return: the number of frames converted, and how many of them were skipped for being identical to the frame before
+    """
+    skipped_frames = _worker_converter.number_of_skipped_frames
+    _worker_hands[0, start:end], _worker_hands[1, start:end] = _worker_converter.get_notes_from_frames(start, end)
+    return end - start, _worker_converter.number_of_skipped_frames - skipped_frames
+
 
 class Frames2MatrixConverter:
     def __init__(self, name, frame_dir, num_frames, read_height, first_note, first_white_note_col, tenth_white_note_col,
-                 left_hand_color, right_hand_color, background_color, minimum_note_width):
+                 left_hand_color, right_hand_color, background_color, minimum_note_width, strip_path=None,
+                 color_table_bits=None, color_table_dir=None, num_keys=88, rows_per_frame=1, scroll_speed=None):
         """
         :param name: name of the song
-        :param frame_dir: the directory the frames are in
-        :param num_frames: the number of frames
+        :param frame_dir: the directory the frames are in. Can be None if the frames are streamed with convert_stream
+        :param num_frames: the number of frames (an estimate is enough when using convert_stream)
         :param read_height: the height from which to read notes
         :param first_note: the letter value of the first note (must be capital)
         :param first_white_note_col: column of the first white note
@@ -23,6 +56,20 @@ class Frames2MatrixConverter:
         :param minimum_note_width: maximum gap between white notes accounted for. If the gap is too large, notes can be
                                 skipped as they are perceived as being a note gap instead of an actual note. If the gap
                                 is too small, it will think of some note gaps as actual notes.
+        :param strip_path: path of a strip saved by youtube2frames.save_strip. If given, the frames are read from it
+                           instead of from frame_dir
+        :param color_table_bits: if given, every color is classified with a lookup table built from the three colors
+                                 instead of converting it to LAB. Each channel is quantized to this many bits, so 8 gives
+                                 exactly the same result as converting to LAB and lower values give smaller tables
+        :param color_table_dir: directory in which to cache lookup tables so that they are only built once for each set
+                                of colors. If None, the table is built in memory
+        :param num_keys: the number of keys on the keyboard, starting from the first white note
+        :param rows_per_frame: the number of frames to find the notes of from each frame given to convert_stream. As notes
+                               fall at a constant speed, the row scroll_speed pixels above the read height shows what the
+                               read height will show in the next frame, and so on, so only every rows_per_frame-th frame
+                               needs to be decoded
+        :param scroll_speed: the number of rows the notes fall every frame, see calibrate.estimate_scroll_speed. Only
+                             needed if rows_per_frame is more than 1
         """
 
         self.name = name
@@ -42,41 +89,103 @@ class Frames2MatrixConverter:
         self.right_hand_color_lab = cv2.cvtColor(self.right_hand_color, cv2.COLOR_RGB2LAB).reshape((3,)).astype('int32')
         self.background_color_lab = cv2.cvtColor(self.background_color, cv2.COLOR_RGB2LAB).reshape((3,)).astype('int32')
 
+        self.strip_path = strip_path
+        self._strip = None
+
+        if strip_path is not None:
+            self._strip, strip_info = youtube2frames.load_strip(strip_path)
+            self.strip_top_row = strip_info['top_row']
+
+            if not strip_info['top_row'] < read_height < strip_info['bottom_row'] - 1:
+                raise ValueError(
+                    f"the strip only has rows {strip_info['top_row']} to {strip_info['bottom_row'] - 1}, which does "
+                    f"not include rows {read_height - 1} to {read_height + 1}"
+                )
+
+        self.color_table_bits = color_table_bits
+        self.color_table_path = None
+        self.color_table = None
+
+        if color_table_bits is not None:
+            if not 1 <= color_table_bits <= 8:
+                raise ValueError(f"color_table_bits must be between 1 and 8, not {color_table_bits}")
+
+            if color_table_dir is not None:
+                self.color_table_path = self.get_color_table_path(color_table_dir)
+
+            self.color_table = self.get_cached_color_table()
+
+        self.number_of_keys = num_keys
+        self.note_columns = self.create_note_columns()
         self.column2note = self.create_column2note()
-        self.last_key_number = list(self.column2note.values())[-1]
+        self.last_key_number = self.number_of_keys - 1
 
-    def create_column2note(self):
+        # maps every pixel column of a frame to its note. Built once the width of the frames is known
+        self.column2note_array = np.zeros(shape=(0,), dtype=np.intp)
+
+        # the number of frames whose notes were copied from the frame before because their read bands were identical
+        self.number_of_skipped_frames = 0
+
+        self.rows_per_frame = rows_per_frame
+        self.scroll_speed = scroll_speed
+
+        # the read height of each frame found from a single frame, going up the frame for the frames after it
+        self.read_heights = [read_height]
+
+        if rows_per_frame > 1:
+            if scroll_speed is None:
+                raise ValueError("scroll_speed is needed to read more than one row per frame")
+            if frame_dir is not None or strip_path is not None:
+                raise ValueError("more than one row per frame can only be read from frames given to convert_stream")
+
+            self.read_heights = [int(round(read_height - i * scroll_speed)) for i in range(rows_per_frame)]
+
+            if self.read_heights[-1] < 1:
+                raise ValueError(
+                    f"the notes of {rows_per_frame} frames can not be read from each frame, as they fall "
+                    f"{scroll_speed} rows each frame and the read height is only {read_height}"
+                )
+
+    def create_note_columns(self):
         """
-        creates a dictionary that maps the middle of all the keys to what note number they are
-        :return: a dictionary that maps the middle of all the keys to what note number they are
+        finds the middle of every key on the keyboard
+        :return: a sorted array of the columns of the middle of the keys, with the index being the note number
         """
         distance_between_white_notes = (self.tenth_white_note_col - self.first_white_note_col) / 9
-        white_note_columns = [
-            self.first_white_note_col + distance_between_white_notes * counter for counter in range(60)
-        ]
-        note_columns = []
+        note_columns = [self.first_white_note_col]
+        counter = 0
 
-        for counter in range(1, len(white_note_columns)):
-            last_white_note_col = white_note_columns[counter - 1]
-            this_white_note_col = white_note_columns[counter]
+        while len(note_columns) < self.number_of_keys:
+            counter += 1
+            last_white_note_col = self.first_white_note_col + distance_between_white_notes * (counter - 1)
+            this_white_note_col = self.first_white_note_col + distance_between_white_notes * counter
+            this_white_note = (self.first_note_value + counter) % 7  # A->0, B->1, etc...
 
-            note_columns.append(last_white_note_col)
-
-            if counter % 7 not in [(2 - self.first_note_value) % 7, (5 - self.first_note_value) % 7]:
+            # there is no black note before C or F
+            if this_white_note not in [2, 5]:
                 # if the current white note is B or E
                 # (the black note is closer to this white note than the last white note)
-                if (self.first_note_value + counter) % 7 in [1 - self.first_note_value, 4 - self.first_note_value]:
+                if this_white_note in [1, 4]:
                     approx_black_note_col = (last_white_note_col + 2 * this_white_note_col) / 3
-                # if the current white note is D or G
+                # if the current white note is G
                 # (the black note is closer to the last white note than this white note)
-                elif (self.first_note_value + counter) % 7 in [2 - self.first_note_value, 6 - self.first_note_value]:
+                elif this_white_note == 6:
                     approx_black_note_col = (2 * last_white_note_col + this_white_note_col) / 3
                 else:
                     approx_black_note_col = (last_white_note_col + this_white_note_col) / 2
 
                 note_columns.append(approx_black_note_col)
 
-        column2note = {note_col: note_num for note_num, note_col in enumerate(note_columns)}
+            note_columns.append(this_white_note_col)
+
+        return np.array(note_columns[:self.number_of_keys])
+
+    def create_column2note(self):
+        """
+        creates a dictionary that maps the middle of all the keys to what note number they are
+        :return: a dictionary that maps the middle of all the keys to what note number they are
+        """
+        column2note = {note_col: note_num for note_num, note_col in enumerate(self.note_columns.tolist())}
 
         return column2note
 
@@ -86,37 +195,163 @@ class Frames2MatrixConverter:
         :param pixel_col: the column on the image
         :return: the note the pixel_col corresponds to (numerically)
         """
-        note = self.column2note[min(self.column2note.keys(), key=lambda key: abs(key - pixel_col))]
+        note = int(self.get_notes(np.array([pixel_col]))[0])
 
         return note
 
+    def get_notes(self, pixel_cols):
+        """
+        given an array of columns, returns the note number of the key whose middle is closest to each column. If a column
+        is exactly between two keys, the lower one is returned.
+        :param pixel_cols: an array of columns on the image
+        :return: an array of the notes the pixel_cols correspond to (numerically)
+        """
+        next_key = np.searchsorted(self.note_columns, pixel_cols).clip(1, self.number_of_keys - 1)
+        last_key = next_key - 1
+
+        closer_to_last_key = pixel_cols - self.note_columns[last_key] <= self.note_columns[next_key] - pixel_cols
+
+        return np.where(closer_to_last_key, last_key, next_key)
+
+    def get_column2note_array(self, width):
+        """
+        :param width: the width of the frames
+        :return: an array that maps every pixel column of a frame to its note number
+        """
+        if self.column2note_array.shape[0] != width:
+            self.column2note_array = self.get_notes(np.arange(width))
+
+        return self.column2note_array
+
     def get_hand(self, color):
         """
         takes in a color and finds out which whether its closest to the left hand, the right hand, or the background
         :param color: pixels color in [blue, green, red]
         :return: 0 if not a note, 1 if its left hand, 2 if its right hand
         """
-        color = np.array(color, dtype=np.uint8).reshape((1, 1, 3))
-        color_lab = cv2.cvtColor(color, cv2.COLOR_BGR2LAB).reshape((3,)).astype('int32')
+        return int(self.get_hands(np.array(color, dtype=np.uint8).reshape((1, 3)))[0])
+
+    def get_hands(self, pixels):
+        """
+        finds out whether each pixel is closest to the left hand, the right hand, or the background
+        :param pixels: an array of pixels of any shape with the colors, in [blue, green, red], along the last axis
+        :return: an array with the shape of pixels without its last axis. 0 if not a note, 1 if its left hand, 2 if its
+                 right hand
+        """
+        if self.color_table_bits is None:
+            return self.get_hands_lab(pixels)
+
+        if self.color_table is None:
+            self.color_table = self.get_cached_color_table()
+
+        pixels = np.asarray(pixels, dtype=np.uint8)
+        bits = self.color_table_bits
+        shift = 8 - bits
+
+        # the index into the flattened table, which is faster to gather from than indexing each axis
+        index = (pixels[..., 0] >> shift).astype(np.uint32) << (2 * bits)
+        index |= (pixels[..., 1] >> shift).astype(np.uint32) << bits
+        index |= pixels[..., 2] >> shift
+
+        return self.color_table.reshape(-1)[index]
+
+    def get_hands_lab(self, pixels):
+        """
+        finds out whether each pixel is closest to the left hand, the right hand, or the background, converting all of
+        them to LAB at once
+        :param pixels: an array of pixels of any shape with the colors, in [blue, green, red], along the last axis
+        :return: an array with the shape of pixels without its last axis. 0 if not a note, 1 if its left hand, 2 if its
+                 right hand
+        """
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+
+        # cv2 can not convert an empty image, such as the middles of the notes of frames without any notes
+        if pixels.size == 0:
+            return np.zeros(pixels.shape[:-1], dtype=np.uint8)
+
+        pixels_lab = cv2.cvtColor(pixels.reshape((1, -1, 3)), cv2.COLOR_BGR2LAB).reshape(pixels.shape).astype('int32')
+
+        dist_from_background = ((pixels_lab - self.background_color_lab) ** 2).sum(axis=-1)
+        dist_from_left_hand = ((pixels_lab - self.left_hand_color_lab) ** 2).sum(axis=-1)
+        dist_from_right_hand = ((pixels_lab - self.right_hand_color_lab) ** 2).sum(axis=-1)
+
+        hands = np.zeros(pixels.shape[:-1], dtype=np.uint8)
+        hands[(dist_from_left_hand < dist_from_background) & (dist_from_left_hand < dist_from_right_hand)] = 1
+        hands[(dist_from_right_hand < dist_from_background) & (dist_from_right_hand < dist_from_left_hand)] = 2
+
+        return hands
+
+    def create_color_table(self):
+        """
+        classifies every color at the resolution given by color_table_bits
+        :return: an array indexed by [blue, green, red], each shifted right by 8 - color_table_bits, that holds what
+                 get_hands_lab returns for the middle of that range of colors
+        """
+        levels = 1 << self.color_table_bits
+        step = 256 // levels
+        values = np.arange(levels, dtype=np.uint8) * step + step // 2
 
-        dist_from_background = (color_lab[0] - self.background_color_lab[0]) ** 2 + \
-                               (color_lab[1] - self.background_color_lab[1]) ** 2 + \
-                               (color_lab[2] - self.background_color_lab[2]) ** 2
+        green, red = np.meshgrid(values, values, indexing='ij')
+        table = np.empty((levels, levels, levels), dtype=np.uint8)
 
-        dist_from_left_hand = (color_lab[0] - self.left_hand_color_lab[0]) ** 2 + \
-                              (color_lab[1] - self.left_hand_color_lab[1]) ** 2 + \
-                              (color_lab[2] - self.left_hand_color_lab[2]) ** 2
+        # one blue value at a time so that the LAB distances never take up more than a few MB
+        for blue_index, blue in enumerate(values):
+            table[blue_index] = self.get_hands_lab(np.stack([np.full_like(green, blue), green, red], axis=-1))
 
-        dist_from_right_hand = (color_lab[0] - self.right_hand_color_lab[0]) ** 2 + \
-                               (color_lab[1] - self.right_hand_color_lab[1]) ** 2 + \
-                               (color_lab[2] - self.right_hand_color_lab[2]) ** 2
+        return table
 
-        if dist_from_left_hand < dist_from_background and dist_from_left_hand < dist_from_right_hand:
-            return 1
-        elif dist_from_right_hand < dist_from_background and dist_from_right_hand < dist_from_left_hand:
-            return 2
+    def get_cached_color_table(self):
+        """
+        :return: the lookup table for this converter's colors and color_table_bits, which is only built or loaded if this
+                 process has not done so already
+        """
+        palette = (self.color_table_bits, *(
+            tuple(int(channel) for channel in color.reshape((3,)))
+            for color in [self.left_hand_color, self.right_hand_color, self.background_color]
+        ))
+
+        if palette in _color_tables:
+            _color_tables.move_to_end(palette)
+            return _color_tables[palette]
+
+        if self.color_table_path is None:
+            _color_tables[palette] = self.create_color_table()
         else:
-            return 0
+            _color_tables[palette] = self.load_color_table()
+
+        while len(_color_tables) > MAX_CACHED_COLOR_TABLES:
+            _color_tables.popitem(last=False)
+
+        return _color_tables[palette]
+
+    def get_color_table_path(self, color_table_dir):
+        """
+        :param color_table_dir: the directory the lookup tables are cached in
+        :return: the path of the lookup table for this converter's colors and color_table_bits
+        """
+        colors = [
+            '-'.join(str(channel) for channel in color.reshape((3,)))
+            for color in [self.left_hand_color, self.right_hand_color, self.background_color]
+        ]
+
+        return f'{color_table_dir}/color_table_{self.color_table_bits}bit_{"_".join(colors)}.npy'
+
+    def load_color_table(self):
+        """
+        memory-maps the cached lookup table, creating and saving it first if it was not cached yet
+        :return: the lookup table
+        """
+        if not os.path.exists(self.color_table_path):
+            color_table_dir = os.path.dirname(self.color_table_path)
+            os.makedirs(color_table_dir, exist_ok=True)
+
+            # saved under a temporary name first so that other processes never load a partially written table
+            temp_path = f'{self.color_table_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as file:
+                np.save(file, self.create_color_table())
+            os.replace(temp_path, self.color_table_path)
+
+        return np.load(self.color_table_path, mmap_mode='r')
 
     def get_notes_from_frame(self, frame_num):
         """ takes in an image frame and returns the notes being played in it at the read height
@@ -126,80 +361,336 @@ class Frames2MatrixConverter:
                  being played.
         """
 
-        left_hand_notes = np.zeros(shape=(self.last_key_number,), dtype=np.uint8)
-        right_hand_notes = np.zeros(shape=(self.last_key_number,), dtype=np.uint8)
+        if self.strip_path is not None:
+            return self.get_notes_from_band(self.get_strip_band(frame_num))
 
         image = cv2.imread(f'{self.frame_dir}/frame_{frame_num}.jpg')  # in BGR
 
-        img_row = image[self.read_height:self.read_height + 1, :, :].reshape(-1, 3)
-        img_len = img_row.shape[0]
+        return self.get_notes_from_band(self.get_read_band(image))
+
+    def __getstate__(self):
+        # the memory-mapped strip is reopened by each process instead of being pickled with its data
+        state = self.__dict__.copy()
+        state['_strip'] = None
+
+        # so does a cached lookup table
+        if self.color_table_path is not None:
+            state['color_table'] = None
+
+        return state
+
+    def get_strip_bands(self):
+        """
+        :return: a view of the rows of every frame needed to find the notes in them, read from the strip
+        """
+        if self._strip is None:
+            self._strip = np.load(self.strip_path, mmap_mode='r')
+
+        top = self.read_height - 1 - self.strip_top_row
+        return self._strip[:, top:top + 3]
+
+    def get_strip_band(self, frame_num):
+        """
+        :param frame_num: the frame number to read
+        :return: a view of the rows of the frame needed to find the notes in it, read from the strip
+        """
+        return self.get_strip_bands()[frame_num]
+
+    def get_read_band(self, image):
+        """
+        :param image: a full frame in BGR
+        :return: the rows of the frame needed to find the notes in it (the read height and the rows above and below it)
+        """
+        return image[self.read_height - 1:self.read_height + 2, :, :]
 
-        relevant_part_of_img = [self.get_hand(img_row[i]) for i in range(img_len)]
+    def get_read_bands(self, image):
+        """
+        :param image: a full frame in BGR
+        :return: an array of shape (rows per frame, 3, width, 3) with the read band of the frame and of each of the
+                 frames after it that are found from this frame, copied out of the frame
+        """
+        return np.stack([image[read_height - 1:read_height + 2] for read_height in self.read_heights])
+
+    def denoise(self, hands):
+        """
+        removes pixels that do not have any neighbors that are the same, as they are mistakes
+        :param hands: an array of what each pixel of a row is closest to, along its last axis
+        :return: a copy of hands with the mistakes set to 0
+        """
+        denoised = hands.copy()
+
+        this_pixels = hands[..., 1:-1]
+        isolated = (this_pixels != hands[..., :-2]) & (this_pixels != hands[..., 2:])
+        denoised[..., 1:-1][isolated] = 0
+
+        return denoised
+
+    def get_notes_from_band(self, band):
+        """ takes in the rows around the read height of a frame and returns the notes being played in it
+        :param band: the read height row of a frame along with the rows directly above and below it, in BGR
+        :return: the notes about to be played in the frame as a list. [left hand, right hand] with the hands being an
+                 array with where each note number corresponds with one index and a 1 in the array corresponds to a note
+                 being played.
+        """
+        left_hand_notes, right_hand_notes = self.get_notes_from_bands(band[np.newaxis])
+
+        return left_hand_notes[0], right_hand_notes[0]
+
+    def get_notes_from_bands(self, bands):
+        """
+        takes in the rows around the read height of many frames and returns the notes being played in each of them. Only
+        the first frame of every run of frames with identical read bands is classified, the rest reuse its notes.
+        :param bands: an array of shape (frames, 3, width, 3) with the read height row of each frame along with the rows
+                      directly above and below it, in BGR
+        :return: 2 matrices of shape (frames, number of keys), [left hand, right hand], where a 1 corresponds to a note
+                 being played in that frame.
+        """
+        num_frames = bands.shape[0]
+
+        changed = np.ones(shape=(num_frames,), dtype=bool)
+        if num_frames > 1:
+            changed[1:] = (bands[1:] != bands[:-1]).reshape((num_frames - 1, -1)).any(axis=1)
+        num_skipped = num_frames - int(np.count_nonzero(changed))
+        self.number_of_skipped_frames += num_skipped
+
+        if num_skipped == 0:
+            return self.find_notes_in_bands(bands)
+
+        left_hand_notes, right_hand_notes = self.find_notes_in_bands(bands[changed])
+
+        # the index of the last changed frame at or before every frame
+        runs = np.cumsum(changed) - 1
+
+        return left_hand_notes[runs], right_hand_notes[runs]
+
+    def find_notes_in_bands(self, bands):
+        """ takes in the rows around the read height of many frames and returns the notes being played in each of them.
+        Every step is done on all of the frames at once.
+        :param bands: an array of shape (frames, 3, width, 3) with the read height row of each frame along with the rows
+                      directly above and below it, in BGR
+        :return: 2 matrices of shape (frames, number of keys), [left hand, right hand], where a 1 corresponds to a note
+                 being played in that frame.
+        """
+        num_frames, _, img_len, _ = bands.shape
+
+        left_hand_notes = np.zeros(shape=(num_frames, self.number_of_keys), dtype=np.uint8)
+        right_hand_notes = np.zeros(shape=(num_frames, self.number_of_keys), dtype=np.uint8)
+
+        if img_len < 3:
+            return left_hand_notes, right_hand_notes
+
+        column2note = self.get_column2note_array(img_len)
 
         # De-noising. If a pixel does not have any neighbors that are the same, it is a mistake to be removed.
-        for i in range(1, img_len - 1):
-            this_pixel = relevant_part_of_img[i]
-            last_pixel = relevant_part_of_img[i - 1]
-            next_pixel = relevant_part_of_img[i + 1]
-
-            if this_pixel != last_pixel and this_pixel != next_pixel:
-                relevant_part_of_img[i] = 0
-
-        note_start = 0
-
-        for i in range(1, img_len - 1):
-            this_pixel = relevant_part_of_img[i]
-            last_pixel = relevant_part_of_img[i - 1]
-
-            # this means that a new note begins here
-            if this_pixel != 0 and last_pixel != this_pixel:
-                note_start = i
-
-            # This is where a note ends. Need to calculate middle of the note to find out what note it actually is.
-            # i - notestart > x makes sure that one random pixel being on doesn't cause program to think a note is there
-            if last_pixel != 0 and this_pixel != last_pixel and i - note_start > self.minimum_note_width:
-                mid = int(note_start + (i - note_start) / 2)
-                note = self.get_note(mid)
-                mid_pixel = relevant_part_of_img[mid]
-
-                # means that the last pixel was on the top/bottom row of a note so skip it
-                above_last_note = self.get_hand(image[self.read_height - 1][mid])
-                below_last_note = self.get_hand(image[self.read_height + 1][mid])
-                if above_last_note == 0 or below_last_note == 0:
-                    continue
-
-                if mid_pixel == 1:
-                    left_hand_notes[note] = 1
-                elif mid_pixel == 2:
-                    right_hand_notes[note] = 1
+        relevant_part_of_img = self.denoise(self.get_hands(bands[:, 1]))
+
+        # only the pixels in between the first and last pixel can start or end a note
+        this_pixels = relevant_part_of_img[:, 1:img_len - 1]
+        last_pixels = relevant_part_of_img[:, :img_len - 2]
+
+        # where each note begins, as an index into the flattened rows. The first column of every row can begin a note.
+        note_start_mask = np.empty_like(relevant_part_of_img, dtype=bool)
+        note_start_mask[:, 0] = relevant_part_of_img[:, 0] != 0
+        note_start_mask[:, 1:img_len - 1] = (this_pixels != 0) & (this_pixels != last_pixels)
+        note_start_mask[:, img_len - 1] = False
+        all_note_starts = np.flatnonzero(note_start_mask)
+
+        # This is where a note ends. Need to calculate middle of the note to find out what note it actually is.
+        end_frames, end_columns = np.nonzero((last_pixels != 0) & (this_pixels != last_pixels))
+        end_columns += 1
+        ends = end_frames * img_len + end_columns
+
+        # the last note to begin before the end. If another note begins right where this one ends, the note start has
+        # already moved on to the new note.
+        note_starts = all_note_starts[np.searchsorted(all_note_starts, ends, side='right') - 1]
+        note_starts -= end_frames * img_len
+
+        # i - notestart > x makes sure that one random pixel being on doesn't cause program to think a note is there
+        wide_enough = end_columns - note_starts > self.minimum_note_width
+        end_frames = end_frames[wide_enough]
+        note_starts = note_starts[wide_enough]
+        mids = note_starts + (end_columns[wide_enough] - note_starts) // 2
+
+        # means that the last pixel was on the top/bottom row of a note so skip it
+        on_note = (self.get_hands(bands[end_frames, 0, mids]) != 0) & (self.get_hands(bands[end_frames, 2, mids]) != 0)
+        end_frames = end_frames[on_note]
+        mids = mids[on_note]
+
+        mid_pixels = relevant_part_of_img[end_frames, mids]
+        notes = column2note[mids]
+        left_hand_notes[end_frames[mid_pixels == 1], notes[mid_pixels == 1]] = 1
+        right_hand_notes[end_frames[mid_pixels == 2], notes[mid_pixels == 2]] = 1
 
         return left_hand_notes, right_hand_notes
 
-    def convert(self):
+    def get_notes_from_frames(self, start, end):
+        """
+        :param start: the first frame number to read
+        :param end: the frame number after the last frame to read
+        :return: 2 matrices of shape (end - start, number of keys), [left hand, right hand], where a 1 corresponds to a
+                 note being played in that frame.
+        """
+        if self.strip_path is not None:
+            bands = np.asarray(self.get_strip_bands()[start:end])
+        else:
+            bands = np.stack([
+                self.get_read_band(cv2.imread(f'{self.frame_dir}/frame_{frame_num}.jpg'))  # in BGR
+                for frame_num in range(start, end)
+            ])
+
+        return self.get_notes_from_bands(bands)
+
+    @telemetry.instrument('convert')
+    def convert(self, workers=None, chunk_size=256, compact=False):
         """
-        converts the frames into 2 matrices, one for each hand, that tells when each key is being played
+        converts the frames into 2 matrices, one for each hand, that tells when each key is being played. Each worker
+        process is sent the converter once and then converts chunks of consecutive frames, writing the notes straight
+        into a memory-mapped output matrix.
+        :param workers: the number of worker processes to use. None uses one for each CPU, 1 converts in this process
+        :param chunk_size: the number of consecutive frames a worker converts at a time
+        :param compact: whether to return a HandMatrix for each hand instead of the dense matrices, read from the
+                        memory-mapped output a chunk at a time
         :return: 2 matrices, one for each hand, that tells when each key is being played (0 corresponding to note off
                  1 to note on.) Tells the time in frame number.
         """
-        left_hand = []
-        right_hand = []
-
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            frames = range(self.number_of_frames)
-            results = list(
-                tqdm(
-                    executor.map(self.get_notes_from_frame, frames),
-                    total=len(frames),
-                    file=sys.stdout,
-                    desc="Frames Processed"
-                )
+        chunks = [
+            (start, min(start + chunk_size, self.number_of_frames))
+            for start in range(0, self.number_of_frames, chunk_size)
+        ]
+        self.number_of_skipped_frames = 0
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_path = f'{output_dir}/hands.npy'
+
+            # [left hand, right hand]
+            hands = np.lib.format.open_memmap(
+                output_path, mode='w+', dtype=np.uint8, shape=(2, self.number_of_frames, self.number_of_keys)
             )
 
-            for result in results:
-                left_hand.append(result[0])
-                right_hand.append(result[1])
+            progress_bar = tqdm(total=self.number_of_frames, file=sys.stdout, desc="Frames Processed")
+            telemetry.add_metrics(frames=self.number_of_frames)
+
+            if workers == 1:
+                for start, end in chunks:
+                    hands[0, start:end], hands[1, start:end] = self.get_notes_from_frames(start, end)
+                    progress_bar.update(end - start)
+            else:
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=workers,
+                        initializer=_init_worker,
+                        initargs=(self, output_path)
+                ) as executor:
+                    futures = [executor.submit(_convert_chunk, start, end) for start, end in chunks]
+
+                    for future in concurrent.futures.as_completed(futures):
+                        frames_converted, frames_skipped = future.result()
+                        progress_bar.update(frames_converted)
+                        self.number_of_skipped_frames += frames_skipped
+
+            progress_bar.close()
+            self.report_skipped_frames()
+
+            if compact:
+                left_hand = handmatrix.HandMatrix.from_dense(hands[0])
+                right_hand = handmatrix.HandMatrix.from_dense(hands[1])
+            else:
+                left_hand = np.array(hands[0])
+                right_hand = np.array(hands[1])
+            del hands
+
+        return right_hand, left_hand
+
+    def stream_notes(self, frames, batch_size=1024, max_queued_batches=2):
+        """
+        finds the notes of frames straight from a decoder a batch at a time, without reading any frame files. Only the
+        rows around the read heights of each frame are kept. The frames are decoded and batched in one thread while the
+        notes of the batches before are found in another, with at most max_queued_batches batches waiting in between.
+        :param frames: an iterable of full frames in BGR, in order. When reading more than one row per frame, pairs of
+                       every rows_per_frame-th frame and the number of frames it stands for, see
+                       youtube2frames.stream_frames with with_counts set
+        :param batch_size: the number of frames in each batch
+        :param max_queued_batches: the number of batches that can wait to have their notes found
+        :return: a generator of the left hand and right hand matrices of each batch, in order
+        """
+        number_of_frames = 0
+        self.number_of_skipped_frames = 0
+
+        def get_batches():
+            bands = []
+
+            for frame in frames:
+                if self.rows_per_frame > 1:
+                    # the last frame decoded can have fewer frames after it than rows read from it
+                    image, num_frames = frame
+                    frame_bands = self.get_read_bands(image)[:num_frames]
+                else:
+                    frame_bands = self.get_read_bands(frame)
+
+                # copied so that the rest of the frame is not kept in memory
+                bands.extend(frame_bands)
+
+                if len(bands) >= batch_size:
+                    yield np.stack(bands)
+                    bands = []
+
+            if bands:
+                yield np.stack(bands)
+
+        progress_bar = tqdm(total=self.number_of_frames, file=sys.stdout, desc="Frames Processed")
 
-        left_hand = np.array(left_hand).reshape((self.number_of_frames, self.last_key_number))
-        right_hand = np.array(right_hand).reshape((self.number_of_frames, self.last_key_number))
+        try:
+            for left_hand_notes, right_hand_notes in pipeline.run_pipeline(
+                    get_batches(), [self.get_notes_from_bands], max_queue_size=max_queued_batches
+            ):
+                number_of_frames += len(left_hand_notes)
+                progress_bar.update(len(left_hand_notes))
+                telemetry.add_metrics(frames=len(left_hand_notes))
+
+                yield left_hand_notes, right_hand_notes
+        finally:
+            progress_bar.close()
+
+        self.number_of_frames = number_of_frames
+        self.report_skipped_frames()
+
+    @telemetry.instrument('convert_stream')
+    def convert_stream(self, frames, batch_size=1024, max_queued_batches=2, compact=False):
+        """
+        converts frames straight from a decoder into 2 matrices, one for each hand, a batch at a time, see stream_notes
+        :param frames: an iterable of full frames in BGR, in order. When reading more than one row per frame, pairs of
+                       every rows_per_frame-th frame and the number of frames it stands for, see stream_notes
+        :param batch_size: the number of frames in each batch
+        :param max_queued_batches: the number of batches that can wait to have their notes found
+        :param compact: whether to return a HandMatrix for each hand instead of the dense matrices. The notes of each
+                        batch are added to them as it is converted, so the dense matrices are never made
+        :return: 2 matrices, one for each hand, that tells when each key is being played (0 corresponding to note off
+                 1 to note on.) Tells the time in frame number.
+        """
+        if compact:
+            left_hand = handmatrix.HandMatrixBuilder(self.number_of_keys)
+            right_hand = handmatrix.HandMatrixBuilder(self.number_of_keys)
+        else:
+            left_hand = []
+            right_hand = []
+
+        for left_hand_notes, right_hand_notes in self.stream_notes(frames, batch_size, max_queued_batches):
+            left_hand.append(left_hand_notes)
+            right_hand.append(right_hand_notes)
+
+        if compact:
+            left_hand = left_hand.build()
+            right_hand = right_hand.build()
+        else:
+            left_hand = np.concatenate(left_hand) if left_hand else np.zeros((0, self.number_of_keys), dtype=np.uint8)
+            right_hand = np.concatenate(right_hand) if right_hand else np.zeros((0, self.number_of_keys), dtype=np.uint8)
 
         return right_hand, left_hand
+
+    def report_skipped_frames(self):
+        """
+        records the number of frames skipped in the metrics of the stage, and prints it if any were
+        """
+        if self.number_of_skipped_frames > 0:
+            print(f'Skipped {self.number_of_skipped_frames}/{self.number_of_frames} frames that were identical to the '
+                  f'frame before them')
+        telemetry.add_metrics(skipped_frames=self.number_of_skipped_frames)
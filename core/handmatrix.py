@@ -0,0 +1,243 @@
+import numpy as np
+
+# a key being played from the start frame up to, but not including, the end frame
+INTERVAL_DTYPE = np.dtype([('key', np.int16), ('start', np.int32), ('end', np.int32)])
+
+
+def pack_rows(hand):
+    """
+    :param hand: a matrix of shape (frames, keys) where anything other than 0 is a note being played
+    :return: a matrix of shape (frames, ceil(keys / 8)) with the keys of each frame packed into the bits of its bytes
+    """
+    return np.packbits(np.asarray(hand) != 0, axis=1)
+
+
+def unpack_rows(packed, num_keys):
+    """
+    :param packed: a matrix made by pack_rows
+    :param num_keys: the number of keys of the matrix that was packed
+    :return: the matrix of shape (frames, keys) of 0s and 1s that was packed
+    """
+    return np.unpackbits(packed, axis=1, count=num_keys)
+
+
+class HandMatrix:
+    def __init__(self, intervals, num_frames, num_keys):
+        """
+        the notes played by a hand as a list of the frames each key is played for, which takes a fraction of the memory
+        of the dense matrix of frames by keys as most of that matrix is zeros. Acts as the dense matrix when given to
+        numpy, and slicing it gives the dense rows of those frames only.
+        :param intervals: a structured array of INTERVAL_DTYPE sorted by key, then start, where the intervals of a key
+                          never touch or overlap
+        :param num_frames: the number of frames of the matrix
+        :param num_keys: the number of keys of the matrix
+        """
+        self.intervals = intervals
+        self.num_frames = num_frames
+        self.num_keys = num_keys
+
+    @property
+    def shape(self):
+        return self.num_frames, self.num_keys
+
+    def __len__(self):
+        return self.num_frames
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            rows, columns = item[0], item[1:]
+        else:
+            rows, columns = item, ()
+
+        if isinstance(rows, slice) and rows.step in [None, 1]:
+            start, end, _ = rows.indices(self.num_frames)
+            dense = self.to_dense(start, max(start, end))
+        else:
+            # only the frames between the first and last frames asked for are made dense
+            frame_nums = np.arange(self.num_frames)[rows]
+
+            if np.ndim(frame_nums) == 0:
+                return self.to_dense(frame_nums, frame_nums + 1)[0][columns]
+            if frame_nums.size == 0:
+                dense = np.zeros(frame_nums.shape + (self.num_keys,), dtype=np.uint8)
+            else:
+                start = frame_nums.min()
+                dense = self.to_dense(start, frame_nums.max() + 1)[frame_nums - start]
+
+        return dense[(slice(None), *columns)] if columns else dense
+
+    def __eq__(self, other):
+        if isinstance(other, HandMatrix):
+            return self.shape == other.shape and np.array_equal(self.intervals, other.intervals)
+        return NotImplemented
+
+    @classmethod
+    def from_dense(cls, hand, chunk_size=4096):
+        """
+        :param hand: a matrix (or memory-mapped matrix) of shape (frames, keys) where anything other than 0 is a note
+                     being played
+        :param chunk_size: the number of frames to read at a time, so a memory-mapped matrix is never loaded all at once
+        :return: the HandMatrix of the matrix
+        """
+        builder = HandMatrixBuilder(hand.shape[1])
+
+        for start in range(0, hand.shape[0], chunk_size):
+            builder.append(hand[start:start + chunk_size])
+
+        return builder.build()
+
+    @classmethod
+    def from_packed(cls, packed, num_keys, chunk_size=4096):
+        """
+        :param packed: a matrix made by pack_rows
+        :param num_keys: the number of keys of the matrix that was packed
+        :param chunk_size: the number of frames to unpack at a time
+        :return: the HandMatrix of the matrix that was packed
+        """
+        builder = HandMatrixBuilder(num_keys)
+
+        for start in range(0, packed.shape[0], chunk_size):
+            builder.append(unpack_rows(packed[start:start + chunk_size], num_keys))
+
+        return builder.build()
+
+    def to_dense(self, start=0, end=None):
+        """
+        :param start: the first frame to return
+        :param end: the frame after the last frame to return, or None for the last frame of the matrix
+        :return: the matrix of shape (end - start, keys) of 0s and 1s of those frames
+        """
+        end = self.num_frames if end is None else end
+
+        starts = np.clip(self.intervals['start'], start, end) - start
+        ends = np.clip(self.intervals['end'], start, end) - start
+        keys = self.intervals['key'].astype(np.intp)
+        overlapping = starts < ends
+
+        # +1 where a key turns on and -1 where it turns off, so the running sum down each column is the key's state
+        changes = np.zeros((end - start + 1, self.num_keys), dtype=np.int8)
+        np.add.at(changes, (starts[overlapping], keys[overlapping]), 1)
+        np.add.at(changes, (ends[overlapping], keys[overlapping]), -1)
+
+        return np.cumsum(changes[:-1], axis=0, dtype=np.int8).astype(np.uint8)
+
+    def to_packed(self, start=0, end=None):
+        """
+        :param start: the first frame to pack
+        :param end: the frame after the last frame to pack, or None for the last frame of the matrix
+        :return: the rows of those frames packed by pack_rows
+        """
+        return pack_rows(self.to_dense(start, end))
+
+    def get_changes(self):
+        """
+        finds the same changes matrix2csv.get_events finds in the dense matrix: the state of every key on the first
+        frame, then every frame a key turns on or off on. A change on the very last frame is never recorded.
+        :return: the frame numbers, key numbers and new states (1 for on, 0 for off) of the changes, in no order
+        """
+        if self.num_frames <= 1:
+            empty = np.zeros((0,), dtype=np.intp)
+            return empty, empty, np.zeros((0,), dtype=np.uint8)
+
+        last_frame = self.num_frames - 1
+        keys = self.intervals['key'].astype(np.intp)
+        starts = self.intervals['start']
+        ends = self.intervals['end']
+
+        first_states = np.zeros((self.num_keys,), dtype=np.uint8)
+        first_states[keys[starts == 0]] = 1
+
+        on = (starts > 0) & (starts < last_frame)
+        off = (ends > 0) & (ends < last_frame)
+
+        frame_nums = np.concatenate([np.zeros((self.num_keys,), dtype=np.int64), starts[on], ends[off]])
+        note_nums = np.concatenate([np.arange(self.num_keys), keys[on], keys[off]])
+        states = np.concatenate([
+            first_states,
+            np.ones((np.count_nonzero(on),), dtype=np.uint8),
+            np.zeros((np.count_nonzero(off),), dtype=np.uint8)
+        ])
+
+        return frame_nums, note_nums, states
+
+    def save(self, path):
+        """
+        :param path: the path of the .npz file to save the matrix in
+        """
+        np.savez_compressed(
+            path, intervals=self.intervals, num_frames=self.num_frames, num_keys=self.num_keys
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: the path of a .npz file saved by save, or of a .npy file of a dense matrix
+        :return: the HandMatrix saved in the file
+        """
+        if path.endswith('.npy'):
+            return cls.from_dense(np.load(path, mmap_mode='r'))
+
+        with np.load(path) as file:
+            return cls(file['intervals'], int(file['num_frames']), int(file['num_keys']))
+
+
+class HandMatrixBuilder:
+    def __init__(self, num_keys):
+        """
+        builds a HandMatrix from consecutive chunks of frames of the dense matrix, so the whole dense matrix is never
+        held in memory. A key played across the end of one chunk and the start of the next is one interval.
+        :param num_keys: the number of keys of the matrix
+        """
+        self.num_keys = num_keys
+        self.num_frames = 0
+        self.last_row = np.zeros((num_keys,), dtype=np.int8)
+        self.starts = []
+        self.ends = []
+
+    def append(self, chunk):
+        """
+        :param chunk: a matrix of shape (frames, keys) of the frames after the ones appended so far, where anything
+                      other than 0 is a note being played
+        """
+        chunk = (np.asarray(chunk) != 0).astype(np.int8)
+        if chunk.shape[0] == 0:
+            return
+
+        changes = np.diff(np.concatenate([self.last_row[np.newaxis], chunk]), axis=0)
+
+        frame_nums, key_nums = np.nonzero(changes == 1)
+        self.starts.append((frame_nums + self.num_frames, key_nums))
+        frame_nums, key_nums = np.nonzero(changes == -1)
+        self.ends.append((frame_nums + self.num_frames, key_nums))
+
+        self.num_frames += chunk.shape[0]
+        self.last_row = chunk[-1]
+
+    def build(self):
+        """
+        :return: the HandMatrix of every chunk appended
+        """
+        # the keys still being played on the last frame are played until the end
+        still_on = np.nonzero(self.last_row)[0]
+        ends = self.ends + [(np.full(still_on.shape, self.num_frames), still_on)]
+
+        empty = np.zeros((0,), dtype=np.intp)
+        start_frames = np.concatenate([empty] + [frame_nums for frame_nums, _ in self.starts])
+        start_keys = np.concatenate([empty] + [key_nums for _, key_nums in self.starts])
+        end_frames = np.concatenate([frame_nums for frame_nums, _ in ends])
+        end_keys = np.concatenate([key_nums for _, key_nums in ends])
+
+        # the starts and ends of a key alternate, so sorting both by key, then frame, pairs them up
+        start_order = np.lexsort((start_frames, start_keys))
+        end_order = np.lexsort((end_frames, end_keys))
+
+        intervals = np.empty(start_order.shape[0], dtype=INTERVAL_DTYPE)
+        intervals['key'] = start_keys[start_order]
+        intervals['start'] = start_frames[start_order]
+        intervals['end'] = end_frames[end_order]
+
+        return HandMatrix(intervals, self.num_frames, self.num_keys)
@@ -1,73 +1,111 @@
-def get_lines_from(hand, track_num, fps, ticks_per_ms):
+import numpy as np
+
+from core import handmatrix, telemetry
+
+LOWEST_NOTE = 21  # the midi note number of the first key (A0)
+
+# constants used to calculate timing
+PPQ = 1800  # clock pulses per quarter note
+BPM = 100  # quarter notes per minute
+TEMPO = int(60000000 / BPM)
+TICKS_PER_MS = (BPM * PPQ) / 60000
+
+# a note turning on or off at a tick. note is the midi note number
+EVENT_DTYPE = np.dtype([('tick', np.int64), ('note', np.int16), ('on', np.bool_)])
+
+
+def get_events(hand, fps, ticks_per_ms):
     """
-    goes through a hand array and converts its information into the form required for the csv file
-    :param hand: a matrix that has the information of what is being played by a hand
-    :param track_num: what track number to give this hand
+    finds every time a key of a hand turns on or off, using one comparison of each frame with the last over the whole
+    matrix
+    :param hand: a matrix that has the information of what is being played by a hand, or its HandMatrix, whose
+                 intervals are turned into events without making the dense matrix
     :param fps: frames per second of the video downloaded. Used to calculate the time at which a note should be played
     :param ticks_per_ms: number of ticks that occur per millisecond
-    :return: a list of lines to be put into the csv for the hand given
+    :return: a structured array of EVENT_DTYPE sorted by tick, then note. The state of every key is recorded at tick 0.
     """
+    if isinstance(hand, handmatrix.HandMatrix):
+        frame_nums, note_nums, states = hand.get_changes()
+    else:
+        hand = np.asarray(hand)
+        num_frames = hand.shape[0]
 
-    def to_intervals(array):
-        in_intervals = []
+        # the state of each key on the first frame, then every frame a key changes on. A change on the very last frame
+        # is never recorded as nothing comes after it.
+        changes = np.zeros(hand.shape, dtype=bool)
+        if num_frames > 1:
+            changes[0] = True
+            changes[1:num_frames - 1] = np.diff(hand[:num_frames - 1], axis=0) != 0
 
-        for column_index in range(array.shape[1]):
-            col = array[:, column_index]
-            new = []
-            count = 1
+        frame_nums, note_nums = np.nonzero(changes)
+        states = hand[frame_nums, note_nums]
 
-            for i in range(1, col.shape[0]):
-                if col[i] == col[i - 1]:
-                    count += 1
-                    if i == col.shape[0] - 1:  # if on the last element of column. have to record now.
-                        new.append([col[i], count])
-                else:
-                    new.append([col[i - 1], count])
-                    count = 1
+    return get_events_from_changes(frame_nums, note_nums, states, fps, ticks_per_ms)
 
-            in_intervals.append(new)
 
-        return in_intervals
+def get_ticks(frame_nums, fps, ticks_per_ms):
+    """
+    :param frame_nums: an array of frame numbers
+    :param fps: frames per second of the video downloaded
+    :param ticks_per_ms: number of ticks that occur per millisecond
+    :return: the tick each frame starts at
+    """
+    seconds = frame_nums / fps
+    milliseconds = seconds * 1000
+    return (milliseconds * ticks_per_ms).astype(np.int64)
 
-    def to_abs(array):
-        in_abs = []
 
-        for note in array:
-            new = []
-            time_count = 0
-            for occurrence in note:
-                new.append([occurrence[0], time_count])
-                time_count += occurrence[1]
-            in_abs.append(new)
+def get_events_from_changes(frame_nums, note_nums, states, fps, ticks_per_ms):
+    """
+    :param frame_nums: the frame numbers of the changes of the keys of a hand
+    :param note_nums: the key numbers of the changes
+    :param states: the state each key changes to
+    :param fps: frames per second of the video downloaded. Used to calculate the time at which a note should be played
+    :param ticks_per_ms: number of ticks that occur per millisecond
+    :return: a structured array of EVENT_DTYPE sorted by tick, then note, then frame
+    """
+    # only 0 (note off) and 1 (note on) are events
+    is_event = (states == 0) | (states == 1)
+    frame_nums = frame_nums[is_event]
+    note_nums = note_nums[is_event]
+    states = states[is_event]
 
-        return in_abs
+    ticks = get_ticks(frame_nums, fps, ticks_per_ms)
 
-    hand = to_abs(to_intervals(hand))
+    order = np.lexsort((frame_nums, note_nums, ticks))
 
-    lines = []
+    events = np.empty(order.shape[0], dtype=EVENT_DTYPE)
+    events['tick'] = ticks[order]
+    events['note'] = note_nums[order] + LOWEST_NOTE
+    events['on'] = states[order] == 1
+
+    return events
 
-    for note_num in range(len(hand)):
-        note = hand[note_num]
-        for record in note:
-            frame_num = record[1]
-            second = frame_num / fps
-            millisecond = second * 1000
-            tick = int(millisecond * ticks_per_ms)
 
-            if record[0] == 0:  # note off event
-                lines.append(f"{track_num}, {tick}, Note_off_c, 0, {note_num + 21}, 0\n")
-            elif record[0] == 1:  # note on event
-                lines.append(f"{track_num}, {tick}, Note_on_c, 0, {note_num + 21}, 127\n")
+def get_lines_from(hand, track_num, fps, ticks_per_ms):
+    """
+    goes through a hand array and converts its information into the form required for the csv file
+    :param hand: a matrix that has the information of what is being played by a hand
+    :param track_num: what track number to give this hand
+    :param fps: frames per second of the video downloaded. Used to calculate the time at which a note should be played
+    :param ticks_per_ms: number of ticks that occur per millisecond
+    :return: a list of lines to be put into the csv for the hand given, sorted by tick
+    """
+    lines = []
+
+    for tick, note, on in get_events(hand, fps, ticks_per_ms).tolist():
+        if on:  # note on event
+            lines.append(f"{track_num}, {tick}, Note_on_c, 0, {note}, 127\n")
+        else:  # note off event
+            lines.append(f"{track_num}, {tick}, Note_off_c, 0, {note}, 0\n")
 
     return lines
 
 
+@telemetry.instrument('matrix_to_csv')
 def matrix_to_csv(left_hand_array, right_hand_array, fps):
-    # constants used to calculate timing
-    PPQ = 1800  # clock pulses per quarter note
-    BPM = 100  # quarter notes per minute
-    TEMPO = int(60000000 / BPM)
-    ticks_per_ms = (BPM * PPQ) / 60000
+    ticks_per_ms = TICKS_PER_MS
+    telemetry.add_metrics(frames=len(right_hand_array))
 
     right_hand_lines = [
         "1, 0, Start_track\n",
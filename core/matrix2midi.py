@@ -0,0 +1,404 @@
+import bisect
+import shutil
+import struct
+
+import numpy as np
+
+from core import telemetry
+from core.matrix2csv import EVENT_DTYPE, PPQ, TEMPO, TICKS_PER_MS, get_events, get_events_from_changes, get_ticks
+
+END_OF_TRACK_DELAY = 5000  # ticks between the last note event and the end of a track
+HEADER_LENGTH = 14  # bytes in the header chunk of a midi file
+TRACK_LENGTH_OFFSET = HEADER_LENGTH + 4  # where the length of the first track is written in a midi file
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+
+
+def encode_variable_length(value):
+    """
+    :param value: a non-negative integer
+    :return: the value as a midi variable-length quantity (7 bits per byte, most significant first)
+    """
+    encoded = [value & 0x7F]
+    value >>= 7
+
+    while value:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    return bytes(reversed(encoded))
+
+
+def get_track_start(title):
+    """
+    :param title: the name of the track
+    :return: the events at the start of a track, before its notes
+    """
+    title = title.encode('latin-1')
+
+    data = bytearray()
+    data += b'\x00\xff\x03' + encode_variable_length(len(title)) + title
+    data += b'\x00\xff\x51\x03' + TEMPO.to_bytes(3, 'big')
+
+    return bytes(data)
+
+
+def encode_events(events, last_tick=0, running_status=None):
+    """
+    :param events: a structured array of matrix2csv.EVENT_DTYPE sorted by tick
+    :param last_tick: the tick of the event before the first one, to take the first delta time from
+    :param running_status: the status byte of the event before the first one, or None if there is none
+    :return: the bytes of the events, the tick of the last event and the status byte of the last event
+    """
+    data = bytearray()
+
+    for tick, note, on in events.tolist():
+        status = NOTE_ON if on else NOTE_OFF
+        data += encode_variable_length(tick - last_tick)
+
+        # running status: the status byte is left out when it is the same as the last event's
+        if status != running_status:
+            data.append(status)
+            running_status = status
+
+        data.append(note)
+        data.append(127 if on else 0)
+        last_tick = tick
+
+    return bytes(data), last_tick, running_status
+
+
+def get_track_end():
+    """
+    :return: the end of track event, which comes END_OF_TRACK_DELAY ticks after the last note event
+    """
+    return encode_variable_length(END_OF_TRACK_DELAY) + b'\xff\x2f\x00'
+
+
+def get_track_chunk(title, events):
+    """
+    builds a midi track from the note events of a hand
+    :param title: the name of the track
+    :param events: a structured array of matrix2csv.EVENT_DTYPE sorted by tick
+    :return: the bytes of the track chunk, with its header
+    """
+    data = get_track_start(title) + encode_events(events)[0] + get_track_end()
+
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+
+def get_header(num_tracks):
+    """
+    :param num_tracks: the number of tracks in the midi file
+    :return: the header chunk of a type 1 standard midi file
+    """
+    return b'MThd' + struct.pack('>IHHH', 6, 1, num_tracks, PPQ)
+
+
+def get_midi(tracks):
+    """
+    :param tracks: a list of track chunks made by get_track_chunk
+    :return: the bytes of a type 1 standard midi file with the tracks
+    """
+    return get_header(len(tracks)) + b''.join(tracks)
+
+
+@telemetry.instrument('matrix_to_midi')
+def matrix_to_midi(left_hand_array, right_hand_array, fps):
+    """
+    converts the matrices of both hands straight into midi files, without going through csv
+    :param left_hand_array: a matrix that has the information of what is being played by the left hand
+    :param right_hand_array: a matrix that has the information of what is being played by the right hand
+    :param fps: frames per second of the video downloaded. Used to calculate the time at which a note should be played
+    :return: the bytes of 3 midi files: the full song, the right hand only and the left hand only
+    """
+    telemetry.add_metrics(frames=len(right_hand_array))
+
+    right_hand_track = get_track_chunk("Right Hand", get_events(right_hand_array, fps, TICKS_PER_MS))
+    left_hand_track = get_track_chunk("Left Hand", get_events(left_hand_array, fps, TICKS_PER_MS))
+
+    full_midi = get_midi([right_hand_track, left_hand_track])
+    right_midi = get_midi([right_hand_track])
+    left_midi = get_midi([left_hand_track])
+
+    return full_midi, right_midi, left_midi
+
+
+class EventEmitter:
+    def __init__(self, fps, ticks_per_ms=TICKS_PER_MS):
+        """
+        finds the note events of a hand a chunk of frames at a time, keeping only the last 2 frames and the events that
+        could still be reordered by the frames to come. The events are the same, in the same order, as get_events
+        finds in the whole matrix.
+        :param fps: frames per second of the video downloaded. Used to calculate the time at which a note should be played
+        :param ticks_per_ms: number of ticks that occur per millisecond
+        """
+        self.fps = fps
+        self.ticks_per_ms = ticks_per_ms
+        self.num_frames = 0
+        self.last_rows = None
+        self.pending = np.zeros((0,), dtype=EVENT_DTYPE)
+
+    def append(self, hand):
+        """
+        :param hand: a matrix of shape (frames, keys) of the frames after the ones appended so far
+        :return: a structured array of EVENT_DTYPE of the events that can no longer change, sorted by tick, then note
+        """
+        hand = np.asarray(hand)
+        if hand.shape[0] == 0:
+            return np.zeros((0,), dtype=EVENT_DTYPE)
+
+        rows = hand if self.last_rows is None else np.concatenate([self.last_rows, hand])
+        first_frame_num = self.num_frames - (0 if self.last_rows is None else self.last_rows.shape[0])
+        self.num_frames += hand.shape[0]
+
+        # whether a key changes on a frame can only be known once the frame after it has come, as a change on the very
+        # last frame is never recorded, so the changes are found for every frame but the last
+        start = max(self.num_frames - hand.shape[0] - 1, 0) - first_frame_num
+        end = rows.shape[0] - 1
+
+        changes = np.zeros((end - start, rows.shape[1]), dtype=bool)
+        if end > start and first_frame_num + start == 0:
+            changes[0] = True
+            changes[1:] = rows[start + 1:end] != rows[start:end - 1]
+        elif end > start:
+            changes[:] = rows[start:end] != rows[start - 1:end - 1]
+
+        frame_nums, note_nums = np.nonzero(changes)
+        states = rows[start:end][frame_nums, note_nums]
+        frame_nums += first_frame_num + start
+
+        events = np.concatenate([
+            self.pending, get_events_from_changes(frame_nums, note_nums, states, self.fps, self.ticks_per_ms)
+        ])
+        # the pending events come from earlier frames than the new events, so they go first within a tick and note
+        events = events[np.lexsort((np.arange(events.shape[0]), events['note'], events['tick']))]
+
+        # events on the same tick as the last frame could still have events of the frames to come put before them
+        last_tick = get_ticks(np.array([self.num_frames - 1]), self.fps, self.ticks_per_ms)[0]
+        is_final = events['tick'] < last_tick
+        self.pending = events[~is_final]
+        self.last_rows = rows[-2:]
+
+        return events[is_final]
+
+    def finish(self):
+        """
+        :return: a structured array of EVENT_DTYPE of the events that were still pending, sorted by tick, then note
+        """
+        events = self.pending
+        self.pending = np.zeros((0,), dtype=EVENT_DTYPE)
+        return events
+
+
+class TrackFile:
+    def __init__(self, path, title):
+        """
+        a midi file with a single track that note events are added to as they are found. The end of the track is
+        written after every flush, so the file can be read while it is still being added to.
+        :param path: the path of the midi file
+        :param title: the name of the track
+        """
+        self.file = open(path, 'w+b')
+        self.file.write(get_header(1) + b'MTrk' + struct.pack('>I', 0))
+        self.data_length = 0
+        self.last_tick = 0
+        self.running_status = None
+
+        self.write_data(get_track_start(title))
+        self.flush()
+
+    def write_data(self, data):
+        self.file.write(data)
+        self.data_length += len(data)
+
+    def write(self, events):
+        """
+        :param events: a structured array of matrix2csv.EVENT_DTYPE sorted by tick, coming after the events written so far
+        """
+        data, self.last_tick, self.running_status = encode_events(events, self.last_tick, self.running_status)
+        self.write_data(data)
+
+    def flush(self):
+        """
+        writes the end of the track and the length of the track, then goes back to before the end of the track
+        """
+        end = get_track_end()
+        self.file.write(end)
+        self.file.seek(TRACK_LENGTH_OFFSET)
+        self.file.write(struct.pack('>I', self.data_length + len(end)))
+        self.file.seek(TRACK_LENGTH_OFFSET + 4 + self.data_length)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class MidiStreamWriter:
+    def __init__(self, full_path, right_path, left_path, fps):
+        """
+        writes the midi files of both hands as the notes of each chunk of frames are found, with memory that does not
+        grow with the length of the video. The files are the same as the ones matrix_to_midi makes from the whole
+        matrices. The right hand and left hand files can be read while they are being written, and the full song is put
+        together from them once the last frame has come.
+        :param full_path: the path of the midi file of the full song
+        :param right_path: the path of the midi file of the right hand only
+        :param left_path: the path of the midi file of the left hand only
+        :param fps: frames per second of the video downloaded. Used to calculate the time at which a note should be played
+        """
+        self.full_path = full_path
+        self.right_hand = (EventEmitter(fps), TrackFile(right_path, "Right Hand"))
+        self.left_hand = (EventEmitter(fps), TrackFile(left_path, "Left Hand"))
+        self.num_frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, left_hand_array, right_hand_array):
+        """
+        :param left_hand_array: a matrix of the left hand of the frames after the ones appended so far
+        :param right_hand_array: a matrix of the right hand of the same frames
+        """
+        for (emitter, track_file), hand in [(self.right_hand, right_hand_array), (self.left_hand, left_hand_array)]:
+            track_file.write(emitter.append(hand))
+            track_file.flush()
+
+        self.num_frames += len(right_hand_array)
+
+    def close(self):
+        for emitter, track_file in [self.right_hand, self.left_hand]:
+            track_file.write(emitter.finish())
+            track_file.close()
+
+        # the track chunks of the hands come after the header of their files
+        with open(self.full_path, 'wb') as full_file:
+            full_file.write(get_header(2))
+
+            for _, track_file in [self.right_hand, self.left_hand]:
+                with open(track_file.file.name, 'rb') as hand_file:
+                    hand_file.seek(HEADER_LENGTH)
+                    shutil.copyfileobj(hand_file, full_file)
+
+
+def read_variable_length(data, position):
+    """
+    :param data: the bytes of a midi track
+    :param position: where the variable-length quantity starts
+    :return: the value and the position after it
+    """
+    value = 0
+
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+
+        if not byte & 0x80:
+            return value, position
+
+
+def read_midi_notes(midi_path):
+    """
+    reads the notes of every track of a standard midi file, such as one to compare the notes found with
+    :param midi_path: the path of the midi file
+    :return: a list of the notes as (midi note number, start in seconds, end in seconds, track number), sorted by start
+    """
+    with open(midi_path, 'rb') as file:
+        data = file.read()
+
+    if data[:4] != b'MThd':
+        raise ValueError(f"{midi_path} is not a midi file")
+
+    header_length, _, num_tracks, division = struct.unpack('>IHHH', data[4:14])
+    if division & 0x8000:
+        raise ValueError(f"{midi_path} uses SMPTE time, only ticks per quarter note are supported")
+
+    # (tick, track number, note number, whether it turns on) of every note event, and (tick, tempo) of every tempo event.
+    # Until the first tempo event, the tempo is the default of 120 bpm.
+    note_events = []
+    tempo_events = [(0, 500000)]
+    # the last tick of each track, at which the notes still playing end
+    track_end_ticks = {}
+
+    position = 8 + header_length
+    for track_num in range(num_tracks):
+        chunk_type = data[position:position + 4]
+        chunk_length = struct.unpack('>I', data[position + 4:position + 8])[0]
+        position += 8
+        end = position + chunk_length
+
+        if chunk_type != b'MTrk':
+            position = end
+            continue
+
+        tick = 0
+        status = None
+
+        while position < end:
+            delta, position = read_variable_length(data, position)
+            tick += delta
+
+            if data[position] & 0x80:
+                status = data[position]
+                position += 1
+            elif status is None:
+                raise ValueError(f"Track {track_num} of {midi_path} has a data byte at byte {position} with no status "
+                                 f"before it to run on")
+
+            if status == 0xFF:
+                meta_type = data[position]
+                length, position = read_variable_length(data, position + 1)
+                if meta_type == 0x51:
+                    tempo_events.append((tick, int.from_bytes(data[position:position + 3], 'big')))
+                position += length
+                # meta events and sysex events cancel running status
+                status = None
+            elif status in [0xF0, 0xF7]:
+                length, position = read_variable_length(data, position)
+                position += length
+                status = None
+            elif status & 0xF0 in [NOTE_ON, NOTE_OFF]:
+                note, velocity = data[position], data[position + 1]
+                position += 2
+                note_events.append((tick, track_num, note, status & 0xF0 == NOTE_ON and velocity > 0))
+            elif status & 0xF0 in [0xC0, 0xD0]:
+                position += 1
+            else:
+                position += 2
+
+        position = end
+        track_end_ticks[track_num] = tick
+
+    # the seconds at which each tempo starts, to turn ticks into seconds. The sort is stable and by tick only, so a tempo
+    # set at tick 0 comes after the default and replaces it, and tempos at the same tick keep the order of the file
+    tempo_events.sort(key=lambda tempo_event: tempo_event[0])
+    tempo_ticks = [tempo_tick for tempo_tick, _ in tempo_events]
+    tempo_seconds = [0.0]
+    for (last_tick, last_tempo), (tempo_tick, _) in zip(tempo_events, tempo_events[1:]):
+        tempo_seconds.append(tempo_seconds[-1] + (tempo_tick - last_tick) * last_tempo / division / 1000000)
+
+    def get_seconds(event_tick):
+        i = bisect.bisect_right(tempo_ticks, event_tick) - 1
+        return tempo_seconds[i] + (event_tick - tempo_ticks[i]) * tempo_events[i][1] / division / 1000000
+
+    notes = []
+    started = {}
+
+    for tick, track_num, note, on in sorted(note_events, key=lambda event: event[0]):
+        key = (track_num, note)
+
+        if key in started:
+            notes.append((note, get_seconds(started.pop(key)), get_seconds(tick), track_num))
+        if on:
+            started[key] = tick
+
+    # notes that are never turned off, like the ones still held at the end of the converter's own files
+    for (track_num, note), tick in started.items():
+        notes.append((note, get_seconds(tick), get_seconds(max(tick, track_end_ticks[track_num])), track_num))
+
+    return sorted(notes, key=lambda midi_note: midi_note[1])
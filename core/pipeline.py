@@ -0,0 +1,104 @@
+import queue
+import threading
+
+# how often a blocked stage checks whether the pipeline was stopped, in seconds
+POLL_INTERVAL = 0.1
+
+# put into a queue after the last item
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        """
+        passed down the pipeline in place of an item when a stage fails, so the error is raised to the consumer
+        :param error: the exception the stage raised
+        """
+        self.error = error
+
+
+def run_pipeline(source, stages, max_queue_size=2):
+    """
+    runs the iteration of the source and every stage in their own threads, connected by queues that hold at most
+    max_queue_size items. A stage that gets ahead waits for the stages after it, so memory stays flat while the stages
+    run at the same time. Decoding and most numpy operations let go of the GIL, so the stages really do overlap.
+    :param source: an iterable of the items to put through the pipeline
+    :param stages: a list of functions that each take an item and return the item for the next stage
+    :param max_queue_size: the number of items that can wait between two stages
+    :return: a generator of the outputs of the last stage, in the order of the source
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=max_queue_size) for _ in range(len(stages) + 1)]
+
+    def put(output_queue, item):
+        while not stop.is_set():
+            try:
+                output_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(input_queue):
+        while not stop.is_set():
+            try:
+                return input_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _END
+
+    def produce():
+        iterator = iter(source)
+
+        try:
+            for item in iterator:
+                if not put(queues[0], item):
+                    return
+            put(queues[0], _END)
+        except BaseException as error:
+            put(queues[0], _Failure(error))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    def work(function, input_queue, output_queue):
+        while True:
+            item = get(input_queue)
+
+            if item is _END or isinstance(item, _Failure):
+                put(output_queue, item)
+                return
+
+            try:
+                item = function(item)
+            except BaseException as error:
+                put(output_queue, _Failure(error))
+                return
+
+            if not put(output_queue, item):
+                return
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads.extend(
+        threading.Thread(target=work, args=(function, queues[i], queues[i + 1]), daemon=True)
+        for i, function in enumerate(stages)
+    )
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+
+            yield item
+    finally:
+        # stops the stages before it if the consumer stops early or a stage failed
+        stop.set()
+        for thread in threads:
+            thread.join()
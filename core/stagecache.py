@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+
+class StageCache:
+    def __init__(self, cache_dir):
+        """
+        stores the outputs of each stage of a conversion in a directory named after a hash of everything the stage's
+        outputs depend on, so that a stage only has to be run again when one of its inputs changes
+        :param cache_dir: the directory to store the outputs in
+        """
+        self.cache_dir = cache_dir
+        self.file_hashes_dir = f'{cache_dir}/file_hashes'
+
+        os.makedirs(self.file_hashes_dir, exist_ok=True)
+
+    def get_key(self, stage, inputs):
+        """
+        :param stage: the name of the stage
+        :param inputs: a json serializable dictionary of everything the outputs of the stage depend on
+        :return: the key the outputs of the stage are stored under
+        """
+        text = json.dumps({'stage': stage, 'inputs': inputs}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+    def get_stage_dir(self, stage, inputs):
+        """
+        :param stage: the name of the stage
+        :param inputs: a json serializable dictionary of everything the outputs of the stage depend on
+        :return: the directory the outputs of the stage are stored in
+        """
+        return f'{self.cache_dir}/{stage}-{self.get_key(stage, inputs)}'
+
+    def is_cached(self, stage, inputs):
+        return os.path.isdir(self.get_stage_dir(stage, inputs))
+
+    def run(self, stage, inputs, build):
+        """
+        runs a stage unless its outputs for these inputs are already stored
+        :param stage: the name of the stage
+        :param inputs: a json serializable dictionary of everything the outputs of the stage depend on
+        :param build: a function that takes a directory and saves the outputs of the stage into it
+        :return: the directory the outputs of the stage are stored in
+        """
+        stage_dir = self.get_stage_dir(stage, inputs)
+
+        if os.path.isdir(stage_dir):
+            print(f'Using the cached {stage} stage: {stage_dir}')
+            return stage_dir
+
+        # built in a temporary directory first so that an interrupted stage is never mistaken for a finished one
+        temp_dir = tempfile.mkdtemp(prefix=f'.{stage}-', dir=self.cache_dir)
+
+        try:
+            build(temp_dir)
+            os.replace(temp_dir, stage_dir)
+        except OSError:
+            # another process finished the same stage first
+            if not os.path.isdir(stage_dir):
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return stage_dir
+
+    def hash_file(self, path):
+        """
+        hashes the contents of a file. The hash is remembered until the file's size or modification time changes, in a
+        file of its own, so that processes hashing different files at once never overwrite each other's hashes.
+        :param path: the path of the file
+        :return: the sha256 hash of the file, in hex
+        """
+        stat = os.stat(path)
+        memo_key = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+        memo_path = f'{self.file_hashes_dir}/{hashlib.sha256(memo_key.encode()).hexdigest()[:32]}'
+
+        if os.path.exists(memo_path):
+            with open(memo_path) as file:
+                return file.read()
+
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                file_hash.update(chunk)
+
+        # written to a temporary file first so that a hash is never read before it is whole
+        temp_path = f'{memo_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(file_hash.hexdigest())
+        os.replace(temp_path, memo_path)
+
+        return file_hash.hexdigest()
+
+    @staticmethod
+    def hash_array(array):
+        """
+        :param array: a numpy array
+        :return: the sha256 hash of the array's shape, type and contents, in hex
+        """
+        array = np.ascontiguousarray(array)
+
+        array_hash = hashlib.sha256(f'{array.shape}:{array.dtype.str}'.encode())
+        array_hash.update(array.data)
+
+        return array_hash.hexdigest()
@@ -0,0 +1,222 @@
+import concurrent.futures
+import itertools
+import sys
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from core import frames2matrix, matrix2csv, matrix2midi, telemetry, youtube2frames
+
+# the notes shorter than this many frames, and the gaps shorter than this many frames between two notes of a key, are
+# counted as flicker
+MAX_FLICKER_FRAMES = 2
+
+# the scores parameter sets can be ranked by: the flicker of each note found, the frames in which both hands play the
+# same key, or how well the notes found agree with a reference midi file
+SCORES = ['flicker', 'overlaps', 'reference']
+
+
+def get_parameter_sets(grid):
+    """
+    :param grid: a dictionary of a list of the values to try for each parameter, such as
+                 {'minimum_note_width': [2, 3, 4], 'read_height': [58, 60]}, or a list of dictionaries of parameters
+    :return: a list of dictionaries of the parameters of every combination of the values
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+    return [dict(parameters) for parameters in grid]
+
+
+def count_flicker(hand, max_flicker_frames=MAX_FLICKER_FRAMES):
+    """
+    :param hand: a HandMatrix
+    :param max_flicker_frames: the longest note or gap between notes that is counted as flicker
+    :return: the number of notes and gaps between notes of a key that are at most max_flicker_frames frames long
+    """
+    intervals = hand.intervals
+
+    short_notes = np.count_nonzero(intervals['end'] - intervals['start'] <= max_flicker_frames)
+
+    same_key = intervals['key'][1:] == intervals['key'][:-1]
+    short_gaps = np.count_nonzero(same_key & (intervals['start'][1:] - intervals['end'][:-1] <= max_flicker_frames))
+
+    return int(short_notes + short_gaps)
+
+
+def count_overlap_frames(left_hand, right_hand, chunk_size=4096):
+    """
+    :param left_hand: the HandMatrix of the left hand
+    :param right_hand: the HandMatrix of the right hand
+    :param chunk_size: the number of frames to look at at a time
+    :return: the number of frames in which both hands play the same key, which is impossible
+    """
+    overlap_frames = 0
+
+    for start in range(0, len(left_hand), chunk_size):
+        overlaps = left_hand[start:start + chunk_size] & right_hand[start:start + chunk_size]
+        overlap_frames += int(np.count_nonzero(overlaps.any(axis=1)))
+
+    return overlap_frames
+
+
+def score_against_reference(hands, reference_notes, fps, tolerance=1.5):
+    """
+    matches every note found to a note of the reference with the same midi note number that starts close enough to it,
+    whatever hand or track either is in
+    :param hands: a list of the HandMatrix of each hand
+    :param reference_notes: the notes of the reference, as returned by matrix2midi.read_midi_notes
+    :param fps: frames per second of the video
+    :param tolerance: the number of frames a note may start before or after the reference note
+    :return: the F1 score of the notes found, between 0 and 1
+    """
+    unmatched = {}
+    for note, start, _, _ in reference_notes:
+        unmatched.setdefault(note, []).append(start)
+
+    detected = sorted(
+        (start / fps, int(key) + matrix2csv.LOWEST_NOTE)
+        for hand in hands
+        for key, start in zip(hand.intervals['key'], hand.intervals['start'])
+    )
+
+    matches = 0
+    for start, note in detected:
+        candidates = unmatched.get(note, [])
+
+        for i, reference_start in enumerate(candidates):
+            if abs(reference_start - start) <= tolerance / fps:
+                matches += 1
+                del candidates[i]
+                break
+
+    if matches == 0:
+        return 0.0
+
+    precision = matches / len(detected)
+    recall = matches / len(reference_notes)
+    return 2 * precision * recall / (precision + recall)
+
+
+def evaluate(parameters, strip_path, fps, reference_notes=None):
+    """
+    finds the notes of the frames of the strip with one parameter set and scores them
+    :param parameters: the keyword arguments of Frames2MatrixConverter other than name, frame_dir, num_frames and
+                       strip_path
+    :param strip_path: the path of a strip that has the rows the read height needs
+    :param fps: frames per second of the video
+    :param reference_notes: the notes of a reference midi file, as returned by matrix2midi.read_midi_notes, or None
+    :return: a dictionary of the parameters and their scores
+    """
+    start_time = time.perf_counter()
+
+    num_frames = youtube2frames.load_strip(strip_path)[1]['num_frames']
+    converter = frames2matrix.Frames2MatrixConverter(
+        name='sweep', frame_dir=None, num_frames=num_frames, strip_path=strip_path, **parameters
+    )
+
+    # the first matrix convert returns is the right hand
+    right_hand, left_hand = converter.convert(workers=1, compact=True)
+
+    return {
+        'parameters': parameters,
+        'notes': len(left_hand.intervals) + len(right_hand.intervals),
+        'flicker': count_flicker(left_hand) + count_flicker(right_hand),
+        'overlap_frames': count_overlap_frames(left_hand, right_hand),
+        'reference_f1': (
+            score_against_reference([left_hand, right_hand], reference_notes, fps)
+            if reference_notes is not None else None
+        ),
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def get_rank_key(score):
+    """
+    :param score: one of SCORES
+    :return: a function that gives the key to sort the results by, best first. Flicker is counted for each note found so
+             that finding fewer notes is not better in itself, and parameter sets that found no notes at all always go
+             last
+    """
+    if score == 'flicker':
+        return lambda result: (
+            result['notes'] == 0, result['flicker'] / max(result['notes'], 1), result['overlap_frames']
+        )
+    if score == 'overlaps':
+        return lambda result: (
+            result['notes'] == 0, result['overlap_frames'], result['flicker'] / max(result['notes'], 1)
+        )
+    if score == 'reference':
+        return lambda result: (result['notes'] == 0, -result['reference_f1'], result['flicker'])
+
+    raise ValueError(f"score must be one of {SCORES}, not {score!r}")
+
+
+@telemetry.instrument('sweep')
+def sweep(video_path, base_parameters, grid, strip_path, score='flicker', reference_midi_path=None, workers=None,
+          decode_workers=1, cache=None):
+    """
+    tries every combination of the values of the grid on the same video and ranks them, decoding the video only once
+    into a strip of the rows every read height needs. Each parameter set is converted from that strip in its own
+    process.
+    :param video_path: the path of the video
+    :param base_parameters: the keyword arguments of Frames2MatrixConverter that stay the same for every parameter set,
+                            other than name, frame_dir, num_frames and strip_path
+    :param grid: the values to try for each parameter that changes, see get_parameter_sets. They replace the values in
+                 base_parameters
+    :param strip_path: the path to save the strip in when it is not cached
+    :param score: one of SCORES, to rank the parameter sets by
+    :param reference_midi_path: the path of a midi file of the song, needed to rank by the 'reference' score
+    :param workers: the number of processes to try the parameter sets in. None uses one for each CPU
+    :param decode_workers: the number of processes to decode the video with
+    :param cache: a StageCache, or None to always extract the strip
+    :return: a list of dictionaries of the parameters and scores of every parameter set, best first
+    """
+    # the score is checked before anything is decoded
+    get_rank_key(score)
+    if score == 'reference' and reference_midi_path is None:
+        raise ValueError("a reference midi file is needed to rank by the 'reference' score")
+
+    parameter_sets = [{**base_parameters, **parameters} for parameters in get_parameter_sets(grid)]
+    reference_notes = matrix2midi.read_midi_notes(reference_midi_path) if reference_midi_path is not None else None
+
+    # one strip of the rows every read height needs
+    read_heights = [parameters['read_height'] for parameters in parameter_sets]
+    strip_path = youtube2frames.get_strip(
+        video_path, strip_path, [min(read_heights) - 1, max(read_heights) + 2], decode_workers, cache
+    )
+    fps = youtube2frames.load_strip(strip_path)[1]['fps']
+    telemetry.add_metrics(parameter_sets=len(parameter_sets))
+
+    results = []
+
+    with tqdm(total=len(parameter_sets), file=sys.stdout, desc="Parameter sets tried") as progress_bar:
+        if workers == 1:
+            for parameters in parameter_sets:
+                results.append(evaluate(parameters, strip_path, fps, reference_notes))
+                progress_bar.update(1)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(evaluate, parameters, strip_path, fps, reference_notes)
+                    for parameters in parameter_sets
+                ]
+
+                for future in concurrent.futures.as_completed(futures):
+                    results.append(future.result())
+                    progress_bar.update(1)
+
+    return sorted(results, key=get_rank_key(score))
+
+
+def print_results(results, num_results=10):
+    """
+    :param results: the results of sweep
+    :param num_results: the number of the best results to print
+    """
+    for rank, result in enumerate(results[:num_results], start=1):
+        reference_f1 = f", reference F1 {result['reference_f1']:.3f}" if result['reference_f1'] is not None else ''
+        print(f"{rank}. {result['notes']} notes, {result['flicker']} flicker, {result['overlap_frames']} overlapping "
+              f"frames{reference_f1}: {result['parameters']}")
@@ -0,0 +1,325 @@
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# only on Unix, elsewhere the CPU time of child processes and the peak memory are not measured
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# functions called with the metrics of every stage once it finishes
+_callbacks = []
+
+# the seconds between the samples of the sampling profiler, or None to not profile
+_profile_interval = None
+
+# the stages that are running in each thread, innermost last
+_local = threading.local()
+
+# the most memory each stage running in any thread has had in RAM so far, by the id of its metrics. The high water mark
+# of the process is reset at the start of every stage, so it is added to every stage running first.
+_peak_rss = {}
+_peak_rss_lock = threading.Lock()
+
+
+def add_callback(callback):
+    """
+    :param callback: a function to call with a dictionary of the metrics of every stage once it finishes
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
+
+
+def set_profile_interval(interval):
+    """
+    :param interval: the seconds between the samples the sampling profiler takes of every stage, or None to not profile
+    """
+    global _profile_interval
+    _profile_interval = interval
+
+
+def get_io_bytes():
+    """
+    :return: the number of bytes this process has read and written so far, or None for both if they are not available
+    """
+    try:
+        with open('/proc/self/io') as file:
+            counters = dict(line.split(': ') for line in file.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def get_cpu_seconds():
+    """
+    :return: the CPU time used so far by this process and by its child processes that have finished, or by this process
+             only where the resource module is not available
+    """
+    if resource is None:
+        return time.process_time()
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def get_peak_rss_bytes(children=False):
+    """
+    :param children: whether to return the peak of the largest finished child process instead of this process
+    :return: the most memory the process has had in RAM at once, or None where the resource module is not available.
+             For this process on Linux, that is since the high water mark was last reset
+    """
+    if resource is None:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+
+    # macOS reports bytes, Linux reports kilobytes
+    return usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def get_rss_high_water_mark():
+    """
+    :return: the most memory this process has had in RAM at once since the mark was last reset, or None if it is not
+             available, as only Linux keeps it
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def reset_rss_high_water_mark():
+    """
+    sets the high water mark of this process back to the memory it has in RAM now
+    :return: whether it could be reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def update_peak_rss():
+    """
+    adds the high water mark of the process to the peak memory of every stage running. Called with the lock held.
+    """
+    high_water_mark = get_rss_high_water_mark()
+
+    if high_water_mark is not None:
+        for record_id, peak in _peak_rss.items():
+            _peak_rss[record_id] = max(peak, high_water_mark)
+
+
+def add_metrics(**metrics):
+    """
+    adds to the metrics of the innermost stage running in this thread, such as add_metrics(frames=256)
+    """
+    stages = getattr(_local, 'stages', [])
+    if stages:
+        for key, value in metrics.items():
+            stages[-1][key] = stages[-1].get(key, 0) + value
+
+
+@contextlib.contextmanager
+def stage(name, **metrics):
+    """
+    measures everything done inside the with block as one stage and sends its metrics to the callbacks
+    :param name: the name of the stage
+    :param metrics: any metrics already known, such as frames=1000
+    :return: the dictionary of the metrics of the stage, which add_metrics adds to
+    """
+    if not _callbacks:
+        yield {}
+        return
+
+    record = {'stage': name, **metrics}
+    stages = _local.__dict__.setdefault('stages', [])
+    stages.append(record)
+
+    profiler = SamplingProfiler(_profile_interval) if _profile_interval is not None else None
+    start_wall = time.perf_counter()
+    start_cpu = get_cpu_seconds()
+    start_read, start_written = get_io_bytes()
+
+    with _peak_rss_lock:
+        update_peak_rss()
+        if reset_rss_high_water_mark():
+            _peak_rss[id(record)] = 0
+
+    if profiler is not None:
+        profiler.start()
+
+    try:
+        yield record
+    except BaseException as error:
+        record['error'] = repr(error)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            record['profile'] = profiler.get_top_functions()
+
+        end_read, end_written = get_io_bytes()
+        record['wall_seconds'] = time.perf_counter() - start_wall
+        record['cpu_seconds'] = get_cpu_seconds() - start_cpu
+        record['bytes_read'] = end_read - start_read if start_read is not None else None
+        record['bytes_written'] = end_written - start_written if start_written is not None else None
+        with _peak_rss_lock:
+            update_peak_rss()
+            record['peak_rss_bytes'] = _peak_rss.pop(id(record), None)
+        record['process_peak_children_rss_bytes'] = get_peak_rss_bytes(children=True)
+        if record.get('frames'):
+            record['frames_per_second'] = record['frames'] / record['wall_seconds']
+
+        stages.pop()
+
+        for callback in list(_callbacks):
+            callback(record)
+
+
+def instrument(name):
+    """
+    a decorator that measures every call of the function as a stage
+    :param name: the name of the stage
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TelemetryReport:
+    def __init__(self):
+        """
+        collects the metrics of every stage that finishes while it is used as a context manager (or added as a callback),
+        to save them as a json report
+        """
+        self.stages = []
+
+    def __call__(self, record):
+        self.stages.append(record)
+
+    def __enter__(self):
+        add_callback(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_callback(self)
+
+    def save(self, report_path):
+        """
+        :param report_path: the path of the json file to save the metrics of the stages in, in the order they finished
+        """
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+
+        with open(report_path, 'w') as file:
+            json.dump({'stages': self.stages}, file, indent=4)
+
+
+@contextlib.contextmanager
+def recording(report_path=None, profile_interval=None):
+    """
+    saves the metrics of every stage that finishes inside the with block to a json report, even if one of them fails
+    :param report_path: the path of the json file to save the report in, or None to not save one
+    :param profile_interval: the seconds between the samples the sampling profiler takes of every stage, or None to not
+                             profile
+    """
+    if report_path is None and profile_interval is None:
+        yield None
+        return
+
+    report = TelemetryReport()
+    last_profile_interval = _profile_interval
+    set_profile_interval(profile_interval)
+
+    try:
+        with report:
+            yield report
+    finally:
+        set_profile_interval(last_profile_interval)
+
+        if report_path is not None:
+            report.save(report_path)
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        """
+        finds where the threads of the process spend their time by looking at what each of them is running every
+        interval seconds from another thread, so the threads of the 'stream' frame mode's pipeline are sampled along
+        with the one that started it. Child processes, such as the workers that find the notes in the 'images' and
+        'strip' frame modes, are not sampled; use a single worker to profile note detection in those modes.
+        :param interval: the seconds between samples
+        """
+        self.interval = interval
+        self.self_samples = collections.Counter()
+        self.total_samples = collections.Counter()
+        self.num_samples = 0
+        self._stop_event = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            for frame in sys._current_frames().values():
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+
+                # the samplers of this and any other stage, and a thread already waiting for its profiler to stop
+                if SamplingProfiler._sample.__code__ in codes or SamplingProfiler.stop.__code__ in codes:
+                    continue
+
+                self.num_samples += 1
+                self.self_samples[self.get_function_name(codes[0])] += 1
+                self.total_samples.update({self.get_function_name(code) for code in codes})
+
+    @staticmethod
+    def get_function_name(code):
+        return f'{code.co_filename}:{code.co_firstlineno}({code.co_name})'
+
+    def get_top_functions(self, num_functions=20):
+        """
+        :param num_functions: the number of functions to return
+        :return: a list of the functions the most samples were taken in, with the fraction of the samples of all the
+                 threads taken in the function itself and in it or anything it called
+        """
+        return [
+            {
+                'function': function,
+                'self_fraction': self.self_samples[function] / self.num_samples,
+                'total_fraction': self.total_samples[function] / self.num_samples,
+            }
+            for function, _ in self.self_samples.most_common(num_functions)
+        ] if self.num_samples else []
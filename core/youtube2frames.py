@@ -1,13 +1,16 @@
 import concurrent.futures
+import json
 import os
 import shutil
 import sys
 
 # image operation
 import cv2
-from pytube import YouTube
+import numpy as np
 from tqdm import tqdm
 
+from core import telemetry
+
 
 def display_progress_bar(bytes_received: int, filesize: int, ch: str = "█", scale: float = 0.55):
     columns = shutil.get_terminal_size().columns
@@ -28,7 +31,124 @@ def on_progress(stream, chunk: bytes, bytes_remaining: int):
     display_progress_bar(bytes_received, filesize)
 
 
-def get_frames(video_url, video_dir_path, frame_dir_path, video_name, tag=None):
+# the fewest pixels between the centers of two white keys at which notes are still found reliably
+MIN_PIXELS_PER_KEY = 10
+
+# the fewest frames per second that still tell apart notes played quickly one after another
+MIN_FPS = 24
+
+# the distance between the centers of two white keys divided by the height of the frame, when a full keyboard of 52
+# white keys spans the width of a 16:9 frame
+DEFAULT_KEY_SPACING_FRACTION = 16 / 9 / 52
+
+
+def get_key_spacing_fraction(first_white_note_col, tenth_white_note_col, frame_height):
+    """
+    :param first_white_note_col: the column of the center of the first white note, calibrated on a video of the channel
+    :param tenth_white_note_col: the column of the center of the tenth white note, calibrated on the same video
+    :param frame_height: the height of the frames of that video
+    :return: the distance between the centers of two white keys divided by the height of the frame, which stays the
+             same whatever resolution the channel's videos are downloaded in
+    """
+    return (tenth_white_note_col - first_white_note_col) / 9 / frame_height
+
+
+def get_youtube_streams(video_url):
+    """
+    :param video_url: the url of the youtube video
+    :return: a list of a dictionary of the metadata of each mp4 stream with video of the youtube video, with its itag,
+             height, fps, video codec, whether it is progressive (has audio too) and its bitrate
+    """
+    # only imported when a video is downloaded, as it is slow to import
+    from pytube import YouTube
+
+    streams = []
+
+    for stream in YouTube(video_url).streams.filter(mime_type='video/mp4', type='video'):
+        if stream.resolution is None:
+            continue
+
+        streams.append({
+            'itag': stream.itag,
+            'height': int(stream.resolution.rstrip('p')),
+            'fps': stream.fps,
+            'video_codec': stream.video_codec,
+            'progressive': stream.is_progressive,
+            'bitrate': stream.bitrate,
+        })
+
+    return streams
+
+
+def select_stream(streams, key_spacing_fraction=DEFAULT_KEY_SPACING_FRACTION, min_pixels_per_key=MIN_PIXELS_PER_KEY,
+                  min_fps=MIN_FPS):
+    """
+    picks the stream that is cheapest to download and decode while still having enough pixels between the keys to find
+    the notes, and enough frames per second to time them
+    :param streams: a list of dictionaries of stream metadata, as returned by get_youtube_streams
+    :param key_spacing_fraction: the distance between the centers of two white keys divided by the height of the frame,
+                                 see get_key_spacing_fraction
+    :param min_pixels_per_key: the fewest pixels there may be between the centers of two white keys
+    :param min_fps: the fewest frames per second the stream may have
+    :return: the metadata of the stream. If no stream meets both constraints, the one that comes closest is returned
+    """
+    if not streams:
+        raise ValueError("there are no streams to select from")
+
+    # OpenCV can always decode h264, but not every build of it can decode av1 or vp9
+    decodable = [stream for stream in streams if str(stream.get('video_codec') or 'avc1').startswith('avc1')]
+    if decodable:
+        streams = decodable
+
+    suitable = [
+        stream for stream in streams
+        if stream['height'] * key_spacing_fraction >= min_pixels_per_key and stream['fps'] >= min_fps
+    ]
+
+    if not suitable:
+        stream = max(streams, key=lambda stream: (stream['height'], stream['fps']))
+        print(f"No stream has {min_pixels_per_key} pixels between white keys at {min_fps} fps, using itag "
+              f"{stream['itag']} ({stream['height']}p{stream['fps']})")
+        return stream
+
+    # the pixels decoded every second, then the bytes downloaded. Streams without audio are smaller to download.
+    return min(suitable, key=lambda stream: (
+        stream['height'] ** 2 * stream['fps'], stream.get('progressive', False), stream.get('bitrate') or 0
+    ))
+
+
+def get_auto_tag(video_url, stream_source=get_youtube_streams, **constraints):
+    """
+    :param video_url: the url of the youtube video
+    :param stream_source: a function that takes the url and returns the metadata of its streams, like
+                          get_youtube_streams
+    :param constraints: the keyword arguments of select_stream other than streams
+    :return: the itag of the stream select_stream picks
+    """
+    stream = select_stream(stream_source(video_url), **constraints)
+    print(f"Selected itag {stream['itag']} ({stream['height']}p{stream['fps']})")
+
+    return stream['itag']
+
+
+@telemetry.instrument('download_video')
+def download_video(video_url, video_dir_path, video_name, tag=None, stream_constraints=None):
+    """
+    downloads a youtube video
+    :param video_url: the url of the youtube video
+    :param video_dir_path: the directory to save the video in
+    :param video_name: the name to save the video under (without extension)
+    :param tag: the itag of the stream to download. If 'auto', the cheapest stream that meets the stream constraints is
+                picked, see select_stream. If None, the user is prompted for one
+    :param stream_constraints: the keyword arguments of get_auto_tag other than video_url, used when the tag is 'auto'
+    :return: the path of the downloaded video
+    """
+    if tag == 'auto':
+        tag = get_auto_tag(video_url, **(stream_constraints or {}))
+
+    # only imported when a video is downloaded, as it is slow to import
+    from pytube import YouTube
+
     video = YouTube(video_url, on_progress_callback=on_progress)
 
     if tag is None:
@@ -46,12 +166,86 @@ def get_frames(video_url, video_dir_path, frame_dir_path, video_name, tag=None):
 
     video.download(output_path=f'{video_dir_path}/', filename=video_name)
 
-    vid_cap = cv2.VideoCapture(f'{video_dir_path}/{video_name}.mp4')
+    return f'{video_dir_path}/{video_name}.mp4'
+
+
+def open_video(video_path):
+    """
+    :param video_path: the path of the video
+    :return: a cv2.VideoCapture of the video
+    """
+    vid_cap = cv2.VideoCapture(video_path)
+
+    # OpenCV does not raise for a video it can not open, it reads no frames and reports a frame count of 0 or -1
+    if not vid_cap.isOpened():
+        vid_cap.release()
+        if not os.path.isfile(video_path):
+            raise FileNotFoundError(f"there is no video at {video_path}")
+        raise ValueError(f"{video_path} could not be opened as a video")
+
+    return vid_cap
+
+
+def get_video_info(video_path):
+    """
+    :param video_path: the path of the video
+    :return: the number of frames in the video and its frames per second
+    """
+    vid_cap = open_video(video_path)
+    n_frames = int(vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = int(vid_cap.get(cv2.CAP_PROP_FPS))
+    vid_cap.release()
+
+    return n_frames, fps
+
+
+def stream_frames(video_path, step=1, with_counts=False):
+    """
+    decodes the video one frame at a time without writing anything to disk
+    :param video_path: the path of the video
+    :param step: only every step-th frame is returned. The frames in between are only grabbed, which skips converting
+                 them to BGR, and skips decoding them entirely for codecs without frames that depend on other frames
+    :param with_counts: whether to return each frame along with the number of frames of the video it stands for, which
+                        is itself and the frames grabbed after it. This is less than step only for the last frame, and
+                        is counted from the frames really decoded, as the frame count of the container is only an
+                        estimate
+    :return: a generator of the frames of the video, in order, in BGR, or of (frame, number of frames) pairs
+    """
+    vid_cap = open_video(video_path)
+
+    try:
+        while True:
+            success, image = vid_cap.read()
+            if not success:
+                return
+
+            num_frames = 1
+            while num_frames < step and vid_cap.grab():
+                num_frames += 1
+
+            yield (image, num_frames) if with_counts else image
+
+            if num_frames < step:
+                return
+    finally:
+        vid_cap.release()
+
+
+@telemetry.instrument('save_frames')
+def save_frames(video_path, frame_dir_path):
+    """
+    saves every frame of the video as frame_dir_path/frame_{n}.jpg
+    :param video_path: the path of the video
+    :param frame_dir_path: the directory to save the frames in
+    :return: the number of frames in the video and its frames per second
+    """
+    vid_cap = open_video(video_path)
     n_frames = int(vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
     fps = int(vid_cap.get(cv2.CAP_PROP_FPS))
 
     os.makedirs(frame_dir_path, exist_ok=True)
     print(f'\nCreated the following directory: {frame_dir_path}')
+    telemetry.add_metrics(frames=n_frames)
 
     with concurrent.futures.ThreadPoolExecutor() as executor:
         images = (vid_cap.read()[1] for _ in range(n_frames))
@@ -69,6 +263,219 @@ def get_frames(video_url, video_dir_path, frame_dir_path, video_name, tag=None):
         )
 
     vid_cap.release()
-    cv2.destroyAllWindows()
 
     return n_frames, fps
+
+
+def get_strip_info_path(strip_path):
+    """
+    :param strip_path: the path of a strip saved by save_strip
+    :return: the path of the json file describing the strip
+    """
+    return f'{os.path.splitext(strip_path)[0]}.json'
+
+
+def save_strip_segment(video_path, strip_path, top_row, bottom_row, start, end, progress_bar=None, extra_path=None):
+    """
+    decodes frames start up to (not including) end of the video with its own capture and writes their rows into the
+    already created strip
+    :param video_path: the path of the video
+    :param strip_path: the path of the .npy strip to write into
+    :param top_row: the first row of each frame to save
+    :param bottom_row: the row after the last row of each frame to save
+    :param start: the first frame number of the segment
+    :param end: the frame number after the last frame of the segment
+    :param progress_bar: a tqdm progress bar to update for every frame, if any
+    :param extra_path: the path of a raw file to write the rows of every frame after end into, for the last segment of a
+                       video whose frame count can be an underestimate, or None to stop at end
+    :return: the number of frames that could be read up to end, and the number of frames read after it
+    """
+    vid_cap = open_video(video_path)
+    strip = np.load(strip_path, mmap_mode='r+')
+
+    if start > 0:
+        vid_cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+        # if the container can not seek to the exact frame, count frames from the beginning instead
+        if int(vid_cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            vid_cap.release()
+            vid_cap = open_video(video_path)
+            for _ in range(start):
+                vid_cap.grab()
+
+    frames_read = 0
+    for frame_num in range(start, end):
+        success, image = vid_cap.read()
+        if not success:
+            break
+
+        strip[frame_num] = image[top_row:bottom_row]
+        frames_read += 1
+
+        if progress_bar is not None:
+            progress_bar.update()
+
+    extra_frames_read = 0
+    if extra_path is not None and frames_read == end - start:
+        with open(extra_path, 'wb') as extra_file:
+            while True:
+                success, image = vid_cap.read()
+                if not success:
+                    break
+
+                extra_file.write(np.ascontiguousarray(image[top_row:bottom_row]).tobytes())
+                extra_frames_read += 1
+
+                if progress_bar is not None:
+                    progress_bar.update()
+
+    vid_cap.release()
+    strip.flush()
+
+    return frames_read, extra_frames_read
+
+
+def stitch_strip(strip_path, segments, frames_read, extra_path, extra_frames_read):
+    """
+    rewrites the strip with only the frames that were read, in order, followed by the frames read after the last
+    segment, a segment at a time so the strip is never held in memory
+    :param strip_path: the path of the .npy strip
+    :param segments: the first frame number and the frame number after the last frame of every segment
+    :param frames_read: the number of frames read from each segment
+    :param extra_path: the path of the raw file of the frames read after the last segment
+    :param extra_frames_read: the number of frames read after the last segment
+    """
+    strip = np.load(strip_path, mmap_mode='r')
+    stitched_path = f'{strip_path}.stitched.npy'
+    stitched = np.lib.format.open_memmap(
+        stitched_path, mode='w+', dtype=np.uint8, shape=(sum(frames_read) + extra_frames_read,) + strip.shape[1:]
+    )
+
+    frame_num = 0
+    for (start, _), segment_frames_read in zip(segments, frames_read):
+        stitched[frame_num:frame_num + segment_frames_read] = strip[start:start + segment_frames_read]
+        frame_num += segment_frames_read
+
+    if extra_frames_read > 0:
+        stitched[frame_num:] = np.memmap(
+            extra_path, dtype=np.uint8, mode='r', shape=(extra_frames_read,) + strip.shape[1:]
+        )
+
+    stitched.flush()
+    del strip, stitched
+    os.replace(stitched_path, strip_path)
+
+
+@telemetry.instrument('save_strip')
+def save_strip(video_path, strip_path, top_row, bottom_row, workers=1):
+    """
+    saves rows top_row up to (not including) bottom_row of every frame of the video into a single .npy array of shape
+    (frames, rows, width, 3), in BGR. A json file next to it records which rows were saved.
+    :param video_path: the path of the video
+    :param strip_path: the path of the .npy file to save the strip in
+    :param top_row: the first row of each frame to save
+    :param bottom_row: the row after the last row of each frame to save
+    :param workers: the number of processes to decode the video with. Each one decodes its own segment of the video.
+    :return: the number of frames in the video and its frames per second
+    """
+    n_frames, fps = get_video_info(video_path)
+    # some containers report a frame count of 0 or -1 when they do not know it, then every frame is read after it
+    n_frames = max(n_frames, 0)
+
+    vid_cap = open_video(video_path)
+    width = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    vid_cap.release()
+
+    os.makedirs(os.path.dirname(strip_path) or '.', exist_ok=True)
+
+    strip = np.lib.format.open_memmap(
+        strip_path, mode='w+', dtype=np.uint8, shape=(n_frames, bottom_row - top_row, width, 3)
+    )
+    del strip
+
+    # the frames after the last segment, if the frame count in the container is an underestimate
+    extra_path = f'{strip_path}.extra'
+
+    segment_length = -(-n_frames // workers) if n_frames > 0 else 1
+    segments = [(start, min(start + segment_length, n_frames)) for start in range(0, n_frames, segment_length)]
+    segments = segments or [(0, 0)]
+    extra_paths = [None] * (len(segments) - 1) + [extra_path]
+
+    if workers == 1:
+        with tqdm(total=n_frames, file=sys.stdout, desc="Frames saved") as progress_bar:
+            results = [
+                save_strip_segment(video_path, strip_path, top_row, bottom_row, start, end, progress_bar, segment_extra)
+                for (start, end), segment_extra in zip(segments, extra_paths)
+            ]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    save_strip_segment, video_path, strip_path, top_row, bottom_row, start, end, None, segment_extra
+                )
+                for (start, end), segment_extra in zip(segments, extra_paths)
+            ]
+
+            with tqdm(total=n_frames, file=sys.stdout, desc="Frames saved") as progress_bar:
+                for future in concurrent.futures.as_completed(futures):
+                    progress_bar.update(sum(future.result()))
+
+            results = [future.result() for future in futures]
+
+    frames_read = [segment_frames_read for segment_frames_read, _ in results]
+    extra_frames_read = results[-1][1]
+
+    # the frame count in the container is only an estimate. Too high a count leaves frames missing at the end of
+    # segments, and too low a count leaves frames after the last segment, so the strip is stitched back together in order
+    if sum(frames_read) < n_frames or extra_frames_read > 0:
+        stitch_strip(strip_path, segments, frames_read, extra_path, extra_frames_read)
+        n_frames = sum(frames_read) + extra_frames_read
+
+    if os.path.exists(extra_path):
+        os.remove(extra_path)
+
+    telemetry.add_metrics(frames=n_frames)
+
+    with open(get_strip_info_path(strip_path), 'w') as file:
+        json.dump({'top_row': top_row, 'bottom_row': bottom_row, 'num_frames': n_frames, 'fps': fps}, file)
+
+    return n_frames, fps
+
+
+def get_strip(video_path, strip_path, strip_rows, decode_workers=1, cache=None):
+    """
+    :param video_path: the path of the video
+    :param strip_path: the path to save the strip in when it is not cached
+    :param strip_rows: the first row and the row after the last row of each frame to save
+    :param decode_workers: the number of processes to decode the video with
+    :param cache: a StageCache, or None to always extract the strip
+    :return: the path of the strip
+    """
+    if cache is None:
+        save_strip(video_path, strip_path, *strip_rows, workers=decode_workers)
+        return strip_path
+
+    stage_dir = cache.run(
+        'strip',
+        {'video': cache.hash_file(video_path), 'rows': list(strip_rows)},
+        lambda output_dir: save_strip(video_path, f'{output_dir}/strip.npy', *strip_rows, workers=decode_workers)
+    )
+
+    return f'{stage_dir}/strip.npy'
+
+
+def load_strip(strip_path):
+    """
+    :param strip_path: the path of a strip saved by save_strip
+    :return: the strip memory-mapped as read only, and the dictionary describing it
+    """
+    with open(get_strip_info_path(strip_path)) as file:
+        strip_info = json.load(file)
+
+    return np.load(strip_path, mmap_mode='r'), strip_info
+
+
+def get_frames(video_url, video_dir_path, frame_dir_path, video_name, tag=None, stream_constraints=None):
+    video_path = download_video(video_url, video_dir_path, video_name, tag, stream_constraints)
+
+    return save_frames(video_path, frame_dir_path)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic_video
+
+NUM_FRAMES = 48
+
+
+@pytest.fixture(scope='session')
+def video(tmp_path_factory):
+    """
+    a short synthetic video rendered once for every test
+    :return: the path of the video, the notes rendered in it and the keyword arguments of Frames2MatrixConverter that
+             read it
+    """
+    video_path = str(tmp_path_factory.mktemp('video') / 'video.avi')
+    notes = synthetic_video.get_random_notes(88, NUM_FRAMES, density=0.05, seed=0)
+    converter_args = synthetic_video.render_video(video_path, notes, NUM_FRAMES, width=640, height=360, fourcc='MJPG')
+
+    return video_path, notes, converter_args
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from benchmarks import synthetic_video
+from core import calibrate
+
+
+def assert_colors_close(color, expected_color, tolerance=8):
+    assert np.abs(np.array(color) - np.array(expected_color)).max() <= tolerance, (color, expected_color)
+
+
+@pytest.fixture(scope='module')
+def calibrated(video):
+    video_path, _, _ = video
+    return calibrate.calibrate(video_path)
+
+
+def test_calibrated_keyboard_matches_render(video, calibrated):
+    _, _, converter_args = video
+
+    assert calibrated['first_note'] == converter_args['first_note']
+    assert calibrated['first_white_note_col'] == pytest.approx(converter_args['first_white_note_col'], abs=1)
+    assert calibrated['tenth_white_note_col'] == pytest.approx(converter_args['tenth_white_note_col'], abs=1)
+    assert abs(calibrated['minimum_note_width'] - converter_args['minimum_note_width']) <= 1
+
+
+def test_calibrated_read_height_matches_render(video, calibrated):
+    _, _, converter_args = video
+
+    assert abs(calibrated['read_height'] - converter_args['read_height']) <= 2
+
+
+def test_calibrated_colors_match_render(video, calibrated):
+    _, _, converter_args = video
+
+    assert_colors_close(calibrated['background_color'], converter_args['background_color'])
+
+    # the hands of the fixture's notes are random whatever the key, so only the pair of colors can be checked here
+    hand_colors = sorted([calibrated['left_hand_color'], calibrated['right_hand_color']])
+    expected_hand_colors = sorted([converter_args['left_hand_color'], converter_args['right_hand_color']])
+    for color, expected_color in zip(hand_colors, expected_hand_colors):
+        assert_colors_close(color, expected_color)
+
+
+def test_calibrated_left_hand_is_further_left(video, tmp_path):
+    _, notes, converter_args = video
+    video_path = str(tmp_path / 'video.avi')
+
+    # the same notes, with the lower half of the keyboard played by the left hand
+    notes = [(note, start, end, int(note >= 44)) for note, start, end, _ in notes]
+    synthetic_video.render_video(video_path, notes, 48, width=640, height=360, fourcc='MJPG')
+
+    parameters = calibrate.calibrate(video_path)
+
+    assert_colors_close(parameters['left_hand_color'], converter_args['left_hand_color'])
+    assert_colors_close(parameters['right_hand_color'], converter_args['right_hand_color'])
@@ -0,0 +1,14 @@
+from converters import cli
+
+
+def test_detection_arguments_have_the_types_the_converter_expects(video):
+    video_path, _, converter_args = video
+    argv = ['detect', video_path, '--name', 'song', '--minimum-note-width', '3', '--read-height', '296']
+
+    args = cli.get_parser().parse_args(argv)
+    parameters = cli.get_detection_parameters(args, video_path)
+
+    assert parameters['minimum_note_width'] == 3 and isinstance(parameters['minimum_note_width'], int)
+    assert parameters['read_height'] == 296
+    # the parameters that were not given are calibrated
+    assert parameters['first_note'] == converter_args['first_note']
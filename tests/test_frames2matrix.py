@@ -0,0 +1,220 @@
+import cv2
+import numpy as np
+import pytest
+
+from core import frames2matrix, youtube2frames
+
+
+def get_converter(converter_args, **kwargs):
+    return frames2matrix.Frames2MatrixConverter(
+        name='test', frame_dir=None, num_frames=0, **{**converter_args, **kwargs}
+    )
+
+
+def get_bands(video_path, read_height):
+    """
+    :return: the read band of every frame of the video, as an array of shape (frames, 3, width, 3)
+    """
+    return np.stack([image[read_height - 1:read_height + 2] for image in youtube2frames.stream_frames(video_path)])
+
+
+def get_hand_of_pixel(converter, color):
+    """
+    classifies one pixel the way the converter first did, converting it to LAB on its own
+    :param color: the pixel's color in [blue, green, red]
+    :return: 0 if not a note, 1 if its left hand, 2 if its right hand
+    """
+    color_lab = cv2.cvtColor(np.array(color, dtype=np.uint8).reshape((1, 1, 3)), cv2.COLOR_BGR2LAB)
+    color_lab = color_lab.reshape((3,)).astype('int32')
+
+    dist_from_background = ((color_lab - converter.background_color_lab) ** 2).sum()
+    dist_from_left_hand = ((color_lab - converter.left_hand_color_lab) ** 2).sum()
+    dist_from_right_hand = ((color_lab - converter.right_hand_color_lab) ** 2).sum()
+
+    if dist_from_left_hand < dist_from_background and dist_from_left_hand < dist_from_right_hand:
+        return 1
+    elif dist_from_right_hand < dist_from_background and dist_from_right_hand < dist_from_left_hand:
+        return 2
+    else:
+        return 0
+
+
+def test_band_classification_matches_each_pixel(video):
+    video_path, _, converter_args = video
+    converter = get_converter(converter_args)
+    bands = get_bands(video_path, converter_args['read_height'])
+
+    for band in bands[::8]:
+        expected = np.array([[get_hand_of_pixel(converter, pixel) for pixel in row] for row in band])
+        np.testing.assert_array_equal(converter.get_hands(band), expected)
+
+
+def test_color_table_matches_lab(video):
+    video_path, _, converter_args = video
+    converter = get_converter(converter_args)
+    table_converter = get_converter(converter_args, color_table_bits=8, color_table_dir=None)
+
+    # whole frames, so that the edges of the notes and the keyboard are classified too, and random colors, as the frames
+    # only have a few
+    images = list(youtube2frames.stream_frames(video_path))[::8]
+    images.append(np.random.default_rng(0).integers(0, 256, size=(512, 512, 3), dtype=np.uint8))
+
+    for image in images:
+        np.testing.assert_array_equal(table_converter.get_hands(image), converter.get_hands_lab(image))
+
+
+def get_notes_from_band_by_pixel(converter, band):
+    """
+    finds the notes of a read band one pixel at a time, the way the converter first did
+    :return: the left hand and right hand notes of the band
+    """
+    left_hand_notes = np.zeros(shape=(converter.number_of_keys,), dtype=np.uint8)
+    right_hand_notes = np.zeros(shape=(converter.number_of_keys,), dtype=np.uint8)
+
+    img_row = band[1]
+    img_len = img_row.shape[0]
+    relevant_part_of_img = [get_hand_of_pixel(converter, pixel) for pixel in img_row]
+
+    for i in range(1, img_len - 1):
+        this_pixel = relevant_part_of_img[i]
+        last_pixel = relevant_part_of_img[i - 1]
+        next_pixel = relevant_part_of_img[i + 1]
+
+        if this_pixel != last_pixel and this_pixel != next_pixel:
+            relevant_part_of_img[i] = 0
+
+    note_start = 0
+
+    for i in range(1, img_len - 1):
+        this_pixel = relevant_part_of_img[i]
+        last_pixel = relevant_part_of_img[i - 1]
+
+        if this_pixel != 0 and last_pixel != this_pixel:
+            note_start = i
+
+        if last_pixel != 0 and this_pixel != last_pixel and i - note_start > converter.minimum_note_width:
+            mid = int(note_start + (i - note_start) / 2)
+
+            if get_hand_of_pixel(converter, band[0][mid]) == 0 or get_hand_of_pixel(converter, band[2][mid]) == 0:
+                continue
+
+            # the key whose middle is closest, the lower one if two are as close
+            note = min(range(converter.number_of_keys), key=lambda key: abs(converter.note_columns[key] - mid))
+
+            if relevant_part_of_img[mid] == 1:
+                left_hand_notes[note] = 1
+            elif relevant_part_of_img[mid] == 2:
+                right_hand_notes[note] = 1
+
+    return left_hand_notes, right_hand_notes
+
+
+@pytest.mark.parametrize('first_note', ['A', 'C', 'F'])
+def test_note_mapping_matches_closest_key(video, first_note):
+    _, _, converter_args = video
+    converter = get_converter(converter_args, first_note=first_note)
+
+    # every column and every half column in between
+    columns = np.arange(0, 2 * 640) / 2
+    expected = [
+        min(range(converter.number_of_keys), key=lambda key: abs(converter.note_columns[key] - column))
+        for column in columns
+    ]
+
+    np.testing.assert_array_equal(converter.get_notes(columns), expected)
+
+
+@pytest.mark.parametrize('minimum_note_width', [0, 3, 8])
+def test_notes_match_each_pixel(video, minimum_note_width):
+    video_path, _, converter_args = video
+    converter = get_converter(converter_args, minimum_note_width=minimum_note_width)
+    bands = get_bands(video_path, converter_args['read_height'])
+
+    left_hand_notes, right_hand_notes = converter.get_notes_from_bands(bands)
+
+    for frame_num, band in enumerate(bands):
+        expected_left_hand_notes, expected_right_hand_notes = get_notes_from_band_by_pixel(converter, band)
+        np.testing.assert_array_equal(left_hand_notes[frame_num], expected_left_hand_notes)
+        np.testing.assert_array_equal(right_hand_notes[frame_num], expected_right_hand_notes)
+
+
+def test_skipped_frames_match_every_frame(video):
+    video_path, _, converter_args = video
+    converter = get_converter(converter_args)
+    bands = get_bands(video_path, converter_args['read_height'])
+
+    # every frame repeated up to 3 more times, as a video with a lower frame rate than its container would be
+    repeats = np.random.default_rng(0).integers(1, 5, size=len(bands))
+    repeated_bands = np.repeat(bands, repeats, axis=0)
+    expected_skipped = sum(
+        np.array_equal(repeated_bands[frame_num], repeated_bands[frame_num - 1])
+        for frame_num in range(1, len(repeated_bands))
+    )
+
+    left_hand_notes, right_hand_notes = converter.get_notes_from_bands(repeated_bands)
+    expected_left_hand_notes, expected_right_hand_notes = converter.find_notes_in_bands(repeated_bands)
+
+    np.testing.assert_array_equal(left_hand_notes, expected_left_hand_notes)
+    np.testing.assert_array_equal(right_hand_notes, expected_right_hand_notes)
+    assert converter.number_of_skipped_frames == expected_skipped >= (repeats - 1).sum()
+
+
+@pytest.fixture(scope='module')
+def stream_hands(video):
+    video_path, _, converter_args = video
+    converter = get_converter(converter_args)
+
+    return converter.convert_stream(youtube2frames.stream_frames(video_path), batch_size=16)
+
+
+def test_skipped_frames_are_reported(video, stream_hands, capsys):
+    video_path, _, converter_args = video
+    frames = list(youtube2frames.stream_frames(video_path))
+    repeats = np.random.default_rng(1).integers(1, 4, size=len(frames))
+
+    # in one batch, as the first frame of a batch is never skipped
+    converter = get_converter(converter_args)
+    right_hand, left_hand = converter.convert_stream(
+        frame for frame, frame_repeats in zip(frames, repeats) for _ in range(frame_repeats)
+    )
+
+    np.testing.assert_array_equal(right_hand, np.repeat(stream_hands[0], repeats, axis=0))
+    np.testing.assert_array_equal(left_hand, np.repeat(stream_hands[1], repeats, axis=0))
+    assert converter.number_of_skipped_frames == (repeats - 1).sum()
+    assert f'Skipped {converter.number_of_skipped_frames}/{repeats.sum()} frames' in capsys.readouterr().out
+
+    # nothing is printed when no frame was skipped
+    get_converter(converter_args).convert_stream(iter(frames[:2]))
+    assert 'Skipped' not in capsys.readouterr().out
+
+
+def test_strip_matches_stream(video, stream_hands, tmp_path):
+    video_path, _, converter_args = video
+    read_height = converter_args['read_height']
+    strip_path = str(tmp_path / 'strip.npy')
+    youtube2frames.save_strip(video_path, strip_path, read_height - 1, read_height + 2, workers=2)
+
+    num_frames, _ = youtube2frames.get_video_info(video_path)
+
+    for workers, chunk_size in [(1, 256), (2, 7)]:
+        converter = frames2matrix.Frames2MatrixConverter(
+            name='test', frame_dir=None, num_frames=num_frames, strip_path=strip_path, **converter_args
+        )
+        right_hand, left_hand = converter.convert(workers=workers, chunk_size=chunk_size)
+
+        np.testing.assert_array_equal(right_hand, stream_hands[0])
+        np.testing.assert_array_equal(left_hand, stream_hands[1])
+
+
+def test_images_match_stream(video, stream_hands, tmp_path):
+    video_path, _, converter_args = video
+    frame_dir = str(tmp_path / 'frames')
+    num_frames, _ = youtube2frames.save_frames(video_path, frame_dir)
+
+    converter = frames2matrix.Frames2MatrixConverter(
+        name='test', frame_dir=frame_dir, num_frames=num_frames, **converter_args
+    )
+    right_hand, left_hand = converter.convert(workers=2, chunk_size=7)
+
+    np.testing.assert_array_equal(right_hand, stream_hands[0])
+    np.testing.assert_array_equal(left_hand, stream_hands[1])
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from core import handmatrix
+
+
+def get_hand(num_frames=50, num_keys=88, seed=0):
+    """
+    :return: a dense matrix of notes held for a few frames each, with keys played on the first and last frames
+    """
+    rng = np.random.default_rng(seed)
+    hand = np.repeat(rng.random((num_frames, num_keys)) < 0.1, rng.integers(1, 6, size=num_frames), axis=0)
+    hand = hand[:num_frames].astype(np.uint8)
+    hand[0, :3] = 1
+    hand[-1, -3:] = 1
+    return hand
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_dense_round_trip(chunk_size):
+    hand = get_hand()
+    matrix = handmatrix.HandMatrix.from_dense(hand, chunk_size=chunk_size)
+
+    assert matrix.shape == hand.shape and len(matrix) == hand.shape[0]
+    assert np.array_equal(matrix.to_dense(), hand)
+    assert np.array_equal(np.asarray(matrix), hand)
+    assert np.array_equal(matrix.to_dense(10, 30), hand[10:30])
+
+
+def test_dense_round_trip_treats_any_state_as_played():
+    hand = get_hand()
+
+    assert np.array_equal(handmatrix.HandMatrix.from_dense(hand * 2).to_dense(), hand)
+
+
+@pytest.mark.parametrize('num_keys', [88, 13])
+def test_packed_round_trip(num_keys):
+    hand = get_hand(num_keys=num_keys)
+    packed = handmatrix.pack_rows(hand)
+
+    assert packed.shape == (hand.shape[0], -(-num_keys // 8))
+    assert np.array_equal(handmatrix.unpack_rows(packed, num_keys), hand)
+
+    matrix = handmatrix.HandMatrix.from_packed(packed, num_keys, chunk_size=16)
+    assert matrix == handmatrix.HandMatrix.from_dense(hand)
+    assert np.array_equal(matrix.to_packed(), packed)
+    assert np.array_equal(matrix.to_packed(5, 9), packed[5:9])
+
+
+def test_npz_round_trip(tmp_path):
+    hand = get_hand()
+    matrix = handmatrix.HandMatrix.from_dense(hand)
+    path = str(tmp_path / 'hand.npz')
+
+    matrix.save(path)
+
+    assert handmatrix.HandMatrix.load(path) == matrix
+
+    # a dense matrix saved by an older conversion loads as well
+    np.save(str(tmp_path / 'hand.npy'), hand)
+    assert handmatrix.HandMatrix.load(str(tmp_path / 'hand.npy')) == matrix
+
+
+def test_empty_matrix_round_trips(tmp_path):
+    for hand in [np.zeros((0, 88), dtype=np.uint8), np.zeros((10, 88), dtype=np.uint8)]:
+        matrix = handmatrix.HandMatrix.from_dense(hand)
+        matrix.save(str(tmp_path / 'hand.npz'))
+
+        assert matrix.intervals.shape == (0,)
+        assert np.array_equal(matrix.to_dense(), hand)
+        assert handmatrix.HandMatrix.load(str(tmp_path / 'hand.npz')) == matrix
+
+
+@pytest.mark.parametrize('item', [
+    7,
+    -1,
+    -50,
+    (7, 5),
+    (-2, -1),
+    (7, slice(10, 20)),
+    slice(None),
+    slice(10, 20),
+    slice(-5, None),
+    slice(30, 10),
+    slice(None, None, 3),
+    slice(40, 5, -4),
+    (slice(10, 20), 5),
+    (slice(10, 20), slice(None, None, 2)),
+    (slice(None, None, 2), [1, 5, 9]),
+    [3, 1, 40],
+    np.array([], dtype=np.intp),
+])
+def test_indexing_matches_the_dense_matrix(item):
+    hand = get_hand()
+    result = handmatrix.HandMatrix.from_dense(hand)[item]
+
+    assert np.shape(result) == np.shape(hand[item])
+    assert np.array_equal(result, hand[item])
+
+
+def test_indexing_with_a_mask_matches_the_dense_matrix():
+    hand = get_hand()
+
+    mask = hand[:, 0] == 1
+    assert np.array_equal(handmatrix.HandMatrix.from_dense(hand)[mask], hand[mask])
+
+
+@pytest.mark.parametrize('item', [50, -51, (50, 0)])
+def test_indexing_past_the_last_frame_raises(item):
+    with pytest.raises(IndexError):
+        handmatrix.HandMatrix.from_dense(get_hand())[item]
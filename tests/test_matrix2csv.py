@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from core import handmatrix, matrix2csv
+
+
+def get_events_by_frame(hand, fps, ticks_per_ms):
+    """
+    finds the events of a hand one frame of one key at a time, the way the converter first did
+    :return: a list of (tick, note, on) sorted by tick the way the lines of the csv were, keeping the order of the keys
+             and frames within a tick
+    """
+
+    def to_intervals(array):
+        in_intervals = []
+
+        for column_index in range(array.shape[1]):
+            col = array[:, column_index]
+            new = []
+            count = 1
+
+            for i in range(1, col.shape[0]):
+                if col[i] == col[i - 1]:
+                    count += 1
+                    if i == col.shape[0] - 1:  # if on the last element of column. have to record now.
+                        new.append([col[i], count])
+                else:
+                    new.append([col[i - 1], count])
+                    count = 1
+
+            in_intervals.append(new)
+
+        return in_intervals
+
+    def to_abs(array):
+        in_abs = []
+
+        for note in array:
+            new = []
+            time_count = 0
+            for occurrence in note:
+                new.append([occurrence[0], time_count])
+                time_count += occurrence[1]
+            in_abs.append(new)
+
+        return in_abs
+
+    events = []
+
+    for note_num, note in enumerate(to_abs(to_intervals(hand))):
+        for state, frame_num in note:
+            tick = int(frame_num / fps * 1000 * ticks_per_ms)
+
+            if state == 0:
+                events.append((tick, note_num + matrix2csv.LOWEST_NOTE, False))
+            elif state == 1:
+                events.append((tick, note_num + matrix2csv.LOWEST_NOTE, True))
+
+    return sorted(events, key=lambda event: event[0])
+
+
+def get_hands():
+    """
+    :return: the hand matrices to compare the events of, by name
+    """
+    rng = np.random.default_rng(0)
+
+    # the notes held for a while each, so that most keys change a few times
+    held = np.repeat(rng.random((40, 88)) < 0.1, rng.integers(1, 8, size=40), axis=0).astype(np.uint8)
+
+    first_frame = np.zeros((6, 88), dtype=np.uint8)
+    first_frame[:, [0, 40, 87]] = 1
+
+    last_frame = np.zeros((6, 88), dtype=np.uint8)
+    last_frame[-1, [3, 50]] = 1
+    last_frame[2:, 60] = 1
+    last_frame[2:-1, 70] = 1
+
+    # one key turning off on the same frame another turns on, and a key turning off and on again straight after
+    simultaneous = np.zeros((8, 88), dtype=np.uint8)
+    simultaneous[1:4, 10] = 1
+    simultaneous[4:7, 11] = 1
+    simultaneous[1:3, 20] = 1
+    simultaneous[4:6, 20] = 1
+
+    return {
+        'held': held,
+        'first frame': first_frame,
+        'last frame': last_frame,
+        'simultaneous': simultaneous,
+        'one frame': np.ones((1, 88), dtype=np.uint8),
+        'no frames': np.zeros((0, 88), dtype=np.uint8),
+    }
+
+
+@pytest.mark.parametrize('compact', [False, True])
+# 4000 fps puts consecutive frames on the same tick
+@pytest.mark.parametrize('fps', [24, 30, 4000])
+@pytest.mark.parametrize('name', list(get_hands()))
+def test_events_match_each_frame(name, fps, compact):
+    hand = get_hands()[name]
+    expected = get_events_by_frame(hand, fps, matrix2csv.TICKS_PER_MS)
+
+    if compact:
+        hand = handmatrix.HandMatrix.from_dense(hand)
+
+    assert matrix2csv.get_events(hand, fps, matrix2csv.TICKS_PER_MS).tolist() == expected
+
+
+def test_events_ignore_other_states():
+    hand = np.zeros((5, 88), dtype=np.uint8)
+    hand[1:3, 5] = 2
+    hand[2:4, 6] = 1
+
+    assert matrix2csv.get_events(hand, 30, matrix2csv.TICKS_PER_MS).tolist() == get_events_by_frame(
+        hand, 30, matrix2csv.TICKS_PER_MS
+    )
+
+
+def test_edge_cases_give_the_expected_events():
+    hands = get_hands()
+    ticks = matrix2csv.get_ticks(np.arange(8), 30, matrix2csv.TICKS_PER_MS).tolist()
+
+    def get_events(name):
+        return matrix2csv.get_events(hands[name], 30, matrix2csv.TICKS_PER_MS).tolist()
+
+    # the state of every key is recorded on the first frame, whether it is on or off
+    first_frame_events = [event for event in get_events('first frame') if event[0] == 0]
+    assert len(first_frame_events) == 88
+    assert [note - matrix2csv.LOWEST_NOTE for _, note, on in first_frame_events if on] == [0, 40, 87]
+
+    # a key that only turns on on the last frame never does, and a key that turns off on it stays on
+    last_frame_events = [(tick, note - matrix2csv.LOWEST_NOTE, on) for tick, note, on in get_events('last frame')[88:]]
+    assert last_frame_events == [(ticks[2], 60, True), (ticks[2], 70, True)]
+
+    # events on the same tick are ordered by key
+    assert get_events('simultaneous')[88:] == [
+        (ticks[1], 10 + matrix2csv.LOWEST_NOTE, True),
+        (ticks[1], 20 + matrix2csv.LOWEST_NOTE, True),
+        (ticks[3], 20 + matrix2csv.LOWEST_NOTE, False),
+        (ticks[4], 10 + matrix2csv.LOWEST_NOTE, False),
+        (ticks[4], 11 + matrix2csv.LOWEST_NOTE, True),
+        (ticks[4], 20 + matrix2csv.LOWEST_NOTE, True),
+        (ticks[6], 20 + matrix2csv.LOWEST_NOTE, False),
+    ]
@@ -0,0 +1,109 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic_video
+from core import handmatrix, matrix2csv, matrix2midi, youtube2frames
+
+
+@pytest.fixture(scope='module')
+def hands(video):
+    """
+    :return: the left hand and right hand matrices of the notes rendered in the synthetic video, as the converter makes
+             them
+    """
+    video_path, notes, _ = video
+    num_frames, _ = youtube2frames.get_video_info(video_path)
+
+    return [hand.astype(np.uint8) for hand in synthetic_video.get_hand_matrices(notes, num_frames)]
+
+
+def write_with_midicsv(lines):
+    """
+    :return: the midi file py_midicsv writes from the lines of a csv, the way the converter first wrote them
+    """
+    py_midicsv = pytest.importorskip('py_midicsv')
+
+    midi_file = io.BytesIO()
+    py_midicsv.FileWriter(midi_file).write(py_midicsv.csv_to_midi(lines))
+
+    return midi_file.getvalue()
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('fps', [24, 30])
+def test_midi_matches_midicsv(hands, fps, compact):
+    left_hand, right_hand = hands
+    csv_lines = matrix2csv.matrix_to_csv(left_hand, right_hand, fps)
+
+    if compact:
+        left_hand = handmatrix.HandMatrix.from_dense(left_hand)
+        right_hand = handmatrix.HandMatrix.from_dense(right_hand)
+
+    for midi, lines in zip(matrix2midi.matrix_to_midi(left_hand, right_hand, fps), csv_lines):
+        assert midi == write_with_midicsv(lines)
+
+
+@pytest.mark.parametrize('batch_sizes', [[1], [7], [1, 16], [1000]])
+def test_streamed_midi_matches_midi(hands, tmp_path, batch_sizes):
+    left_hand, right_hand = hands
+    midi_paths = [str(tmp_path / file_name) for file_name in ['full.mid', 'right.mid', 'left.mid']]
+
+    # the batches are the given sizes, then the last size again until the end
+    with matrix2midi.MidiStreamWriter(*midi_paths, 30) as writer:
+        start = 0
+        for batch_size in batch_sizes + [batch_sizes[-1]] * len(left_hand):
+            if start >= len(left_hand):
+                break
+
+            writer.append(left_hand[start:start + batch_size], right_hand[start:start + batch_size])
+            start += batch_size
+
+    for midi_path, midi in zip(midi_paths, matrix2midi.matrix_to_midi(left_hand, right_hand, 30)):
+        with open(midi_path, 'rb') as midi_file:
+            assert midi_file.read() == midi
+
+
+def write_track_midi(tmp_path, track_events):
+    """
+    :param track_events: the bytes of the events of each track, without their end of track events
+    :return: the path of a midi file of the tracks
+    """
+    midi_path = str(tmp_path / 'tracks.mid')
+    tracks = [
+        b'MTrk' + struct.pack('>I', len(events) + 4) + events + b'\x00\xff\x2f\x00' for events in track_events
+    ]
+
+    with open(midi_path, 'wb') as midi_file:
+        midi_file.write(matrix2midi.get_midi(tracks))
+
+    return midi_path
+
+
+def test_read_midi_notes_follows_running_status(tmp_path):
+    seconds_per_tick = matrix2midi.TEMPO / matrix2midi.PPQ / 1000000
+    midi_path = write_track_midi(tmp_path, [
+        matrix2midi.get_track_start('left hand'),
+        # a note on, then a note on with zero velocity and a second note on using the status of the first
+        b'\x00\x90\x3c\x7f' + b'\x0a\x3c\x00' + b'\x00\x3e\x7f' + b'\x05\x80\x3e\x00',
+    ])
+
+    notes = matrix2midi.read_midi_notes(midi_path)
+
+    assert [(note, track_num) for note, _, _, track_num in notes] == [(0x3c, 1), (0x3e, 1)]
+    assert np.allclose([(start, end) for _, start, end, _ in notes], np.array([(0, 10), (10, 15)]) * seconds_per_tick)
+
+
+@pytest.mark.parametrize('events', [
+    # a data byte as the very first event of the track
+    b'\x00\x3c\x7f',
+    # meta events cancel running status
+    b'\x00\x90\x3c\x7f' + b'\x00\xff\x01\x01a' + b'\x0a\x3c\x00',
+])
+def test_read_midi_notes_rejects_data_without_status(tmp_path, events):
+    midi_path = write_track_midi(tmp_path, [matrix2midi.get_track_start('right hand'), events])
+
+    with pytest.raises(ValueError, match=f'Track 1 of {midi_path}'):
+        matrix2midi.read_midi_notes(midi_path)
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from core import pipeline
+
+
+def test_outputs_keep_the_order_of_the_source():
+    def slow_when_even(item):
+        # so that the stages run at different speeds
+        if item % 2 == 0:
+            time.sleep(0.001)
+        return item
+
+    outputs = pipeline.run_pipeline(range(200), [slow_when_even, lambda item: item * 2, str], max_queue_size=3)
+
+    assert list(outputs) == [str(item * 2) for item in range(200)]
+
+
+def test_no_stages_gives_the_source():
+    assert list(pipeline.run_pipeline(iter(range(5)), [])) == list(range(5))
+
+
+@pytest.mark.parametrize('failing_stage', [0, 1])
+def test_stage_error_is_raised_to_the_consumer(failing_stage):
+    threads_before = threading.active_count()
+
+    def fail_on_five(item):
+        if item == 5:
+            raise ValueError('stage failed')
+        return item
+
+    stages = [lambda item: item, lambda item: item]
+    stages[failing_stage] = fail_on_five
+    outputs = []
+
+    with pytest.raises(ValueError, match='stage failed'):
+        for item in pipeline.run_pipeline(range(100), stages):
+            outputs.append(item)
+
+    # every item before the failing one still gets through
+    assert outputs == list(range(5))
+    assert threading.active_count() == threads_before
+
+
+def test_source_error_is_raised_to_the_consumer():
+    def source():
+        yield 0
+        yield 1
+        raise KeyError('source failed')
+
+    outputs = []
+
+    with pytest.raises(KeyError, match='source failed'):
+        for item in pipeline.run_pipeline(source(), [lambda item: item + 1]):
+            outputs.append(item)
+
+    assert outputs == [1, 2]
+
+
+def test_threads_stop_when_the_consumer_stops_early():
+    threads_before = threading.active_count()
+    closed = threading.Event()
+    produced = []
+
+    def source():
+        try:
+            for item in range(10000):
+                produced.append(item)
+                yield item
+        finally:
+            closed.set()
+
+    outputs = pipeline.run_pipeline(source(), [lambda item: item, lambda item: item], max_queue_size=2)
+    for item in outputs:
+        if item == 3:
+            break
+    outputs.close()
+
+    assert threading.active_count() == threads_before
+    assert closed.is_set()
+    # the stages only got ahead by the items their queues hold
+    assert len(produced) < 20
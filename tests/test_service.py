@@ -0,0 +1,79 @@
+import os
+import threading
+
+import pytest
+
+from converters import service
+
+
+@pytest.fixture
+def get_job(video, tmp_path):
+    video_path, _, converter_args = video
+
+    def get_job(name, **parameters):
+        """
+        :return: a job converting the synthetic video into a directory of its own
+        """
+        job_dir_path = str(tmp_path / name)
+
+        return {
+            'video_name': name,
+            'video_url': video_path,
+            **{key: value for key, value in converter_args.items() if key != 'num_keys'},
+            'video_dir_path': job_dir_path,
+            'array_dir_path': f'{job_dir_path}/arrays',
+            'midi_dir_path': f'{job_dir_path}/midi',
+            'color_table_dir': f'{job_dir_path}/color_tables',
+            'frame_mode': 'stream',
+            **parameters,
+        }
+
+    return get_job
+
+
+def test_jobs_are_done_failed_and_run_again(get_job, tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+
+    done_id = service.submit_job(spool_dir, get_job('done'))
+    failed_id = service.submit_job(spool_dir, get_job('failed', frame_mode='frames'))
+
+    # a job left running by a service that was stopped before it finished
+    service_instance = service.ConversionService(spool_dir, workers=2, poll_interval=0.05)
+    service.write_json(service.get_job_path(spool_dir, 'running', 'interrupted'), get_job('interrupted'))
+
+    service_instance.run(max_jobs=3)
+
+    done_status = service.wait_for_job(spool_dir, done_id, timeout=0)
+    assert done_status['state'] == 'done'
+    assert done_status['result']['stages']
+    assert os.path.exists(str(tmp_path / 'done' / 'midi' / 'done.mid'))
+
+    failed_status = service.wait_for_job(spool_dir, failed_id, timeout=0)
+    assert failed_status['state'] == 'failed'
+    assert 'ValueError' in failed_status['result']['error']
+
+    assert service.get_job_status(spool_dir, 'interrupted')['state'] == 'done'
+    assert os.listdir(f'{spool_dir}/running') == []
+
+    status = service.get_service_status(spool_dir)
+    assert (status['done'], status['failed'], status['queued'], status['running']) == (2, 1, 0, [])
+    assert status['frames_converted'] > 0
+    assert status['stopped']
+
+
+def test_service_stops_when_asked(get_job, tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    service_instance = service.ConversionService(spool_dir, workers=1, poll_interval=0.05)
+    thread = threading.Thread(target=service_instance.run)
+    thread.start()
+
+    try:
+        job_id = service.submit_job(spool_dir, get_job('song'))
+        assert service.wait_for_job(spool_dir, job_id, timeout=60, poll_interval=0.05)['state'] == 'done'
+    finally:
+        service.stop_service(spool_dir)
+        thread.join(timeout=60)
+
+    assert not thread.is_alive()
+    assert not os.path.exists(f'{spool_dir}/{service.STOP_FILE_NAME}')
+    assert service.get_service_status(spool_dir)['done'] == 1
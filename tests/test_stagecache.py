@@ -0,0 +1,121 @@
+import concurrent.futures
+import os
+
+import numpy as np
+import pytest
+
+from core import stagecache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return stagecache.StageCache(str(tmp_path / 'cache'))
+
+
+def test_key_depends_only_on_the_stage_and_inputs(cache, tmp_path):
+    inputs = {'video': 'abc', 'rows': [59, 62], 'converter': {'read_height': 60, 'first_note': 'A'}}
+    reordered = {'converter': {'first_note': 'A', 'read_height': 60}, 'rows': [59, 62], 'video': 'abc'}
+
+    assert cache.get_key('strip', inputs) == cache.get_key('strip', reordered)
+    # the same in another cache, so keys stay valid from one run to the next
+    assert stagecache.StageCache(str(tmp_path / 'other')).get_key('strip', inputs) == cache.get_key('strip', inputs)
+
+    assert cache.get_key('detect', inputs) != cache.get_key('strip', inputs)
+    assert cache.get_key('strip', {**inputs, 'rows': [59, 63]}) != cache.get_key('strip', inputs)
+    assert cache.get_key('strip', {**inputs, 'rows': [59.0, 62.0]}) != cache.get_key('strip', inputs)
+
+
+def test_hash_array_depends_on_the_shape_type_and_contents():
+    array = np.arange(12, dtype=np.uint8).reshape((3, 4))
+
+    assert stagecache.StageCache.hash_array(array) == stagecache.StageCache.hash_array(array.copy())
+    # a view that is not contiguous hashes the same as its copy
+    assert stagecache.StageCache.hash_array(array.T) == stagecache.StageCache.hash_array(array.T.copy())
+    assert stagecache.StageCache.hash_array(array) != stagecache.StageCache.hash_array(array.reshape((4, 3)))
+    assert stagecache.StageCache.hash_array(array) != stagecache.StageCache.hash_array(array.astype(np.int8))
+    assert stagecache.StageCache.hash_array(array) != stagecache.StageCache.hash_array(array + 1)
+
+
+def test_stage_is_only_built_once(cache):
+    builds = []
+
+    def build(output_dir):
+        builds.append(output_dir)
+        with open(f'{output_dir}/output.txt', 'w') as file:
+            file.write('output')
+
+    assert not cache.is_cached('stage', {'input': 1})
+    stage_dir = cache.run('stage', {'input': 1}, build)
+
+    assert cache.is_cached('stage', {'input': 1})
+    assert cache.run('stage', {'input': 1}, build) == stage_dir
+    assert len(builds) == 1
+    with open(f'{stage_dir}/output.txt') as file:
+        assert file.read() == 'output'
+
+    # other inputs miss the cache
+    assert cache.run('stage', {'input': 2}, build) != stage_dir
+    assert len(builds) == 2
+
+
+def test_failed_stage_is_not_published(cache):
+    def build(output_dir):
+        with open(f'{output_dir}/output.txt', 'w') as file:
+            file.write('half of the output')
+        raise RuntimeError('the stage failed')
+
+    with pytest.raises(RuntimeError):
+        cache.run('stage', {'input': 1}, build)
+
+    assert not cache.is_cached('stage', {'input': 1})
+    assert sorted(os.listdir(cache.cache_dir)) == ['file_hashes']
+
+
+def test_stage_finished_by_another_process_first_is_kept(cache):
+    def build(output_dir):
+        with open(f'{output_dir}/output.txt', 'w') as file:
+            file.write('second')
+
+        # another process publishes the same stage while this one is still building it
+        other_dir = cache.get_stage_dir('stage', {'input': 1})
+        os.makedirs(other_dir)
+        with open(f'{other_dir}/output.txt', 'w') as file:
+            file.write('first')
+
+    stage_dir = cache.run('stage', {'input': 1}, build)
+
+    with open(f'{stage_dir}/output.txt') as file:
+        assert file.read() == 'first'
+    assert sorted(os.listdir(cache.cache_dir)) == ['file_hashes', os.path.basename(stage_dir)]
+
+
+def test_hash_file_is_remembered_until_the_file_changes(cache, tmp_path):
+    path = str(tmp_path / 'video.mp4')
+    with open(path, 'wb') as file:
+        file.write(b'first')
+
+    first_hash = cache.hash_file(path)
+    assert cache.hash_file(path) == first_hash
+    assert len(os.listdir(cache.file_hashes_dir)) == 1
+
+    with open(path, 'wb') as file:
+        file.write(b'second video')
+
+    assert cache.hash_file(path) != first_hash
+    assert len(os.listdir(cache.file_hashes_dir)) == 2
+
+
+def test_hash_file_keeps_the_hashes_of_concurrent_processes(cache, tmp_path):
+    paths = []
+    for file_num in range(16):
+        paths.append(str(tmp_path / f'video_{file_num}.mp4'))
+        with open(paths[-1], 'wb') as file:
+            file.write(os.urandom(1 << 16))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
+        hashes = list(executor.map(cache.hash_file, paths))
+
+    assert len(set(hashes)) == len(paths)
+    assert len(os.listdir(cache.file_hashes_dir)) == len(paths)
+    # every hash is read back from the memo of its own file
+    assert [cache.hash_file(path) for path in paths] == hashes
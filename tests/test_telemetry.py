@@ -0,0 +1,40 @@
+import builtins
+import os
+import subprocess
+import sys
+
+from core import telemetry
+
+
+def test_package_imports_without_resource():
+    # the resource module only exists on Unix
+    code = (
+        "import sys; sys.modules['resource'] = None; "
+        "from core import telemetry, frames2matrix, youtube2frames, matrix2csv, calibrate; "
+        "from converters import full_converter, partial_converter; "
+        "from benchmarks import benchmark"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
+
+
+def test_stage_is_measured_without_resource_or_proc(monkeypatch):
+    def open_without_proc(path, *args, **kwargs):
+        if str(path).startswith('/proc'):
+            raise FileNotFoundError(path)
+        return builtins.open(path, *args, **kwargs)
+
+    monkeypatch.setattr(telemetry, 'resource', None)
+    monkeypatch.setattr(telemetry, 'open', open_without_proc, raising=False)
+
+    with telemetry.TelemetryReport() as report:
+        with telemetry.stage('test', frames=10):
+            sum(range(100000))
+
+    record, = report.stages
+    assert record['cpu_seconds'] >= 0
+    assert record['frames_per_second'] > 0
+    assert record['bytes_read'] is None and record['bytes_written'] is None
+    assert record['peak_rss_bytes'] is None
+    assert record['process_peak_children_rss_bytes'] is None
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from core import youtube2frames
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('frame_count', [-1, 0, 20, 47, 48, 100])
+def test_strip_has_every_frame_whatever_the_frame_count(video, tmp_path, monkeypatch, workers, frame_count):
+    video_path, _, converter_args = video
+    read_height = converter_args['read_height']
+    strip_path = str(tmp_path / 'strip.npy')
+    expected = np.stack([
+        image[read_height - 1:read_height + 2] for image in youtube2frames.stream_frames(video_path)
+    ])
+
+    # the frame count in the container is only an estimate, and some containers do not know it at all
+    _, fps = youtube2frames.get_video_info(video_path)
+    monkeypatch.setattr(youtube2frames, 'get_video_info', lambda _: (frame_count, fps))
+
+    n_frames, _ = youtube2frames.save_strip(video_path, strip_path, read_height - 1, read_height + 2, workers=workers)
+    strip, strip_info = youtube2frames.load_strip(strip_path)
+
+    assert n_frames == strip_info['num_frames'] == len(expected)
+    np.testing.assert_array_equal(strip, expected)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['strip.json', 'strip.npy']
+
+
+def get_stream(itag, height, fps, progressive=False, video_codec='avc1.4d401e', bitrate=None):
+    """
+    :return: the metadata of a stream, as get_youtube_streams returns it
+    """
+    return {'itag': itag, 'height': height, 'fps': fps, 'video_codec': video_codec, 'progressive': progressive,
+            'bitrate': bitrate}
+
+
+STREAMS = [
+    get_stream(22, 720, 30, progressive=True, bitrate=2000000),
+    get_stream(136, 720, 30, bitrate=1500000),
+    get_stream(18, 360, 30, progressive=True, bitrate=600000),
+    get_stream(134, 360, 30, bitrate=500000),
+    get_stream(500, 360, 15, bitrate=300000),
+    get_stream(133, 240, 30, bitrate=250000),
+    get_stream(160, 144, 30, bitrate=100000),
+    get_stream(243, 360, 30, video_codec='vp9', bitrate=400000),
+]
+
+
+@pytest.mark.parametrize('constraints, itag', [
+    # 240p has fewer than 10 pixels between white keys, and 15 fps is below the default floor
+    ({}, 134),
+    ({'min_fps': 10}, 500),
+    ({'min_pixels_per_key': 20}, 136),
+    # the key spacing of a channel that fits the keyboard into half the width of the frame
+    ({'key_spacing_fraction': youtube2frames.DEFAULT_KEY_SPACING_FRACTION / 2}, 136),
+    ({'min_pixels_per_key': 5}, 133),
+])
+def test_select_stream_takes_the_cheapest_stream_that_meets_the_floors(constraints, itag):
+    assert youtube2frames.select_stream(STREAMS, **constraints)['itag'] == itag
+
+
+@pytest.mark.parametrize('constraints', [{'min_pixels_per_key': 100}, {'min_fps': 60}])
+def test_select_stream_falls_back_to_the_best_stream(capsys, constraints):
+    stream = youtube2frames.select_stream(STREAMS, **constraints)
+
+    assert (stream['height'], stream['fps']) == (720, 30)
+    assert 'No stream has' in capsys.readouterr().out
+
+
+def test_select_stream_prefers_video_only_streams():
+    assert youtube2frames.select_stream(STREAMS)['itag'] == 134
+    assert youtube2frames.select_stream(list(reversed(STREAMS)))['itag'] == 134
+
+    # a progressive stream is taken when it is the only one at that resolution
+    without_video_only = [stream for stream in STREAMS if stream['itag'] != 134]
+    assert youtube2frames.select_stream(without_video_only)['itag'] == 18
+
+
+def test_select_stream_only_takes_other_codecs_when_there_is_no_h264():
+    vp9_streams = [get_stream(243, 360, 30, video_codec='vp9'), get_stream(248, 1080, 30, video_codec='vp9')]
+
+    assert youtube2frames.select_stream(STREAMS + vp9_streams)['itag'] == 134
+    assert youtube2frames.select_stream(vp9_streams)['itag'] == 243
+
+    with pytest.raises(ValueError):
+        youtube2frames.select_stream([])
+
+
+def test_get_auto_tag_selects_from_the_stream_source():
+    urls = []
+
+    def stream_source(video_url):
+        urls.append(video_url)
+        return STREAMS
+
+    assert youtube2frames.get_auto_tag('https://youtu.be/song', stream_source=stream_source) == 134
+    assert youtube2frames.get_auto_tag('https://youtu.be/song', stream_source=stream_source, min_fps=10) == 500
+    assert urls == ['https://youtu.be/song'] * 2